@@ -0,0 +1,224 @@
+"""Replays scripted conversations against the chat agent and reports latency and throughput.
+
+Usage:
+    python benchmarks/mock_server.py &
+    python benchmarks/load_test.py --target agent --concurrency 16 --conversations 64
+    python benchmarks/load_test.py --target gradio --url http://127.0.0.1:7860
+
+The agent target builds a ChatAgent in-process (configured through the same environment
+variables as the app) and points it at the mock server. The gradio target drives a running
+app through its public /chat endpoint; start that app with OPENAI_BASE_URL and
+GEMINI_BASE_URL pointing at the mock server.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = ROOT_DIR / "src"
+
+DEFAULT_SCRIPTS = [
+    ["Hi! What do you do?", "What's your experience with Python?", "Are you open to new opportunities?"],
+    ["Tell me about your most recent role.", "Which technologies did you use there?", "Thanks, that's helpful!"],
+    ["Are you open to work?", "We're hiring a backend engineer, interested?", "My email is visitor@example.com"],
+    ["What's your educational background?", "Any certifications?"],
+    ["What are your strongest skills?", "Can you give an example project?", "How do you approach code reviews?", "Thanks, bye!"]
+]
+
+@dataclass
+class TurnResult:
+    latency: float
+    time_to_first_token: float | None = None
+    error: str | None = None
+    started: float = 0.0
+
+@dataclass
+class RunResults:
+    turns: list[TurnResult] = field(default_factory = list)
+    wall_time: float = 0.0
+    upstream_calls: dict = field(default_factory = dict)
+    routing: dict | None = None
+    transport: dict | None = None
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def load_scripts(path: str | None) -> list[list[str]]:
+    if path is None:
+        return DEFAULT_SCRIPTS
+    with open(path, "r", encoding = "utf-8") as file:
+        return [json.loads(line)["turns"] for line in file if line.strip()]
+
+def configure_agent_environment(mock_url: str, cache: bool):
+    os.environ["OPENAI_BASE_URL"] = f"{mock_url}/openai/v1"
+    os.environ["GEMINI_BASE_URL"] = f"{mock_url}/gemini/"
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    os.environ.setdefault("GEMINI_API_KEY", "mock")
+    os.environ.setdefault("LOG_CONSOLE", "false")
+    os.environ.setdefault("LOG_FILE", "none")
+    os.environ.setdefault("LEAD_STORE_PATH", os.path.join(tempfile.mkdtemp(prefix = "load-test-"), "leads.db"))
+    os.environ["RESPONSE_CACHE_ENABLED"] = "true" if cache else "false"
+    # The mock has no quota, so the scheduler's rate budgets would only measure themselves
+    for provider in ("OPENAI", "GEMINI"):
+        os.environ.setdefault(f"{provider}_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault(f"{provider}_TOKENS_PER_MINUTE", "0")
+
+async def run_agent(scripts: list[list[str]], conversations: int, concurrency: int, stream: bool, warm_up: bool) -> tuple[list[TurnResult], dict, dict]:
+    sys.path.insert(0, str(SRC_DIR))
+    from agent_factory import create_agent, create_agent_resources, create_lead_store, create_scheduler, warm_up_clients
+    from utils.logger import setup_logging
+    from utils.reader import read_file_text
+
+    setup_logging()
+    resources = create_agent_resources(create_lead_store(), create_scheduler())
+    agent = create_agent(
+        read_file_text(str(ROOT_DIR / "data" / "name.txt")),
+        read_file_text(str(ROOT_DIR / "data" / "profile.md")),
+        resources = resources
+    )
+    if warm_up:
+        await warm_up_clients(resources)
+    semaphore = asyncio.Semaphore(concurrency)
+    results: list[TurnResult] = []
+
+    async def run_turn(message: str, history: list[dict]) -> tuple[TurnResult, str]:
+        start = time.perf_counter()
+        if not stream:
+            reply = await agent.achat(message, history)
+            return TurnResult(time.perf_counter() - start, started = start), reply
+        first_token = None
+        reply = ""
+        async for reply in agent.astream_chat(message, history):
+            if first_token is None:
+                first_token = time.perf_counter() - start
+        return TurnResult(time.perf_counter() - start, first_token, started = start), reply
+
+    async def run_conversation(script: list[str]):
+        async with semaphore:
+            history = []
+            for message in script:
+                try:
+                    result, reply = await run_turn(message, history)
+                except Exception as e:
+                    results.append(TurnResult(0.0, error = str(e)))
+                    return
+                results.append(result)
+                history.extend([{"role": "user", "content": message}, {"role": "assistant", "content": reply}])
+
+    await asyncio.gather(*(run_conversation(scripts[index % len(scripts)]) for index in range(conversations)))
+    return results, agent.routing_stats(), resources.clients.stats()
+
+def run_gradio(url: str, scripts: list[list[str]], conversations: int, concurrency: int, stream: bool) -> list[TurnResult]:
+    from gradio_client import Client
+
+    def run_conversation(script: list[str]) -> list[TurnResult]:
+        # The public /chat endpoint is stateless, so every turn is sent as a fresh message
+        client = Client(url, verbose = False)
+        results = []
+        for message in script:
+            start = time.perf_counter()
+            try:
+                if stream:
+                    first_token = None
+                    for _ in client.submit(message, api_name = "/chat"):
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                    results.append(TurnResult(time.perf_counter() - start, first_token, started = start))
+                else:
+                    client.predict(message, api_name = "/chat")
+                    results.append(TurnResult(time.perf_counter() - start, started = start))
+            except Exception as e:
+                results.append(TurnResult(0.0, error = str(e)))
+                break
+        return results
+
+    with ThreadPoolExecutor(max_workers = concurrency) as executor:
+        batches = executor.map(run_conversation, [scripts[index % len(scripts)] for index in range(conversations)])
+        return [result for batch in batches for result in batch]
+
+def report(results: RunResults, as_json: bool):
+    completed = [turn for turn in results.turns if turn.error is None]
+    latencies = [turn.latency for turn in completed]
+    first_tokens = [turn.time_to_first_token for turn in completed if turn.time_to_first_token is not None]
+    summary = {
+        'turns': len(completed),
+        'errors': len(results.turns) - len(completed),
+        'wall_time_s': results.wall_time,
+        'turns_per_second': len(completed) / results.wall_time if results.wall_time else 0.0,
+        'latency_p50_s': percentile(latencies, 50),
+        'latency_p95_s': percentile(latencies, 95),
+        'latency_p99_s': percentile(latencies, 99),
+        'ttft_p50_s': percentile(first_tokens, 50) if first_tokens else None,
+        'ttft_p95_s': percentile(first_tokens, 95) if first_tokens else None,
+        'upstream_calls_per_turn': {
+            name: count / len(completed) for name, count in sorted(results.upstream_calls.items())
+        } if completed else {},
+        'first_turn_latency_s': min(completed, key = lambda turn: turn.started).latency if completed else None,
+        'routing': results.routing,
+        'transport': results.transport
+    }
+    if as_json:
+        print(json.dumps(summary, indent = 2))
+        return
+
+    print(f"turns: {summary['turns']}  errors: {summary['errors']}  wall time: {summary['wall_time_s']:.2f}s  throughput: {summary['turns_per_second']:.2f} turns/s")
+    print(f"latency  p50 {summary['latency_p50_s']:.3f}s  p95 {summary['latency_p95_s']:.3f}s  p99 {summary['latency_p99_s']:.3f}s")
+    if summary['first_turn_latency_s'] is not None:
+        print(f"first turn latency {summary['first_turn_latency_s']:.3f}s")
+    if first_tokens:
+        print(f"first token  p50 {summary['ttft_p50_s']:.3f}s  p95 {summary['ttft_p95_s']:.3f}s")
+    for name, count in summary['upstream_calls_per_turn'].items():
+        print(f"upstream {name}: {count:.2f} calls/turn")
+    for name, stats in (summary['routing'] or {}).items():
+        print(f"{name} routing: {stats['requests']} requests  {stats['hedges']} hedged ({stats['hedge_rate']:.1%})  hedge win rate {stats['hedge_win_rate']:.0%}  {stats['failovers']} failovers")
+    for provider, stats in (summary['transport'] or {}).items():
+        print(f"{provider} connections: {stats['opened']} opened  {stats['reused']} reused ({stats['reuse_rate']:.1%})  average connect {stats['average_connect_seconds'] * 1000:.1f}ms")
+    errors = [turn.error for turn in results.turns if turn.error is not None]
+    if errors:
+        print(f"first error: {errors[0]}")
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--target", choices = ("agent", "gradio"), default = "agent")
+    parser.add_argument("--mock-url", default = "http://127.0.0.1:8900", help = "mock server used for upstream call counts")
+    parser.add_argument("--url", default = "http://127.0.0.1:7860", help = "running Gradio app for the gradio target")
+    parser.add_argument("--script", help = "JSONL file with one {\"turns\": [...]} conversation per line")
+    parser.add_argument("--conversations", type = int, default = 32)
+    parser.add_argument("--concurrency", type = int, default = 8)
+    parser.add_argument("--stream", action = "store_true", help = "use the streaming entry point and report time to first token")
+    parser.add_argument("--cache", action = "store_true", help = "keep the response cache enabled (agent target)")
+    parser.add_argument("--warm-up", action = "store_true", help = "open provider connections before the first turn (agent target)")
+    parser.add_argument("--json", action = "store_true", help = "print the summary as JSON")
+    args = parser.parse_args()
+
+    scripts = load_scripts(args.script)
+    httpx.post(f"{args.mock_url}/stats/reset").raise_for_status()
+
+    results = RunResults()
+    start = time.perf_counter()
+    if args.target == "agent":
+        configure_agent_environment(args.mock_url, args.cache)
+        results.turns, results.routing, results.transport = asyncio.run(run_agent(scripts, args.conversations, args.concurrency, args.stream, args.warm_up))
+    else:
+        results.turns = run_gradio(args.url, scripts, args.conversations, args.concurrency, args.stream)
+    results.wall_time = time.perf_counter() - start
+
+    stats = httpx.get(f"{args.mock_url}/stats").json()
+    results.upstream_calls = {name: count for name, count in stats.items() if "." in name}
+    report(results, args.json)
+
+if __name__ == "__main__":
+    main()
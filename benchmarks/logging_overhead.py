@@ -0,0 +1,110 @@
+"""Per-record logging overhead on the calling thread, before and after the queued pipeline.
+
+Usage: python benchmarks/logging_overhead.py [--records 20000]
+
+Each variant runs in its own interpreter because logging configuration is global.
+"""
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+VARIANTS = ("legacy", "queued")
+
+def setup_legacy_logging(log_file: str):
+    # The JsonLogger pipeline that utils/logger.py used to install, kept here as the baseline
+    json_formatter = logging.Formatter('%(message)s')
+    console_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(console_formatter)
+    file_handler = RotatingFileHandler(log_file, maxBytes = 10*1024*1024, backupCount = 5)
+    file_handler.setFormatter(json_formatter)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(console_handler)
+    root_logger.addHandler(file_handler)
+
+    class JsonLogger(logging.Logger):
+        def _log(self, level, msg, _, exc_info = None, extra = None, stack_info = False, stacklevel = 1):
+            if extra is None:
+                extra = {}
+            log_entry = {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'level': level,
+                'logger': self.name,
+                'message': msg,
+                **extra
+            }
+            super()._log(level, json.dumps(log_entry), (), exc_info, extra, stack_info, stacklevel)
+
+    logging.setLoggerClass(JsonLogger)
+
+def run_variant(variant: str, records: int) -> dict:
+    sys.stdout = open(os.devnull, "w")
+    log_dir = tempfile.mkdtemp(prefix = "logging-benchmark-")
+    log_file = os.path.join(log_dir, "app.log")
+
+    if variant == "legacy":
+        setup_legacy_logging(log_file)
+    else:
+        sys.path.insert(0, str(SRC_DIR))
+        os.environ["LOG_FILE"] = log_file
+        import utils.logger
+        utils.logger.setup_logging()
+
+    logger = logging.getLogger("benchmark")
+
+    start = time.perf_counter()
+    for index in range(records):
+        logger.info("Processing chat message", extra = {'message_length': index, 'agent_name': 'benchmark'})
+    info_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for index in range(records):
+        logger.debug("Messages created", extra = {'message_count': index})
+    debug_elapsed = time.perf_counter() - start
+
+    # Includes draining the queue, so it measures total work rather than caller latency
+    start = time.perf_counter()
+    if variant == "queued":
+        utils.logger._listener.stop()
+    drain_elapsed = time.perf_counter() - start
+
+    return {
+        'variant': variant,
+        'info_us_per_record': info_elapsed / records * 1e6,
+        'debug_us_per_record': debug_elapsed / records * 1e6,
+        'drain_ms': drain_elapsed * 1e3
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--records", type = int, default = 20000)
+    parser.add_argument("--variant", choices = VARIANTS, help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        result = run_variant(args.variant, args.records)
+        sys.__stdout__.write(json.dumps(result) + "\n")
+        return
+
+    print(f"{'variant':<10}{'INFO us/record':>18}{'DEBUG (off) us/record':>24}{'queue drain ms':>18}")
+    for variant in VARIANTS:
+        output = subprocess.run(
+            [sys.executable, __file__, "--variant", variant, "--records", str(args.records)],
+            capture_output = True, text = True, check = True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{variant:<10}{result['info_us_per_record']:>18.2f}{result['debug_us_per_record']:>24.3f}{result['drain_ms']:>18.1f}")
+
+if __name__ == "__main__":
+    main()
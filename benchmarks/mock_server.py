@@ -0,0 +1,223 @@
+"""OpenAI-compatible mock of the chat and evaluator endpoints for load testing.
+
+Usage: python benchmarks/mock_server.py [--port 8900] [--openai-latency-ms 700] ...
+
+Point the app at it with:
+    OPENAI_BASE_URL=http://127.0.0.1:8900/openai/v1
+    GEMINI_BASE_URL=http://127.0.0.1:8900/gemini/
+"""
+from collections import Counter
+from dataclasses import dataclass
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+
+_WORDS = (
+    "I have spent several years building reliable backend services and I enjoy working closely with product teams "
+    "to turn ideas into well tested software that scales I would be happy to share more details if you would like "
+    "to continue this conversation over email"
+).split()
+
+@dataclass
+class MockConfig:
+    openai_latency_ms: float = 700
+    gemini_latency_ms: float = 400
+    latency_sigma: float = 0.4
+    token_interval_ms: float = 10
+    tool_call_rate: float = 0.05
+    rejection_rate: float = 0.2
+    reply_words: int = 40
+    rate_limit_rate: float = 0.0
+    retry_after_seconds: float = 1.0
+    server_error_rate: float = 0.0
+    failing_provider: str | None = None
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title = "Mock LLM server")
+    calls: Counter = Counter()
+
+    def sample_latency(provider: str) -> float:
+        median = config.gemini_latency_ms if provider == "gemini" else config.openai_latency_ms
+        return median * math.exp(random.gauss(0, config.latency_sigma)) / 1000
+
+    def estimate_tokens(messages: list[dict]) -> int:
+        return sum(len(str(message.get("content") or "")) // 4 + 4 for message in messages)
+
+    def reply_text() -> str:
+        start = random.randrange(len(_WORDS))
+        return " ".join(_WORDS[(start + offset) % len(_WORDS)] for offset in range(config.reply_words)) + "."
+
+    def wants_tool_call(body: dict) -> bool:
+        if not body.get("tools"):
+            return False
+        # Never call a tool twice in a row, so the agent always gets to reply
+        if body["messages"] and body["messages"][-1].get("role") == "tool":
+            return False
+        return random.random() < config.tool_call_rate
+
+    def structured_content(schema: dict) -> str:
+        return json.dumps(fake_value(schema, schema.get("$defs", {})))
+
+    def fake_value(schema: dict, definitions: dict) -> any:
+        if "$ref" in schema:
+            return fake_value(definitions[schema["$ref"].split("/")[-1]], definitions)
+        schema_type = schema.get("type")
+        if schema_type == "object":
+            return {name: fake_value(definition, definitions) for name, definition in schema.get("properties", {}).items()}
+        if schema_type == "array":
+            return [fake_value(schema.get("items", {}), definitions) for _ in range(schema.get("minItems", 1))]
+        if schema_type == "boolean":
+            return random.random() >= config.rejection_rate
+        if schema_type == "integer":
+            return random.randint(1, 10)
+        if schema_type == "number":
+            return random.random()
+        return "Mock feedback: the response is professional and consistent with the profile."
+
+    def tool_call() -> dict:
+        return {
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": "record_user_details", "arguments": json.dumps({"email": "visitor@example.com", "name": "Visitor"})}
+        }
+
+    def completion(body: dict) -> dict:
+        choices = []
+        if wants_tool_call(body):
+            choices.append({"index": 0, "message": {"role": "assistant", "content": None, "tool_calls": [tool_call()]}, "finish_reason": "tool_calls"})
+        else:
+            response_format = body.get("response_format") or {}
+            for index in range(body.get("n") or 1):
+                if response_format.get("type") == "json_schema":
+                    content = structured_content(response_format["json_schema"]["schema"])
+                else:
+                    content = reply_text()
+                choices.append({"index": index, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"})
+        completion_tokens = sum(len(str(choice["message"].get("content") or "")) // 4 for choice in choices)
+        prompt_tokens = estimate_tokens(body["messages"])
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": choices,
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+    async def stream(body: dict, provider: str):
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def chunk(delta: dict, finish_reason: str | None = None, index: int = 0) -> str:
+            payload = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": index, "delta": delta, "finish_reason": finish_reason}]
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        await asyncio.sleep(sample_latency(provider))
+        completion_tokens = 0
+        if wants_tool_call(body):
+            call = tool_call()
+            yield chunk({"role": "assistant", "tool_calls": [{"index": 0, **call}]})
+            yield chunk({}, "tool_calls")
+        else:
+            # Choices of an n > 1 request are interleaved token by token, as the real API does
+            replies = [reply_text().split(" ") for _ in range(body.get("n") or 1)]
+            for position in range(max(len(words) for words in replies)):
+                if position:
+                    await asyncio.sleep(config.token_interval_ms / 1000)
+                for index, words in enumerate(replies):
+                    if position < len(words):
+                        completion_tokens += 1
+                        yield chunk({"role": "assistant", "content": words[position] if position == 0 else f" {words[position]}"}, index = index)
+            for index in range(len(replies)):
+                yield chunk({}, "stop", index)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            prompt_tokens = estimate_tokens(body["messages"])
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+            yield f"data: {json.dumps({'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': body.get('model'), 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    async def chat_completions(provider: str, request: Request):
+        body = await request.json()
+        kind = "parse" if body.get("response_format") else "stream" if body.get("stream") else "completion"
+        calls[f"{provider}.{kind}"] += 1
+        calls[provider] += 1
+        if provider == config.failing_provider or random.random() < config.server_error_rate:
+            calls[f"{provider}.server_error"] += 1
+            return JSONResponse({"error": {"message": "The server had an error", "type": "server_error"}}, status_code = 500)
+        if random.random() < config.rate_limit_rate:
+            calls[f"{provider}.rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code = 429,
+                headers = {"retry-after": str(config.retry_after_seconds)}
+            )
+        if body.get("stream"):
+            return StreamingResponse(stream(body, provider), media_type = "text/event-stream")
+        await asyncio.sleep(sample_latency(provider))
+        return JSONResponse(completion(body))
+
+    app.add_api_route("/{provider}/v1/chat/completions", chat_completions, methods = ["POST"])
+    app.add_api_route("/{provider}/chat/completions", chat_completions, methods = ["POST"])
+
+    @app.get("/stats")
+    async def stats():
+        return dict(calls)
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        calls.clear()
+        return {}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8900)
+    parser.add_argument("--openai-latency-ms", type = float, default = 700, help = "median latency of chat completions")
+    parser.add_argument("--gemini-latency-ms", type = float, default = 400, help = "median latency of evaluator calls")
+    parser.add_argument("--latency-sigma", type = float, default = 0.4, help = "log-normal spread of latencies")
+    parser.add_argument("--token-interval-ms", type = float, default = 10, help = "delay between streamed tokens")
+    parser.add_argument("--tool-call-rate", type = float, default = 0.05)
+    parser.add_argument("--rejection-rate", type = float, default = 0.2)
+    parser.add_argument("--reply-words", type = int, default = 40)
+    parser.add_argument("--rate-limit-rate", type = float, default = 0.0, help = "fraction of requests answered with 429")
+    parser.add_argument("--retry-after-seconds", type = float, default = 1.0, help = "Retry-After sent with 429 responses")
+    parser.add_argument("--server-error-rate", type = float, default = 0.0, help = "fraction of requests answered with 500")
+    parser.add_argument("--failing-provider", choices = ("openai", "gemini"), help = "answer every request to this provider with 500")
+    parser.add_argument("--seed", type = int)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    config = MockConfig(
+        openai_latency_ms = args.openai_latency_ms,
+        gemini_latency_ms = args.gemini_latency_ms,
+        latency_sigma = args.latency_sigma,
+        token_interval_ms = args.token_interval_ms,
+        tool_call_rate = args.tool_call_rate,
+        rejection_rate = args.rejection_rate,
+        reply_words = args.reply_words,
+        rate_limit_rate = args.rate_limit_rate,
+        retry_after_seconds = args.retry_after_seconds,
+        server_error_rate = args.server_error_rate,
+        failing_provider = args.failing_provider
+    )
+
+    import uvicorn
+    uvicorn.run(create_app(config), host = args.host, port = args.port, log_level = "warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Per-turn history preparation cost by conversation length, with and without the session store.
+
+Usage: python benchmarks/session_overhead.py [--lengths 10,100,1000] [--turns 200]
+
+Measures the work done on our side before the model call: syncing the client history
+and trimming it to the window. Summaries are disabled so no model is called.
+"""
+from pathlib import Path
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+def make_history(length: int) -> list[dict]:
+    return [
+        {"role": "user" if index % 2 == 0 else "assistant", "content": f"message {index} " + "lorem ipsum dolor sit amet " * 8, "metadata": None}
+        for index in range(length)
+    ]
+
+async def measure(length: int, turns: int, use_session: bool) -> float:
+    from agents.history_manager import HistoryManager
+    from storage.session_store import SessionStore
+
+    history_manager = HistoryManager(summarize = False)
+    session_store = SessionStore()
+    history = make_history(length)
+    session = session_store.sync("benchmark", history) if use_session else None
+
+    start = time.perf_counter()
+    for turn in range(turns):
+        if use_session:
+            session = session_store.sync("benchmark", history)
+            await history_manager.prepare(session.messages, None, session)
+        else:
+            await history_manager.prepare(history, None)
+        # Each turn extends the conversation the way the chat UI does
+        message = {"role": "user", "content": f"question {turn}"}
+        reply = {"role": "assistant", "content": f"answer {turn}"}
+        if use_session:
+            session_store.record_turn(session, message["content"], reply["content"])
+        history = history + [message, reply]
+    return (time.perf_counter() - start) / turns
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--lengths", default = "10,100,1000,5000")
+    parser.add_argument("--turns", type = int, default = 200)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(SRC_DIR))
+    logging.disable(logging.INFO)
+
+    print(f"{'messages':>10}{'stateless us/turn':>20}{'session us/turn':>18}")
+    for length in (int(value) for value in args.lengths.split(",")):
+        stateless = asyncio.run(measure(length, args.turns, False))
+        with_session = asyncio.run(measure(length, args.turns, True))
+        print(f"{length:>10}{stateless * 1e6:>20.1f}{with_session * 1e6:>18.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Cold-start time and memory of the Gradio app against the headless API.
+
+Usage:
+    python benchmarks/mock_server.py &
+    python benchmarks/startup_overhead.py [--runs 3] [--workers 1,2]
+
+Starts each mode from src/ with the model providers pointed at the mock server, times how
+long until it answers its first request, sends a few chat turns and reads the resident
+memory of the server and its worker processes from /proc (Linux only).
+"""
+from pathlib import Path
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+def tree_rss_mb(pid: int) -> float:
+    # The server and every process it spawned, such as uvicorn workers
+    pids = [pid]
+    index = 0
+    while index < len(pids):
+        try:
+            with open(f"/proc/{pids[index]}/task/{pids[index]}/children") as file:
+                pids.extend(int(child) for child in file.read().split())
+        except OSError:
+            pass
+        index += 1
+    total = 0
+    for process in pids:
+        try:
+            with open(f"/proc/{process}/status") as file:
+                total += next(int(line.split()[1]) for line in file if line.startswith("VmRSS:"))
+        except (OSError, StopIteration):
+            pass
+    return total / 1024
+
+def measure(mode: str, workers: int, mock_url: str, turns: int) -> dict:
+    port = 7890 if mode == "gradio" else 8090
+    environment = {
+        **os.environ,
+        'OPENAI_BASE_URL': f"{mock_url}/openai/v1",
+        'GEMINI_BASE_URL': f"{mock_url}/gemini/",
+        'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY', "mock"),
+        'GEMINI_API_KEY': os.getenv('GEMINI_API_KEY', "mock"),
+        'LOG_CONSOLE': "false",
+        'LOG_FILE': "none",
+        'LEAD_STORE_PATH': os.path.join(tempfile.mkdtemp(prefix = "startup-"), "leads.db"),
+        'PROFILE_ARTIFACT_DIR': "none",
+        'GRADIO_SERVER_PORT': str(port),
+        'GRADIO_ANALYTICS_ENABLED': "false",
+        'API_PORT': str(port),
+        'API_WORKERS': str(workers)
+    }
+    script = "main.py" if mode == "gradio" else "api.py"
+    ready_url = f"http://127.0.0.1:{port}/" if mode == "gradio" else f"http://127.0.0.1:{port}/health"
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, script], cwd = SRC_DIR, env = environment, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{script} exited with code {process.returncode}")
+            try:
+                if httpx.get(ready_url, timeout = 1, follow_redirects = True).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.05)
+        ready = time.perf_counter() - start
+        idle_rss = tree_rss_mb(process.pid)
+
+        if mode == "api":
+            for turn in range(turns):
+                httpx.post(f"http://127.0.0.1:{port}/api/chat", json = {'message': f"Question {turn}"}, timeout = 30).raise_for_status()
+        else:
+            from gradio_client import Client
+            client = Client(f"http://127.0.0.1:{port}/", verbose = False)
+            for turn in range(turns):
+                client.predict(message = f"Question {turn}", api_name = "/chat")
+        return {'ready_s': ready, 'idle_rss_mb': idle_rss, 'rss_mb': tree_rss_mb(process.pid)}
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument("--mock-url", default = "http://127.0.0.1:8900")
+    parser.add_argument("--runs", type = int, default = 3)
+    parser.add_argument("--turns", type = int, default = 5, help = "chat turns sent before memory is read again")
+    parser.add_argument("--workers", default = "1,2", help = "API worker counts to measure")
+    args = parser.parse_args()
+
+    modes = [("gradio", 1)] + [("api", int(workers)) for workers in args.workers.split(",")]
+    print(f"{'mode':>12}{'ready s':>10}{'idle RSS MB':>14}{'RSS MB':>10}")
+    for mode, workers in modes:
+        runs = [measure(mode, workers, args.mock_url, args.turns) for _ in range(args.runs)]
+        label = mode if mode == "gradio" else f"api x{workers}"
+        # The fastest start is the least disturbed by the rest of the machine
+        print(f"{label:>12}{min(run['ready_s'] for run in runs):>10.2f}{max(run['idle_rss_mb'] for run in runs):>14.1f}{max(run['rss_mb'] for run in runs):>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+from dataclasses import dataclass
+from agents.agent_pool import AgentPool
+from agents.chat_agent import ChatAgent
+from agents.evaluation_policy import EvaluationPolicy
+from agents.history_manager import HistoryManager
+from agents.retraction_policy import RetractionPolicy
+from agents.usage_budget import UsageBudget
+from llm.clients import ClientFactory, TransportOptions
+from llm.router import ModelRouter, Route
+from llm.scheduler import ProviderLimits, RequestScheduler
+from profiles.profile_catalog import ProfileCatalog
+from profiles.profile_index import ProfileChunk, ProfileIndex
+from profiles.profile_ingestion import ProfileIngestor
+from profiles.profile_watcher import ProfileWatcher
+from profiles.prompt_cache import PromptCache
+from storage.lead_store import LeadStore
+from storage.session_store import SessionStore
+from tools.record_user_details_tool import RecordUserDetailsTool
+from tools.tool_registry import ToolRegistry
+from utils.env import get_env_bool, get_env_float, get_env_int, get_env_str
+from utils.response_cache import ResponseCache
+from utils.tracing import add_usage_listener
+from utils.usage import ModelPrices, UsageTracker
+
+import atexit
+
+# Builds the chat agent and its collaborators from environment variables, so every
+# entry point (the Gradio app, benchmarks, batch runs) configures agents the same way
+
+@dataclass
+class AgentResources:
+    """Collaborators that do not depend on the profile, shared by every agent in the process"""
+    retraction_policy: RetractionPolicy
+    cache: ResponseCache | None
+    history_manager: HistoryManager | None
+    tool_registry: ToolRegistry
+    chat_router: ModelRouter
+    evaluator_router: ModelRouter
+    session_store: SessionStore | None
+    prompt_cache: PromptCache
+    clients: ClientFactory
+    usage_tracker: UsageTracker
+    usage_budget: UsageBudget | None
+
+def create_lead_store() -> LeadStore:
+    lead_store = LeadStore(get_env_str('LEAD_STORE_PATH', '../data/leads.db'))
+    atexit.register(lead_store.close)
+    return lead_store
+
+def create_session_store() -> SessionStore | None:
+    if not get_env_bool('SESSION_STORE_ENABLED', True):
+        return None
+    path = get_env_str('SESSION_STORE_PATH', 'none')
+    session_store = SessionStore(
+        max_sessions = get_env_int('SESSION_MAX_SESSIONS', 1024),
+        idle_ttl_seconds = get_env_float('SESSION_IDLE_TTL_SECONDS', 3600),
+        path = None if path == 'none' else path
+    )
+    atexit.register(session_store.close)
+    return session_store
+
+def create_scheduler() -> RequestScheduler | None:
+    if not get_env_bool('SCHEDULER_ENABLED', True):
+        return None
+    limits = {
+        provider: ProviderLimits(
+            requests_per_minute = get_env_int(f'{prefix}_REQUESTS_PER_MINUTE', requests_per_minute),
+            tokens_per_minute = get_env_int(f'{prefix}_TOKENS_PER_MINUTE', tokens_per_minute),
+            max_concurrency = get_env_int(f'{prefix}_MAX_CONCURRENCY', 32)
+        )
+        for provider, prefix, requests_per_minute, tokens_per_minute in (
+            ("openai", "OPENAI", 500, 200000),
+            ("gemini", "GEMINI", 2000, 4000000)
+        )
+    }
+    return RequestScheduler(
+        limits,
+        max_queue = get_env_int('SCHEDULER_MAX_QUEUE', 128),
+        queue_timeout = get_env_float('SCHEDULER_QUEUE_TIMEOUT_SECONDS', 20),
+        max_retries = get_env_int('SCHEDULER_MAX_RETRIES', 4),
+        base_delay = get_env_float('SCHEDULER_RETRY_BASE_DELAY_SECONDS', 0.5),
+        max_delay = get_env_float('SCHEDULER_RETRY_MAX_DELAY_SECONDS', 20)
+    )
+
+def create_usage_tracker() -> UsageTracker:
+    tracker = UsageTracker(
+        ModelPrices.from_config(get_env_str('MODEL_PRICES', '')),
+        max_sessions = get_env_int('USAGE_MAX_SESSIONS', 4096)
+    )
+    # Every completion recorded on a span is reported to the tracker
+    add_usage_listener(tracker.record)
+    return tracker
+
+def create_usage_budget() -> UsageBudget | None:
+    if not get_env_bool('SESSION_BUDGET_ENABLED', True):
+        return None
+    return UsageBudget.from_config(
+        max_tokens = get_env_int('SESSION_TOKEN_BUDGET', 100000),
+        max_cost = get_env_float('SESSION_COST_BUDGET', 0.05),
+        thresholds = get_env_str('SESSION_BUDGET_THRESHOLDS', '0.5,0.7,0.85'),
+        max_reevaluations = get_env_int('SESSION_BUDGET_REEVALUATIONS', 1),
+        history_turns = get_env_int('SESSION_BUDGET_HISTORY_TURNS', 2)
+    )
+
+def create_client_factory(scheduler: RequestScheduler | None = None) -> ClientFactory:
+    return ClientFactory(
+        TransportOptions(
+            max_connections = get_env_int('HTTP_MAX_CONNECTIONS', 64),
+            max_keepalive_connections = get_env_int('HTTP_MAX_KEEPALIVE_CONNECTIONS', 32),
+            keepalive_expiry = get_env_float('HTTP_KEEPALIVE_EXPIRY_SECONDS', 60),
+            http2 = get_env_bool('HTTP2_ENABLED', True),
+            connect_timeout = get_env_float('HTTP_CONNECT_TIMEOUT_SECONDS', 5),
+            read_timeout = get_env_float('HTTP_READ_TIMEOUT_SECONDS', 60),
+            write_timeout = get_env_float('HTTP_WRITE_TIMEOUT_SECONDS', 10),
+            pool_timeout = get_env_float('HTTP_POOL_TIMEOUT_SECONDS', 10)
+        ),
+        scheduler
+    )
+
+def create_router(name: str, primary: tuple[str, str], fallback: tuple[str, str], clients: ClientFactory, read_timeout: float | None = None) -> ModelRouter:
+    # Each route's client carries the router's read timeout, so a slow evaluator gives up before a slow chat reply would
+    routes = [Route(primary[0], clients.client(primary[0], read_timeout), primary[1], read_timeout)]
+    if fallback[1] != 'none':
+        routes.append(Route(fallback[0], clients.client(fallback[0], read_timeout), fallback[1], read_timeout))
+    hedge_target = get_env_str('HEDGE_TARGET', 'same')
+    if hedge_target not in ('same', 'fallback'):
+        raise ValueError(f"Unknown hedge target: {hedge_target}")
+    return ModelRouter(
+        name,
+        routes,
+        hedge = get_env_bool('HEDGE_ENABLED', True),
+        hedge_percentile = get_env_float('HEDGE_PERCENTILE', 95),
+        hedge_budget = get_env_float('HEDGE_BUDGET', 0.05),
+        hedge_to_fallback = hedge_target == 'fallback',
+        hedge_min_delay = get_env_float('HEDGE_MIN_DELAY_SECONDS', 1.0),
+        failover = get_env_bool('ROUTER_FAILOVER_ENABLED', True)
+    )
+
+def create_agent_resources(
+    lead_store: LeadStore | None = None,
+    scheduler: RequestScheduler | None = None,
+    session_store: SessionStore | None = None
+) -> AgentResources:
+    # Every agent and both routers share one client, and so one connection pool, per provider
+    clients = create_client_factory(scheduler)
+
+    cache = None
+    if get_env_bool('RESPONSE_CACHE_ENABLED', True):
+        cache = ResponseCache(
+            max_entries = get_env_int('RESPONSE_CACHE_MAX_ENTRIES', 512),
+            ttl_seconds = get_env_float('RESPONSE_CACHE_TTL_SECONDS', 3600),
+            history_turns = get_env_int('RESPONSE_CACHE_HISTORY_TURNS', 2)
+        )
+
+    history_manager = None
+    if get_env_bool('HISTORY_LIMIT_ENABLED', True):
+        history_manager = HistoryManager(
+            max_turns = get_env_int('HISTORY_MAX_TURNS', 6),
+            max_tokens = get_env_int('HISTORY_MAX_TOKENS', 2000),
+            summarize = get_env_bool('HISTORY_SUMMARIZE', True)
+        )
+
+    return AgentResources(
+        retraction_policy = RetractionPolicy.from_config(
+            get_env_str('STREAM_RETRACTION_MODE', 'replace'),
+            get_env_str('STREAM_RETRACTION_TRIGGERS', '')
+        ),
+        cache = cache,
+        history_manager = history_manager,
+        tool_registry = ToolRegistry([RecordUserDetailsTool(lead_store)]),
+        chat_router = create_router(
+            "chat",
+            ("openai", "gpt-4o-mini"),
+            ("gemini", get_env_str('CHAT_FALLBACK_MODEL', 'gemini-2.0-flash')),
+            clients,
+            get_env_float('CHAT_READ_TIMEOUT_SECONDS', get_env_float('HTTP_READ_TIMEOUT_SECONDS', 60))
+        ),
+        evaluator_router = create_router(
+            "evaluator",
+            ("gemini", "gemini-2.0-flash"),
+            ("openai", get_env_str('EVALUATOR_FALLBACK_MODEL', 'gpt-4o-mini')),
+            clients,
+            get_env_float('EVALUATOR_READ_TIMEOUT_SECONDS', 20)
+        ),
+        session_store = session_store,
+        prompt_cache = PromptCache(get_env_int('PROMPT_CACHE_MAX_ENTRIES', 256)),
+        clients = clients,
+        usage_tracker = create_usage_tracker(),
+        usage_budget = create_usage_budget()
+    )
+
+async def warm_up_clients(resources: AgentResources) -> dict:
+    # Primes each provider with the model it answers first, so a priming call costs one token per provider
+    prime_models = {}
+    if get_env_bool('WARMUP_PRIME_ENABLED', False):
+        for router in (resources.chat_router, resources.evaluator_router):
+            primary = router.routes[0]
+            prime_models.setdefault(primary.provider, primary.model)
+    return await resources.clients.warm_up(
+        connections = get_env_int('WARMUP_CONNECTIONS', 2),
+        prime_models = prime_models,
+        timeout = get_env_float('WARMUP_TIMEOUT_SECONDS', 10)
+    )
+
+def create_profile_index(profile: str, sections: list[dict] | None = None) -> ProfileIndex | None:
+    profile_context_mode = get_env_str('PROFILE_CONTEXT_MODE', 'full')
+    if profile_context_mode == 'retrieval':
+        chunks = [ProfileChunk(section['heading'], section['text']) for section in sections] if sections else None
+        return ProfileIndex(profile, top_k = get_env_int('PROFILE_TOP_K', 4), chunks = chunks)
+    if profile_context_mode != 'full':
+        raise ValueError(f"Unknown profile context mode: {profile_context_mode}")
+    return None
+
+def create_evaluation_policy(name: str, profile: str) -> EvaluationPolicy:
+    return EvaluationPolicy.from_config(
+        get_env_str('EVALUATION_MODE', 'always'),
+        profile,
+        name,
+        get_env_float('EVALUATION_AUDIT_SAMPLE_RATE', 0.1)
+    )
+
+def create_profile_ingestor(prompt_cache: PromptCache | None = None) -> ProfileIngestor:
+    artifact_dir = get_env_str('PROFILE_ARTIFACT_DIR', '../data/artifacts')
+    return ProfileIngestor(None if artifact_dir == 'none' else artifact_dir, prompt_cache)
+
+def create_profile_watcher() -> ProfileWatcher | None:
+    if not get_env_bool('PROFILE_WATCH_ENABLED', True):
+        return None
+    watcher = ProfileWatcher(get_env_float('PROFILE_WATCH_INTERVAL_SECONDS', 2.0))
+    atexit.register(watcher.close)
+    return watcher
+
+def update_agent_profile(agent: ChatAgent, name: str, profile: str, sections: list[dict] | None = None):
+    # The index and policy are built before the swap, so visitors never wait on them
+    agent.update_profile(name, profile, create_profile_index(profile, sections), create_evaluation_policy(name, profile))
+
+def create_agent(
+    name: str,
+    profile: str,
+    lead_store: LeadStore | None = None,
+    scheduler: RequestScheduler | None = None,
+    session_store: SessionStore | None = None,
+    resources: AgentResources | None = None,
+    profile_key: str | None = None,
+    sections: list[dict] | None = None
+) -> ChatAgent:
+    resources = resources or create_agent_resources(lead_store, scheduler, session_store)
+
+    return ChatAgent(
+        name,
+        profile,
+        retraction_policy = resources.retraction_policy,
+        cache = resources.cache,
+        profile_index = create_profile_index(profile, sections),
+        history_manager = resources.history_manager,
+        evaluation_policy = create_evaluation_policy(name, profile),
+        tool_registry = resources.tool_registry,
+        router = resources.chat_router,
+        evaluator_router = resources.evaluator_router,
+        session_store = resources.session_store,
+        prompt_cache = resources.prompt_cache,
+        profile_key = profile_key,
+        usage_tracker = resources.usage_tracker,
+        usage_budget = resources.usage_budget,
+        candidates = get_env_int('GENERATION_CANDIDATES', 1)
+    )
+
+def create_agent_pool(directory: str, resources: AgentResources, watcher: ProfileWatcher | None = None) -> AgentPool:
+    return AgentPool(
+        ProfileCatalog(directory, create_profile_ingestor(resources.prompt_cache)),
+        lambda source: create_agent(source.name, source.profile, resources = resources, profile_key = source.key, sections = source.sections),
+        update = lambda agent, source: update_agent_profile(agent, source.name, source.profile, source.sections),
+        watcher = watcher,
+        max_agents = get_env_int('PROFILE_MAX_AGENTS', 32),
+        max_memory_bytes = get_env_int('PROFILE_MAX_MEMORY_MB', 256) * 1024 * 1024
+    )
+
+def create_served_agents(resources: AgentResources) -> tuple[ChatAgent | None, AgentPool | None]:
+    # Multi-profile mode serves every profile under PROFILES_DIR, building agents on first use;
+    # otherwise a single agent serves data/name.txt and PROFILE_SOURCE, markdown or a PDF resume
+    watcher = create_profile_watcher()
+    profiles_dir = get_env_str('PROFILES_DIR', 'none')
+    if profiles_dir != 'none':
+        return None, create_agent_pool(profiles_dir, resources, watcher)
+
+    ingestor = create_profile_ingestor(resources.prompt_cache)
+    name_path = "../data/name.txt"
+    source_path = get_env_str('PROFILE_SOURCE', '../data/profile.md')
+    artifact = ingestor.ingest(name_path, source_path)
+    agent = create_agent(artifact.name, artifact.text, resources = resources, sections = artifact.sections)
+    if watcher is not None:
+        # Edited profiles are swapped into the live agent without a restart
+        def reload_profile():
+            reloaded = ingestor.ingest(name_path, source_path)
+            update_agent_profile(agent, reloaded.name, reloaded.text, reloaded.sections)
+        watcher.watch("default", [name_path, source_path], reload_profile)
+    return agent, None
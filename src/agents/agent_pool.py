@@ -0,0 +1,118 @@
+from collections import OrderedDict
+from typing import Callable, Self
+from agents.chat_agent import ChatAgent
+from profiles.profile_catalog import ProfileCatalog, ProfileSource
+from profiles.profile_watcher import ProfileWatcher
+from utils.metrics import PROFILE_AGENTS
+
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class AgentPool:
+    """Chat agents built on first use per profile, kept in an LRU bounded by count and estimated memory"""
+
+    def __init__(
+        self: Self,
+        catalog: ProfileCatalog,
+        build: Callable[[ProfileSource], ChatAgent],
+        update: Callable[[ChatAgent, ProfileSource], None] | None = None,
+        watcher: ProfileWatcher | None = None,
+        max_agents: int = 32,
+        max_memory_bytes: int = 256 * 1024 * 1024
+    ):
+        self._catalog = catalog
+        self._build = build
+        self._update = update
+        self._watcher = watcher
+        self._max_agents = max_agents
+        self._max_memory_bytes = max_memory_bytes
+        self._agents: OrderedDict[str, tuple[ChatAgent, int]] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # One build per key at a time; other keys keep building and serving in parallel
+        self._build_locks: dict[str, threading.Lock] = {}
+        self._stats = {'hits': 0, 'builds': 0, 'evictions': 0, 'reloads': 0}
+        logger.info("AgentPool initialized", extra = {'max_agents': max_agents, 'max_memory_bytes': max_memory_bytes})
+
+    async def get(self: Self, key: str) -> ChatAgent:
+        agent = self._lookup(key)
+        if agent is not None:
+            return agent
+        # Reading the profile and building its index are blocking, so they stay off the event loop
+        return await asyncio.to_thread(self._get_or_build, key)
+
+    def stats(self: Self) -> dict:
+        with self._lock:
+            return {**self._stats, 'size': len(self._agents), 'memory_bytes': self._memory_bytes}
+
+    def _lookup(self: Self, key: str) -> ChatAgent | None:
+        with self._lock:
+            entry = self._agents.get(key)
+            if entry is None:
+                return None
+            self._agents.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def _get_or_build(self: Self, key: str) -> ChatAgent:
+        # Unknown keys are rejected before they can claim a build lock
+        self._catalog.paths(key)
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        try:
+            with build_lock:
+                agent = self._lookup(key)
+                if agent is not None:
+                    return agent
+                source = self._catalog.load(key)
+                agent = self._build(source)
+                size = agent.memory_estimate()
+                with self._lock:
+                    self._agents[key] = (agent, size)
+                    self._memory_bytes += size
+                    self._stats['builds'] += 1
+                    PROFILE_AGENTS.inc(event = "built")
+                    self._evict()
+        finally:
+            # Failed builds drop their lock too, so the lock table only holds builds in flight
+            with self._lock:
+                if self._build_locks.get(key) is build_lock:
+                    del self._build_locks[key]
+        if self._watcher is not None and self._update is not None:
+            self._watcher.watch(key, source.paths, lambda: self._reload(key))
+        logger.info("Agent built", extra = {'profile_key': key, 'content_hash': source.content_hash, 'memory_bytes': size})
+        return agent
+
+    def _evict(self: Self):
+        # The newest agent always stays, even if it alone exceeds the memory bound
+        while len(self._agents) > 1 and (len(self._agents) > self._max_agents or self._memory_bytes > self._max_memory_bytes):
+            key, (_, size) = self._agents.popitem(last = False)
+            self._memory_bytes -= size
+            self._stats['evictions'] += 1
+            PROFILE_AGENTS.inc(event = "evicted")
+            if self._watcher is not None:
+                self._watcher.unwatch(key)
+            # Turns already running keep their reference; the agent is freed once they finish
+            logger.info("Agent evicted", extra = {'profile_key': key, 'memory_bytes': size})
+
+    def _reload(self: Self, key: str):
+        # Called from the watcher thread; the agent swaps its profile in one assignment, so turns keep flowing
+        with self._lock:
+            entry = self._agents.get(key)
+        if entry is None:
+            return
+        source = self._catalog.load(key)
+        agent = entry[0]
+        self._update(agent, source)
+        size = agent.memory_estimate()
+        with self._lock:
+            if self._agents.get(key) is entry:
+                self._agents[key] = (agent, size)
+                self._memory_bytes += size - entry[1]
+                self._evict()
+            self._stats['reloads'] += 1
+        PROFILE_AGENTS.inc(event = "reloaded")
+        logger.info("Agent profile reloaded", extra = {'profile_key': key, 'content_hash': source.content_hash, 'memory_bytes': size})
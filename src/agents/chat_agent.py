@@ -1,10 +1,32 @@
-from typing import Self
-from openai import OpenAI, APIError, RateLimitError, APITimeoutError
-from agents.evaluator_agent import EvaluatorAgent
-from tools.base_tool import BaseTool
+from dataclasses import dataclass
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, Self
+from openai import APIError, RateLimitError, APITimeoutError
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+from agents.evaluation_policy import EvaluationMode, EvaluationPolicy
+from agents.evaluator_agent import EvaluatorAgent, EvaluatorAgentError
+from agents.history_manager import HistoryManager
+from agents.retraction_policy import RetractionMode, RetractionPolicy
+from agents.usage_budget import BudgetLevel, UsageBudget
+from llm.clients import create_client
+from llm.router import ModelRouter, Route
+from llm.scheduler import RequestScheduler, SchedulerOverloadedError
+from models.evaluation import Evaluation
+from profiles.profile_index import ProfileIndex
+from profiles.prompt_cache import PromptCache, content_hash
+from storage.lead_store import LeadStore
+from storage.session_store import Session, SessionStore
 from tools.record_user_details_tool import RecordUserDetailsTool
+from tools.tool_registry import ToolRegistry
+from utils.async_runner import iterate_sync, run_sync
+from utils.metrics import BUDGET_DEGRADATIONS, CACHE_LOOKUPS, CHAT_TURNS, REEVALUATIONS, TIME_TO_FIRST_TOKEN, TURN_TOKENS
+from utils.response_cache import ResponseCache
+from utils.tracing import Span, bind_turn, bind_turn_stream, new_turn_id, span
+from utils.usage import UsageTracker
+import asyncio
 import logging
-import json
+import sys
 
 logger = logging.getLogger(__name__)
 
@@ -16,139 +38,593 @@ class ToolExecutionError(ChatAgentError):
     """Exception raised when a tool execution fails"""
     pass
 
+@dataclass(frozen = True)
+class _ProfileState:
+    # Swapped as one reference when the profile changes, evaluator prompts included, so a turn never mixes two versions
+    name: str
+    profile: str
+    system_prompt: str
+    prompt_hash: str
+    evaluator_prompts: tuple[str, str]
+    profile_index: ProfileIndex | None
+    evaluation_policy: EvaluationPolicy
+
 class ChatAgent:
 
-    def __init__(self, name: str, profile: str):
-        self._name = name
-        self._profile = profile
-        self._client = OpenAI()
-        self._model = "gpt-4o-mini"
-        self._system_prompt = self._get_system_prompt(name, profile)
-        self._tools = self._get_tools()
-        self._tool_definitions = self._get_tool_definitions(self._tools)
-        self._evaluator = EvaluatorAgent(name, profile)
+    def __init__(
+        self,
+        name: str,
+        profile: str,
+        retraction_policy: RetractionPolicy | None = None,
+        cache: ResponseCache | None = None,
+        profile_index: ProfileIndex | None = None,
+        history_manager: HistoryManager | None = None,
+        evaluation_policy: EvaluationPolicy | None = None,
+        tool_registry: ToolRegistry | None = None,
+        lead_store: LeadStore | None = None,
+        scheduler: RequestScheduler | None = None,
+        router: ModelRouter | None = None,
+        evaluator_router: ModelRouter | None = None,
+        session_store: SessionStore | None = None,
+        prompt_cache: PromptCache | None = None,
+        profile_key: str | None = None,
+        usage_tracker: UsageTracker | None = None,
+        usage_budget: UsageBudget | None = None,
+        candidates: int = 1
+    ):
+        self._profile_key = profile_key
+        self._prompt_cache = prompt_cache
+        self._client = router or ModelRouter("chat", [Route("openai", create_client("openai", scheduler), "gpt-4o-mini")])
+        self._model = self._client.model
+        self._evaluator = EvaluatorAgent(name, profile, scheduler = scheduler, router = evaluator_router, prompt_cache = prompt_cache)
+        self._state = self._create_state(name, profile, profile_index, evaluation_policy)
+        self._tool_registry = tool_registry or self._get_tool_registry(lead_store)
+        self._tool_definitions = self._tool_registry.definitions
+        self._overload_message = "I'm getting a lot of visitors right now, so I couldn't answer in time. Please try again in a moment."
         self._MAX_REEVALUATION_ATTEMPTS = 3
-        logger.info("ChatAgent initialized", extra = {'agent_name': name, 'model': self._model})
+        # Above one, candidates are generated in one request and graded in one call instead of the rerun loop
+        self._candidates = max(1, candidates)
+        self._retraction_policy = retraction_policy or RetractionPolicy()
+        self._cache = cache
+        self._history_manager = history_manager
+        self._session_store = session_store
+        self._audit_tasks: set[asyncio.Task] = set()
+        self._usage_tracker = usage_tracker
+        # Budgets are enforced per session, so they need the tracker that totals each session
+        self._usage_budget = usage_budget if usage_tracker is not None else None
+        self._reduced_history_manager = None
+        if self._usage_budget is not None:
+            self._reduced_history_manager = HistoryManager(max_turns = self._usage_budget.history_turns, summarize = False)
+        logger.info("ChatAgent initialized", extra = {'agent_name': name, 'profile_key': profile_key, 'model': self._model, 'profile_retrieval': profile_index is not None, 'candidates': self._candidates})
 
-    def chat(self: Self, message: str, history: any) -> str:
-        logger.info("Processing chat message", extra = {'message_length': len(message)})
-        messages = self._create_messages(message, history)
-        done = False
+    def chat(self: Self, message: str, history: any, session_id: str | None = None) -> str:
+        return run_sync(self.achat(message, history, session_id))
 
-        while not done:
+    async def achat(self: Self, message: str, history: any, session_id: str | None = None) -> str:
+        with bind_turn(new_turn_id()), span("chat.turn", streaming = False) as turn, self._track_usage(turn, session_id):
             try:
-                response = self._client.chat.completions.create(
-                    model = self._model,
-                    messages = messages,
-                    tools = self._tool_definitions
-                )
+                reply = await self._achat(message, history, turn, session_id)
+            except SchedulerOverloadedError:
+                CHAT_TURNS.inc(outcome = "shed")
+                return self._overload_message
+            except Exception:
+                CHAT_TURNS.inc(outcome = "error")
+                raise
+            CHAT_TURNS.inc(outcome = turn.attributes.get('outcome', "completed"))
+            return reply
+
+    async def _achat(self: Self, message: str, history: any, turn: Span, session_id: str | None) -> str:
+        logger.info("Processing chat message", extra = {'message_length': len(message)})
+        # The session store and history summaries can fail too, and surface as ChatAgentError like the model calls
+        try:
+            session = await self._sync_session(session_id, history)
+            if session is not None:
+                history = session.messages
+            state = self._state
+            cache_key, cached_reply = self._lookup_cache(state, message, history)
+            if cached_reply is not None:
+                turn.set(outcome = "cached")
+                await self._record_turn(session, message, cached_reply, [])
+                return cached_reply
+
+            level = self._budget_level(session_id, turn)
+            if level == BudgetLevel.CUTOFF:
+                await self._record_turn(session, message, self._usage_budget.cutoff_message, [])
+                return self._usage_budget.cutoff_message
+
+            system_prompt, profile_context = self._build_system_prompt(state, message, history)
+            history_messages = await self._prepare_history(history, session, level)
+            messages = self._create_messages(message, history_messages, system_prompt)
+            candidates = self._candidate_count(state, level)
+            tool_results = []
+            used_tools = False
+            done = False
+
+            while not done:
+                with span("llm.generate", model = self._model) as generate:
+                    response = await self._client.chat.completions.create(
+                        model = self._model,
+                        messages = messages,
+                        tools = self._tool_definitions,
+                        **self._candidate_options(candidates)
+                    )
+                    generate.record_usage(response.usage, response.model)
 
                 finish_reason = response.choices[0].finish_reason
                 reply = response.choices[0].message.content
 
-                if finish_reason != "tool_calls":
+                replies = {}
+                if finish_reason != "tool_calls" and candidates > 1:
+                    # Candidates without text are dropped; when none is left, the turn takes the single-reply path
+                    replies = {choice.index: choice.message.content for choice in response.choices if choice.finish_reason != "tool_calls" and choice.message.content}
+
+                if replies:
+                    index, evaluations = await self._select_candidate(state, replies, message, history, profile_context, turn)
+                    reply = replies[index]
+                    evaluation = evaluations[index] if evaluations is not None else None
+                    turn.set(retries = 0, verdict = self._verdict(evaluation))
+                    done = True
+                elif finish_reason != "tool_calls":
                     retry_attempt = 0
-                    evaluation = self._evaluator.run(reply, message, history)
-                    logger.debug("Initial evaluation", extra = {'is_acceptable': evaluation.is_acceptable})
+                    evaluation = await self._evaluate(state, reply, message, history, profile_context, level)
 
-                    while evaluation.is_acceptable == False and retry_attempt < self._MAX_REEVALUATION_ATTEMPTS:
+                    while evaluation is not None and evaluation.is_acceptable == False and retry_attempt < self._reevaluation_limit(session_id):
                         logger.info("Reevaluating response", extra = {'attempt': retry_attempt + 1})
-                        reply = self._rerun(reply, message, history, evaluation.feedback)
-                        evaluation = self._evaluator.run(reply, message, history)
+                        reply = await self._rerun(state, reply, message, history_messages, evaluation.feedback, system_prompt)
+                        evaluation = await self._evaluator.arun(reply, message, history, profile_context, state.evaluator_prompts)
                         retry_attempt += 1
 
                     if retry_attempt > 0:
                         logger.info("Response reevaluated", extra = {'final_attempt': retry_attempt})
 
+                    turn.set(retries = retry_attempt, verdict = self._verdict(evaluation))
                     done = True
                 else:
                     tool_call_message = response.choices[0].message
                     logger.info("Tool call detected", extra = {'tool_calls': len(tool_call_message.tool_calls)})
-                    results = self._handle_tool_call(tool_call_message.tool_calls, message, history)
+                    results = await self._handle_tool_call(tool_call_message.tool_calls, message, history)
                     messages.append(tool_call_message)
                     messages.extend(results)
+                    tool_results.extend(results)
+                    used_tools = True
 
-            except RateLimitError:
-                logger.error("Rate limit exceeded")
-                raise ChatAgentError("Rate limit exceeded. Please try again later.")
-            except APITimeoutError:
-                logger.error("Request timed out")
-                raise ChatAgentError("Request timed out. Please try again.")
-            except APIError as e:
-                logger.error("OpenAI API error", extra = {'error': str(e)})
-                raise ChatAgentError(f"OpenAI API error: {str(e)}")
-            except Exception as e:
-                logger.error("Unexpected error in chat", extra = {'error': str(e)})
-                raise ChatAgentError(f"Unexpected error in chat: {str(e)}")
+        except SchedulerOverloadedError:
+            raise
+        except Exception as e:
+            raise self._to_chat_agent_error(e)
 
+        self._store_cache(cache_key, reply, evaluation, used_tools)
+        await self._record_turn(session, message, reply, tool_results)
         logger.info("Chat message processed successfully", extra = {'reply_length': len(reply)})
         return reply
     
-    def _rerun(self: Self, reply: str, message: str, history: any, feedback: str) -> str:
+    def cache_stats(self: Self) -> dict | None:
+        return self._cache.stats() if self._cache is not None else None
+
+    def routing_stats(self: Self) -> dict:
+        return {'chat': self._client.stats(), 'evaluator': self._evaluator.routing_stats()}
+
+    def session_stats(self: Self) -> dict | None:
+        return self._session_store.stats() if self._session_store is not None else None
+
+    def usage_stats(self: Self) -> dict | None:
+        return self._usage_tracker.stats() if self._usage_tracker is not None else None
+
+    def update_profile(self: Self, name: str, profile: str, profile_index: ProfileIndex | None = None, evaluation_policy: EvaluationPolicy | None = None):
+        # Turns in flight keep the state they started with; the cache key changes with the prompt,
+        # so replies to the old profile are no longer replayed
+        self._state = self._create_state(name, profile, profile_index, evaluation_policy)
+        logger.info("Profile updated", extra = {'agent_name': name, 'profile_key': self._profile_key, 'profile_length': len(profile)})
+
+    def memory_estimate(self: Self) -> int:
+        # Only what this profile owns; clients, tools, caches and stores are shared between agents
+        state = self._state
+        size = sys.getsizeof(state.profile) + sys.getsizeof(state.system_prompt) + sum(sys.getsizeof(prompt) for prompt in state.evaluator_prompts)
+        if state.profile_index is not None:
+            size += state.profile_index.memory_estimate()
+        return size
+
+    def stream_chat(self: Self, message: str, history: any, session_id: str | None = None) -> Iterator[str]:
+        return iterate_sync(self.astream_chat(message, history, session_id))
+
+    async def astream_chat(self: Self, message: str, history: any, session_id: str | None = None) -> AsyncIterator[str]:
+        # Yields the accumulated reply after every token, which is what Gradio expects from generators
+        turn_id = new_turn_id()
+        with span("chat.turn", turn_id = turn_id, streaming = True) as turn, self._track_usage(turn, session_id):
+            try:
+                async for reply in bind_turn_stream(turn_id, self._astream_chat(message, history, turn, session_id)):
+                    yield reply
+            except SchedulerOverloadedError:
+                CHAT_TURNS.inc(outcome = "shed")
+                yield self._overload_message
+                return
+            except Exception:
+                CHAT_TURNS.inc(outcome = "error")
+                raise
+            CHAT_TURNS.inc(outcome = turn.attributes.get('outcome', "completed"))
+
+    async def _astream_chat(self: Self, message: str, history: any, turn: Span, session_id: str | None) -> AsyncIterator[str]:
+        logger.info("Processing streamed chat message", extra = {'message_length': len(message)})
+        try:
+            session = await self._sync_session(session_id, history)
+            if session is not None:
+                history = session.messages
+            state = self._state
+            cache_key, cached_reply = self._lookup_cache(state, message, history)
+            if cached_reply is not None:
+                turn.set(outcome = "cached")
+                await self._record_turn(session, message, cached_reply, [])
+                yield cached_reply
+                return
+
+            level = self._budget_level(session_id, turn)
+            if level == BudgetLevel.CUTOFF:
+                await self._record_turn(session, message, self._usage_budget.cutoff_message, [])
+                yield self._usage_budget.cutoff_message
+                return
+
+            system_prompt, profile_context = self._build_system_prompt(state, message, history)
+            history_messages = await self._prepare_history(history, session, level)
+            messages = self._create_messages(message, history_messages, system_prompt)
+            candidates = self._candidate_count(state, level)
+            # In hold mode nothing reaches the visitor before the evaluator has passed it
+            hold = self._retraction_policy.mode == RetractionMode.HOLD
+            tool_results = []
+            used_tools = False
+
+            while True:
+                draft = ""
+                tool_calls = {}
+                other_drafts = {}
+                with span("llm.generate", model = self._model, streaming = True) as generate:
+                    stream = await self._client.chat.completions.create(
+                        model = self._model,
+                        messages = messages,
+                        tools = self._tool_definitions,
+                        stream = True,
+                        stream_options = {"include_usage": True},
+                        **self._candidate_options(candidates)
+                    )
+
+                    async for chunk in stream:
+                        if chunk.usage is not None:
+                            generate.record_usage(chunk.usage, chunk.model)
+                        for choice in chunk.choices:
+                            delta = choice.delta
+                            if choice.index > 0:
+                                # Only the first candidate is streamed and may call tools; the others wait for grading
+                                if delta.content:
+                                    other_drafts[choice.index] = other_drafts.get(choice.index, "") + delta.content
+                                continue
+                            if delta.content:
+                                draft += delta.content
+                                if not hold:
+                                    self._record_first_token(turn)
+                                    yield draft
+                            for tool_call_delta in delta.tool_calls or []:
+                                self._accumulate_tool_call(tool_calls, tool_call_delta)
+
+                if not tool_calls:
+                    break
+
+                tool_call_message = self._build_tool_call_message(draft, tool_calls)
+                logger.info("Tool call detected", extra = {'tool_calls': len(tool_call_message.tool_calls)})
+                results = await self._handle_tool_call(tool_call_message.tool_calls, message, history)
+                messages.append(tool_call_message)
+                messages.extend(results)
+                tool_results.extend(results)
+                used_tools = True
+
+            reply = draft
+            retry_attempt = 0
+            # Candidates without text are dropped; when none is left, the turn takes the single-reply path
+            replies = {index: text for index, text in sorted({0: draft, **other_drafts}.items()) if text} if candidates > 1 else {}
+            if replies:
+                index, evaluations = await self._select_candidate(state, replies, message, history, profile_context, turn)
+                evaluation = evaluations[index] if evaluations is not None else None
+                if index == 0 or hold:
+                    # Either the streamed draft was chosen, or nothing has been shown yet and the chosen candidate goes out below
+                    reply = replies[index]
+                elif not draft:
+                    # Nothing was streamed, so the chosen candidate goes out directly
+                    reply = replies[index]
+                    yield reply
+                elif self._retraction_policy.should_retract(evaluations[0]):
+                    logger.info("Replacing streamed reply with a graded candidate", extra = {'candidate': index + 1})
+                    reply = replies[index]
+                    yield reply
+                else:
+                    # The streamed draft stays, so it is the candidate the turn ends with
+                    evaluation = evaluations[0]
+                    turn.set(chosen_candidate = 0)
+            else:
+                evaluation = await self._evaluate(state, reply, message, history, profile_context, level)
+
+                while evaluation is not None and evaluation.is_acceptable == False and retry_attempt < self._reevaluation_limit(session_id):
+                    if not self._retraction_policy.should_retract(evaluation):
+                        logger.info("Keeping streamed reply despite rejection", extra = {'feedback': evaluation.feedback})
+                        break
+
+                    logger.info("Retracting streamed reply", extra = {'attempt': retry_attempt + 1, 'mode': self._retraction_policy.mode})
+                    if hold and retry_attempt == 0:
+                        # The visitor waits behind the placeholder while the corrections are generated and evaluated
+                        self._record_first_token(turn)
+                        yield self._retraction_policy.placeholder
+
+                    reply = await self._rerun(state, reply, message, history_messages, evaluation.feedback, system_prompt)
+                    evaluation = await self._evaluator.arun(reply, message, history, profile_context, state.evaluator_prompts)
+                    retry_attempt += 1
+                    if not hold:
+                        yield reply
+
+            if hold:
+                self._record_first_token(turn)
+                yield reply
+            if retry_attempt > 0:
+                logger.info("Response reevaluated", extra = {'final_attempt': retry_attempt})
+            turn.set(retries = retry_attempt, verdict = self._verdict(evaluation))
+
+        except SchedulerOverloadedError:
+            raise
+        except Exception as e:
+            raise self._to_chat_agent_error(e)
+
+        self._store_cache(cache_key, reply, evaluation, used_tools)
+        await self._record_turn(session, message, reply, tool_results)
+        logger.info("Streamed chat message processed successfully", extra = {'reply_length': len(reply)})
+
+    def _record_first_token(self: Self, turn: Span):
+        if 'first_token_ms' not in turn.attributes:
+            turn.set(first_token_ms = round(turn.elapsed() * 1000, 1))
+            TIME_TO_FIRST_TOKEN.observe(turn.elapsed())
+
+    async def _evaluate(self: Self, state: _ProfileState, reply: str, message: str, history: any, profile_context: str | None, level: BudgetLevel) -> Evaluation | None:
+        if level >= BudgetLevel.SKIP_EVALUATION:
+            logger.info("Evaluation skipped to stay within the session budget")
+            return None
+        if state.evaluation_policy.requires_evaluation(reply, message):
+            evaluation = await self._evaluator.arun(reply, message, history, profile_context, state.evaluator_prompts)
+            logger.debug("Initial evaluation", extra = {'is_acceptable': evaluation.is_acceptable})
+            return evaluation
+        self._skip_evaluation(state, reply, message, history, profile_context)
+        return None
+
+    def _skip_evaluation(self: Self, state: _ProfileState, reply: str, message: str, history: any, profile_context: str | None):
+        logger.debug("Evaluation skipped", extra = {'mode': state.evaluation_policy.mode})
+        if state.evaluation_policy.should_audit():
+            # Keep a reference so the task is not garbage collected before it finishes; the history is
+            # copied because a session's message list grows once the turn is recorded
+            task = asyncio.create_task(self._audit(state, reply, message, list(history), profile_context))
+            self._audit_tasks.add(task)
+            task.add_done_callback(self._audit_tasks.discard)
+
+    async def _select_candidate(self: Self, state: _ProfileState, replies: dict[int, str], message: str, history: any, profile_context: str | None, turn: Span) -> tuple[int, dict[int, Evaluation] | None]:
+        # Candidates and their evaluations are keyed by choice index. The first candidate stands in for
+        # the single reply of the rerun loop, so the evaluation policy decides on it whether they are graded at all
+        first = min(replies)
+        if not state.evaluation_policy.requires_evaluation(replies[first], message):
+            self._skip_evaluation(state, replies[first], message, history, profile_context)
+            return first, None
+        if len(replies) > 1:
+            indices = list(replies)
+            try:
+                position, evaluations = await self._evaluator.agrade([replies[index] for index in indices], message, history, profile_context, state.evaluator_prompts)
+                turn.set(candidates = len(indices), accepted_candidates = sum(1 for evaluation in evaluations if evaluation.is_acceptable), chosen_candidate = indices[position])
+                return indices[position], dict(zip(indices, evaluations))
+            except EvaluatorAgentError as e:
+                # The first candidate may already be on screen, so a failed grading falls back to evaluating it alone
+                logger.warning("Candidate grading failed, evaluating the first candidate", extra = {'error': str(e)})
+                turn.set(grading_failed = True)
+        return first, {first: await self._evaluator.arun(replies[first], message, history, profile_context, state.evaluator_prompts)}
+
+    def _candidate_count(self: Self, state: _ProfileState, level: BudgetLevel) -> int:
+        # Audited replies are never graded before they are returned, and a session near its budget
+        # gets as many candidates as it would get attempts in the rerun loop
+        if self._candidates == 1 or level >= BudgetLevel.SKIP_EVALUATION or state.evaluation_policy.mode == EvaluationMode.ASYNC_AUDIT:
+            return 1
+        if level >= BudgetLevel.FEWER_REEVALUATIONS:
+            return min(self._candidates, self._usage_budget.max_reevaluations + 1)
+        return self._candidates
+
+    def _candidate_options(self: Self, candidates: int) -> dict:
+        # Single-candidate requests stay exactly as they were, for providers that do not support n
+        return {'n': candidates} if candidates > 1 else {}
+
+    @contextmanager
+    def _track_usage(self: Self, turn: Span, session_id: str | None) -> Iterator[None]:
+        if self._usage_tracker is None:
+            yield
+            return
+        self._usage_tracker.start_turn(turn.turn_id, session_id)
+        try:
+            yield
+        finally:
+            usage = self._usage_tracker.finish_turn(turn.turn_id)
+            if usage is not None and usage.calls:
+                # Running session totals on every turn record show which conversations get expensive
+                session_usage = self._usage_tracker.session_usage(session_id)
+                turn.set(
+                    turn_prompt_tokens = usage.prompt_tokens,
+                    turn_completion_tokens = usage.completion_tokens,
+                    turn_cost = round(usage.cost, 6),
+                    session_tokens = session_usage.total_tokens,
+                    session_cost = round(session_usage.cost, 6)
+                )
+                TURN_TOKENS.observe(usage.total_tokens)
+
+    def _budget_level(self: Self, session_id: str | None, turn: Span | None = None) -> BudgetLevel:
+        if self._usage_budget is None:
+            return BudgetLevel.NORMAL
+        usage = self._usage_tracker.session_usage(session_id)
+        level = self._usage_budget.level(usage)
+        if turn is not None and level > BudgetLevel.NORMAL:
+            turn.set(budget_level = level.name.lower())
+            if level == BudgetLevel.CUTOFF:
+                turn.set(outcome = "budget_exceeded")
+            BUDGET_DEGRADATIONS.inc(level = level.name.lower())
+            logger.info("Session near its budget", extra = {'level': level.name.lower(), 'session_tokens': usage.total_tokens, 'session_cost': round(usage.cost, 6)})
+        return level
+
+    def _reevaluation_limit(self: Self, session_id: str | None) -> int:
+        # Checked before every rerun, since the reruns of this turn count towards the budget too
+        level = self._budget_level(session_id)
+        if level >= BudgetLevel.SKIP_EVALUATION:
+            return 0
+        if level >= BudgetLevel.FEWER_REEVALUATIONS:
+            return min(self._MAX_REEVALUATION_ATTEMPTS, self._usage_budget.max_reevaluations)
+        return self._MAX_REEVALUATION_ATTEMPTS
+
+    async def _audit(self: Self, state: _ProfileState, reply: str, message: str, history: any, profile_context: str | None):
+        try:
+            evaluation = await self._evaluator.arun(reply, message, history, profile_context, state.evaluator_prompts)
+            logger.info("Audit evaluation completed", extra = {
+                'is_acceptable': evaluation.is_acceptable,
+                'feedback': evaluation.feedback,
+                'reply_length': len(reply)
+            })
+        except Exception as e:
+            logger.warning("Audit evaluation failed", extra = {'error': str(e)})
+
+    async def _sync_session(self: Self, session_id: str | None, history: any) -> Session | None:
+        if self._session_store is None or session_id is None:
+            return None
+        return await asyncio.to_thread(self._session_store.sync, session_id, history)
+
+    async def _record_turn(self: Self, session: Session | None, message: str, reply: str, tool_results: list[dict]):
+        if session is None:
+            return
+        await asyncio.to_thread(
+            self._session_store.record_turn,
+            session,
+            message,
+            reply,
+            [{"tool_call_id": result["tool_call_id"], "content": result["content"]} for result in tool_results]
+        )
+
+    def _lookup_cache(self: Self, state: _ProfileState, message: str, history: any) -> tuple[str | None, str | None]:
+        if self._cache is None:
+            return None, None
+        cache_key = self._cache.make_key(state.prompt_hash, message, history)
+        cached_reply = self._cache.get(cache_key)
+        CACHE_LOOKUPS.inc(result = "miss" if cached_reply is None else "hit")
+        if cached_reply is not None:
+            logger.info("Response cache hit", extra = {'reply_length': len(cached_reply)})
+        return cache_key, cached_reply
+
+    def _store_cache(self: Self, cache_key: str | None, reply: str, evaluation: Evaluation | None, used_tools: bool):
+        # Only replies that passed evaluation without side effects are safe to replay
+        if cache_key is None or evaluation is None or not evaluation.is_acceptable or used_tools:
+            return
+        self._cache.put(cache_key, reply)
+
+    def _verdict(self: Self, evaluation: Evaluation | None) -> str:
+        if evaluation is None:
+            return "skipped"
+        return "accepted" if evaluation.is_acceptable else "rejected"
+
+    def _accumulate_tool_call(self: Self, tool_calls: dict[int, dict], tool_call_delta: any):
+        tool_call = tool_calls.setdefault(tool_call_delta.index, {"id": "", "name": "", "arguments": ""})
+        if tool_call_delta.id:
+            tool_call["id"] = tool_call_delta.id
+        if tool_call_delta.function:
+            tool_call["name"] += tool_call_delta.function.name or ""
+            tool_call["arguments"] += tool_call_delta.function.arguments or ""
+
+    def _build_tool_call_message(self: Self, content: str, tool_calls: dict[int, dict]) -> ChatCompletionMessage:
+        return ChatCompletionMessage(
+            role = "assistant",
+            content = content or None,
+            tool_calls = [
+                ChatCompletionMessageToolCall(
+                    id = tool_call["id"],
+                    type = "function",
+                    function = Function(name = tool_call["name"], arguments = tool_call["arguments"])
+                )
+                for _, tool_call in sorted(tool_calls.items())
+            ]
+        )
+
+    def _to_chat_agent_error(self: Self, error: Exception) -> ChatAgentError:
+        if isinstance(error, ChatAgentError):
+            return error
+        if isinstance(error, RateLimitError):
+            logger.error("Rate limit exceeded")
+            return ChatAgentError("Rate limit exceeded. Please try again later.")
+        if isinstance(error, APITimeoutError):
+            logger.error("Request timed out")
+            return ChatAgentError("Request timed out. Please try again.")
+        if isinstance(error, APIError):
+            logger.error("OpenAI API error", extra = {'error': str(error)})
+            return ChatAgentError(f"OpenAI API error: {str(error)}")
+        logger.error("Unexpected error in chat", extra = {'error': str(error)})
+        return ChatAgentError(f"Unexpected error in chat: {str(error)}")
+
+    async def _rerun(self: Self, state: _ProfileState, reply: str, message: str, history: any, feedback: str, system_prompt: str) -> str:
+        REEVALUATIONS.inc()
         try:
             logger.debug("Rerunning chat with feedback", extra = {'feedback': feedback})
-            messages = self._create_rerun_messages(reply, message, history, feedback)
-            response = self._client.chat.completions.create(model=self._model, messages=messages)
+            messages = self._create_rerun_messages(state, reply, message, history, feedback, system_prompt)
+            with span("chat.rerun", model = self._model) as rerun:
+                response = await self._client.chat.completions.create(model=self._model, messages=messages)
+                rerun.record_usage(response.usage, response.model)
             return response.choices[0].message.content
+        except SchedulerOverloadedError:
+            raise
         except Exception as e:
             logger.error("Error during rerun", extra = {'error': str(e)})
             raise ChatAgentError(f"Error during rerun: {str(e)}")
     
-    def _handle_tool_call(self: Self, tool_calls: any, message: str, history: any):
-        results = []
-
-        for tool_call in tool_calls:
-            try:
-                tool_name = tool_call.function.name
-                arguments = json.loads(tool_call.function.arguments)
-                tool = self._tools.get(tool_name)
-                
-                logger.info("Executing tool", extra = {'tool_name': tool_name})
-                
-                if not tool or not tool.function:
-                    logger.error("Tool not found or has no function", extra = {'tool_name': tool_name})
-                    raise ToolExecutionError(f"Tool {tool_name} not found or has no function")
-                
-                result = tool.function(message, history, **arguments)
-                results.append({
-                    "role": "tool",
-                    "content": json.dumps(result),
-                    "tool_call_id": tool_call.id
-                })
-                logger.info("Tool execution successful", extra = {'tool_name': tool_name})
-            except json.JSONDecodeError:
-                logger.error("Invalid JSON arguments for tool", extra = {'tool_name': tool_name})
-                raise ToolExecutionError(f"Invalid JSON arguments for tool {tool_name}")
-            except Exception as e:
-                logger.error("Error executing tool", extra = {'tool_name': tool_name, 'error': str(e)})
-                raise ToolExecutionError(f"Error executing tool {tool_name}: {str(e)}")
-
-        return results
-    
-    def _get_tool_definitions(self: Self, tools: dict[str, BaseTool]):
+    async def _handle_tool_call(self: Self, tool_calls: any, message: str, history: any):
         try:
-            definitions = []
-            for tool_name in tools:
-                definitions.append({
-                    "type": "function",
-                    "function": tools.get(tool_name).definition
-                })
-            logger.debug("Tool definitions retrieved", extra = {'tool_count': len(definitions)})
-            return definitions
+            with span("chat.tool_calls", tool_calls = len(tool_calls)):
+                return await self._tool_registry.execute(tool_calls, message, history, {'profile': self._profile_key})
         except Exception as e:
-            logger.error("Error getting tool definitions", extra = {'error': str(e)})
-            raise ChatAgentError(f"Error getting tool definitions: {str(e)}")
-    
-    def _get_tools(self: Self) -> dict[str, BaseTool]:
-        tools = {
-            "record_user_details": RecordUserDetailsTool()
-        }
-        logger.debug("Tools initialized", extra = {'tool_count': len(tools)})
-        return tools
-    
-    def _create_messages(self: Self, message: str, history: any) -> any:
+            logger.error("Error executing tool calls", extra = {'error': str(e)})
+            raise ToolExecutionError(f"Error executing tool calls: {str(e)}")
+
+    def _get_tool_registry(self: Self, lead_store: LeadStore | None) -> ToolRegistry:
+        registry = ToolRegistry([RecordUserDetailsTool(lead_store)])
+        logger.debug("Tools initialized", extra = {'tool_count': len(registry.definitions)})
+        return registry
+
+    def _create_state(self: Self, name: str, profile: str, profile_index: ProfileIndex | None, evaluation_policy: EvaluationPolicy | None) -> _ProfileState:
+        if self._prompt_cache is None:
+            system_prompt = self.render_system_prompt(name, profile)
+        else:
+            system_prompt = self._prompt_cache.get("chat", content_hash(name, profile), lambda: self.render_system_prompt(name, profile))
+        return _ProfileState(
+            name = name,
+            profile = profile,
+            system_prompt = system_prompt,
+            prompt_hash = ResponseCache.hash_prompt(system_prompt),
+            evaluator_prompts = self._evaluator.create_prompts(name, profile),
+            profile_index = profile_index,
+            evaluation_policy = evaluation_policy or EvaluationPolicy()
+        )
+
+    def _build_system_prompt(self: Self, state: _ProfileState, message: str, history: any) -> tuple[str, str | None]:
+        # Full mode reuses the precomputed prompt; retrieval mode inlines only the relevant sections
+        if state.profile_index is None:
+            return state.system_prompt, None
+        profile_context = state.profile_index.render(self._get_retrieval_query(message, history))
+        return self.render_system_prompt(state.name, profile_context), profile_context
+
+    def _get_retrieval_query(self: Self, message: str, history: any) -> str:
+        # The previous user message helps follow-ups such as "tell me more" find their topic
+        previous = next((item.get("content") for item in reversed(history) if item.get("role") == "user"), None)
+        return message if previous is None else f"{previous} {message}"
+
+    async def _prepare_history(self: Self, history: any, session: Session | None, level: BudgetLevel = BudgetLevel.NORMAL) -> any:
+        if level >= BudgetLevel.SHORTER_HISTORY:
+            # Only the latest turns, and no summary call to fold in the older ones
+            return await self._reduced_history_manager.prepare(history, self._client, session)
+        if self._history_manager is None:
+            return history
+        return await self._history_manager.prepare(history, self._client, session)
+
+    def _create_messages(self: Self, message: str, history: any, system_prompt: str) -> any:
         try:
-            messages = [{"role": "system", "content": self._system_prompt}]
+            messages = [{"role": "system", "content": system_prompt}]
             messages.extend(history)
             messages.append({"role": "user", "content": message})
             logger.debug("Messages created", extra = {'message_count': len(messages)})
@@ -157,7 +633,8 @@ class ChatAgent:
             logger.error("Error creating messages", extra = {'error': str(e)})
             raise ChatAgentError(f"Error creating messages: {str(e)}")
     
-    def _get_system_prompt(self: Self, name: str, profile: str) -> str:
+    @staticmethod
+    def render_system_prompt(name: str, profile: str) -> str:
         return f"""
             You are {name}, responding to visitors on your professional website. You represent {name} authentically based on the provided professional background information.
 
@@ -206,18 +683,18 @@ class ChatAgent:
             Remember: You ARE {name}. Your goal is not just to answer questions, but to build meaningful professional relationships. Be genuinely interested in connecting with visitors who could be potential employers, clients, or collaborators. When someone engages thoughtfully with your background, that's an opportunity to deepen the relationship through direct contact.
         """
     
-    def _create_rerun_messages(self: Self, reply: str, message: str, history: any, feedback: str) -> any:
+    def _create_rerun_messages(self: Self, state: _ProfileState, reply: str, message: str, history: any, feedback: str, system_prompt: str) -> any:
         try:
-            messages = [{"role": "system", "content": self._get_rerun_system_prompt(reply, feedback)}]
+            messages = [{"role": "system", "content": self._get_rerun_system_prompt(state, system_prompt, reply, feedback)}]
             messages.extend(history)
             messages.append({"role": "user", "content": message})
             return messages
         except Exception as e:
             raise ChatAgentError(f"Error creating rerun messages: {str(e)}")
     
-    def _get_rerun_system_prompt(self: Self, agent_attempted_reply: str, evaluation_feedback: str) -> str:
+    def _get_rerun_system_prompt(self: Self, state: _ProfileState, system_prompt: str, agent_attempted_reply: str, evaluation_feedback: str) -> str:
         return f"""
-            {self._system_prompt}
+            {system_prompt}
 
             ## Response Correction Required
 
@@ -236,5 +713,5 @@ class ChatAgent:
             - If you went off-topic, refocus on professional matters or politely redirect
             - If you were unhelpful, provide more useful information or better alternatives
 
-            Provide a corrected response that directly addresses the feedback while maintaining your role as {self._name}.
+            Provide a corrected response that directly addresses the feedback while maintaining your role as {state.name}.
         """
\ No newline at end of file
@@ -0,0 +1,103 @@
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import Self
+
+import logging
+import random
+import re
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+_CAPITALIZED = re.compile(r"(?<![.!?]\s)(?<!^)\b[A-Z][A-Za-z0-9+#]*(?:[.\-][A-Za-z0-9+#]+)*")
+_WORD = re.compile(r"[a-z0-9][a-z0-9+#]*(?:[.\-][a-z0-9+#]+)*")
+_COMMON_CAPITALIZED = frozenset("""
+    i i'd i'll i'm i've hi hello hey thanks thank sure yes no great happy please feel let sounds absolutely
+    monday tuesday wednesday thursday friday saturday sunday email linkedin ai
+""".split())
+_SENSITIVE_TOPIC = re.compile(
+    r"\b(?:salar|compensation|pay\b|rates?\b|visa|sponsor|relocat|guarantee|confidential|politic|religio|lawsuit|health|references?\b)",
+    re.IGNORECASE
+)
+
+class EvaluationMode(StrEnum):
+    # Every reply is evaluated before it is returned
+    ALWAYS = "always"
+    # Only replies flagged by the local risk check are evaluated
+    GATED = "gated"
+    # Replies are returned immediately and a sample is evaluated in the background
+    ASYNC_AUDIT = "async-audit"
+
+@dataclass(frozen = True)
+class RiskAssessment:
+    is_risky: bool
+    reasons: list[str] = field(default_factory = list)
+
+class RiskAssessor:
+    """Cheap local pre-check for replies that might contain unsupported claims"""
+
+    def __init__(self: Self, profile: str, name: str = "", min_length: int = 20, max_length: int = 1200):
+        self._profile_words = frozenset(_WORD.findall(profile.lower())) | frozenset(_WORD.findall(name.lower()))
+        self._profile_numbers = frozenset(self._normalize_number(number) for number in _NUMBER.findall(profile))
+        self._min_length = min_length
+        self._max_length = max_length
+
+    def assess(self: Self, reply: str, message: str) -> RiskAssessment:
+        reasons = []
+        if len(reply) < self._min_length:
+            reasons.append("too_short")
+        if len(reply) > self._max_length:
+            reasons.append("too_long")
+
+        numbers = {self._normalize_number(number) for number in _NUMBER.findall(reply)}
+        if numbers - self._profile_numbers:
+            reasons.append("unknown_numbers")
+
+        entities = {entity.lower() for entity in _CAPITALIZED.findall(reply)}
+        if any(entity not in _COMMON_CAPITALIZED and entity not in self._profile_words for entity in entities):
+            reasons.append("unknown_entities")
+
+        if _SENSITIVE_TOPIC.search(message) or _SENSITIVE_TOPIC.search(reply):
+            reasons.append("sensitive_topic")
+
+        return RiskAssessment(bool(reasons), reasons)
+
+    @staticmethod
+    def _normalize_number(number: str) -> str:
+        return number.replace(",", "")
+
+class EvaluationPolicy:
+    """Decides whether a reply is evaluated before it is returned, audited later, or not at all"""
+
+    def __init__(self: Self, mode: EvaluationMode = EvaluationMode.ALWAYS, assessor: RiskAssessor | None = None, audit_sample_rate: float = 0.0):
+        if mode == EvaluationMode.GATED and assessor is None:
+            raise ValueError("Gated evaluation requires a risk assessor")
+        self._mode = mode
+        self._assessor = assessor
+        self._audit_sample_rate = audit_sample_rate
+        logger.info("EvaluationPolicy initialized", extra = {'mode': mode, 'audit_sample_rate': audit_sample_rate})
+
+    @property
+    def mode(self: Self) -> EvaluationMode:
+        return self._mode
+
+    def requires_evaluation(self: Self, reply: str, message: str) -> bool:
+        if self._mode == EvaluationMode.ALWAYS:
+            return True
+        if self._mode == EvaluationMode.ASYNC_AUDIT:
+            return False
+        assessment = self._assessor.assess(reply, message)
+        logger.debug("Risk assessment", extra = {'is_risky': assessment.is_risky, 'reasons': assessment.reasons})
+        return assessment.is_risky
+
+    def should_audit(self: Self) -> bool:
+        return self._audit_sample_rate > 0 and random.random() < self._audit_sample_rate
+
+    @classmethod
+    def from_config(cls, mode: str, profile: str, name: str, audit_sample_rate: float) -> Self:
+        try:
+            evaluation_mode = EvaluationMode(mode.lower())
+        except ValueError:
+            raise ValueError(f"Unknown evaluation mode: {mode}")
+        assessor = RiskAssessor(profile, name) if evaluation_mode == EvaluationMode.GATED else None
+        return cls(evaluation_mode, assessor, audit_sample_rate)
@@ -1,8 +1,17 @@
-import os
+from textwrap import dedent
 from typing import Self
-from openai import OpenAI, APIError, RateLimitError, APITimeoutError
-from models.evaluation import Evaluation
+from openai import APIError, RateLimitError, APITimeoutError
+from llm.clients import create_client
+from llm.router import ModelRouter, Route
+from llm.scheduler import RequestScheduler, SchedulerOverloadedError
+from models.evaluation import CandidateEvaluations, Evaluation, candidate_evaluations_model
+from profiles.prompt_cache import PromptCache, content_hash
+from utils.async_runner import run_sync
+from utils.metrics import EVALUATIONS
+from utils.tokens import estimate_message_tokens
+from utils.tracing import span
 import logging
+import sys
 
 logger = logging.getLogger(__name__)
 
@@ -12,76 +21,195 @@ class EvaluatorAgentError(Exception):
 
 class EvaluatorAgent:
     
-    def __init__(self, name: str, profile: str):
-        self._name = name
-        self._profile = profile
+    def __init__(
+        self,
+        name: str,
+        profile: str,
+        history_messages: int = 6,
+        max_message_chars: int = 500,
+        scheduler: RequestScheduler | None = None,
+        router: ModelRouter | None = None,
+        prompt_cache: PromptCache | None = None
+    ):
+        self._prompt_cache = prompt_cache
         try:
-            self._client = OpenAI(
-                api_key = os.getenv('GEMINI_API_KEY'),
-                base_url = 'https://generativelanguage.googleapis.com/v1beta/openai/'
-            )
+            self._client = router or ModelRouter("evaluator", [Route("gemini", create_client("gemini", scheduler), "gemini-2.0-flash")])
             logger.info("EvaluatorAgent initialized", extra = {'agent_name': name})
         except Exception as e:
             logger.error("Failed to initialize OpenAI client", extra = {'error': str(e)})
             raise EvaluatorAgentError(f"Failed to initialize OpenAI client: {str(e)}")
             
-        self._model = "gemini-2.0-flash"
-        self._system_prompt = self._get_system_prompt(name, profile)
+        self._model = self._client.model
+        self._history_messages = history_messages
+        self._max_message_chars = max_message_chars
+        self._prompts = self.create_prompts(name, profile)
+
+    def run(self: Self, reply: str, message: str, history: any, profile_context: str | None = None, prompts: tuple[str, str] | None = None) -> Evaluation:
+        return run_sync(self.arun(reply, message, history, profile_context, prompts))
 
-    def run(self: Self, reply: str, message: str, history: any) -> Evaluation:
+    async def arun(self: Self, reply: str, message: str, history: any, profile_context: str | None = None, prompts: tuple[str, str] | None = None) -> Evaluation:
         try:
             logger.info("Starting evaluation", extra = {'reply_length': len(reply), 'message_length': len(message)})
-            messages = self._create_messages(reply, message, history)
-            response = self._client.beta.chat.completions.parse(
-                model = self._model, 
-                messages = messages, 
-                response_format = Evaluation
-            )
-            evaluation = response.choices[0].message.parsed
-            logger.info("Evaluation completed", extra = {'is_acceptable': evaluation.is_acceptable})
+            messages = self._create_messages(reply, message, history, profile_context, prompts)
+            with span("evaluator.run", model = self._model) as evaluation_span:
+                response = await self._client.beta.chat.completions.parse(
+                    model = self._model, 
+                    messages = messages, 
+                    response_format = Evaluation
+                )
+                evaluation = response.choices[0].message.parsed
+                evaluation_span.record_usage(response.usage, response.model)
+                evaluation_span.set(is_acceptable = evaluation.is_acceptable)
+            EVALUATIONS.inc(verdict = "accepted" if evaluation.is_acceptable else "rejected")
+            logger.info("Evaluation completed", extra = {
+                'is_acceptable': evaluation.is_acceptable,
+                'estimated_prompt_tokens': estimate_message_tokens(messages),
+                **self._get_usage(response)
+            })
             return evaluation
-        except RateLimitError:
+        except SchedulerOverloadedError:
+            raise
+        except Exception as e:
+            raise self._to_evaluator_error(e)
+
+    async def agrade(self: Self, replies: list[str], message: str, history: any, profile_context: str | None = None, prompts: tuple[str, str] | None = None) -> tuple[int, list[Evaluation]]:
+        # Grades every candidate in one structured call and returns the index of the chosen one,
+        # which is the first candidate when none of them is acceptable
+        try:
+            logger.info("Starting candidate grading", extra = {'candidates': len(replies), 'message_length': len(message)})
+            messages = self._create_messages(replies, message, history, profile_context, prompts)
+            with span("evaluator.grade", model = self._model, candidates = len(replies)) as grade_span:
+                response = await self._client.beta.chat.completions.parse(
+                    model = self._model,
+                    messages = messages,
+                    response_format = candidate_evaluations_model(len(replies))
+                )
+                grades = response.choices[0].message.parsed
+                grade_span.record_usage(response.usage, response.model)
+                if grades is None or len(grades.evaluations) != len(replies):
+                    raise EvaluatorAgentError(f"Expected {len(replies)} evaluations, got {len(grades.evaluations) if grades is not None else 'none'}")
+                index = self._choose_candidate(grades)
+                evaluations = grades.evaluations
+                grade_span.set(accepted = sum(1 for evaluation in evaluations if evaluation.is_acceptable), chosen = index)
+            for evaluation in evaluations:
+                EVALUATIONS.inc(verdict = "accepted" if evaluation.is_acceptable else "rejected")
+            logger.info("Candidate grading completed", extra = {
+                'accepted': sum(1 for evaluation in evaluations if evaluation.is_acceptable),
+                'chosen': index,
+                'estimated_prompt_tokens': estimate_message_tokens(messages),
+                **self._get_usage(response)
+            })
+            return index, evaluations
+        except SchedulerOverloadedError:
+            raise
+        except Exception as e:
+            raise self._to_evaluator_error(e)
+
+    def routing_stats(self: Self) -> dict:
+        return self._client.stats()
+
+    def update_profile(self: Self, name: str, profile: str):
+        # Both prompts are replaced in one assignment, so an evaluation never pairs two profiles
+        self._prompts = self.create_prompts(name, profile)
+
+    def memory_estimate(self: Self) -> int:
+        return sum(sys.getsizeof(prompt) for prompt in self._prompts)
+
+    def _choose_candidate(self: Self, grades: CandidateEvaluations) -> int:
+        evaluations = grades.evaluations
+        # best_candidate counts from one; a choice that points at a rejected candidate falls back to the first acceptable one
+        best = grades.best_candidate - 1
+        if 0 <= best < len(evaluations) and evaluations[best].is_acceptable:
+            return best
+        return next((index for index, evaluation in enumerate(evaluations) if evaluation.is_acceptable), 0)
+
+    def _to_evaluator_error(self: Self, error: Exception) -> EvaluatorAgentError:
+        if isinstance(error, EvaluatorAgentError):
+            return error
+        if isinstance(error, RateLimitError):
             logger.error("Rate limit exceeded during evaluation")
-            raise EvaluatorAgentError("Rate limit exceeded. Please try again later.")
-        except APITimeoutError:
+            return EvaluatorAgentError("Rate limit exceeded. Please try again later.")
+        if isinstance(error, APITimeoutError):
             logger.error("Request timed out during evaluation")
-            raise EvaluatorAgentError("Request timed out. Please try again.")
-        except APIError as e:
-            logger.error("OpenAI API error during evaluation", extra = {'error': str(e)})
-            raise EvaluatorAgentError(f"OpenAI API error: {str(e)}")
-        except Exception as e:
-            logger.error("Unexpected error in evaluation", extra = {'error': str(e)})
-            raise EvaluatorAgentError(f"Unexpected error in evaluation: {str(e)}")
+            return EvaluatorAgentError("Request timed out. Please try again.")
+        if isinstance(error, APIError):
+            logger.error("OpenAI API error during evaluation", extra = {'error': str(error)})
+            return EvaluatorAgentError(f"OpenAI API error: {str(error)}")
+        logger.error("Unexpected error in evaluation", extra = {'error': str(error)})
+        return EvaluatorAgentError(f"Unexpected error in evaluation: {str(error)}")
 
-    def _create_messages(self: Self, reply: str, message: str, history: any) -> any:
+    def create_prompts(self: Self, name: str, profile: str) -> tuple[str, str]:
+        # The full-profile and retrieval system prompts; callers that swap profiles themselves pass them to each call
+        if self._prompt_cache is None:
+            system_prompt = self.render_system_prompt(name, profile)
+        else:
+            system_prompt = self._prompt_cache.get("evaluator", content_hash(name, profile), lambda: self.render_system_prompt(name, profile))
+        return system_prompt, self.render_system_prompt(name, "Provided with each request below.")
+
+    def _get_usage(self: Self, response: any) -> dict:
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return {}
+        details = getattr(usage, "prompt_tokens_details", None)
+        return {
+            'prompt_tokens': usage.prompt_tokens,
+            'completion_tokens': usage.completion_tokens,
+            'cached_tokens': getattr(details, "cached_tokens", None)
+        }
+
+    def _create_messages(self: Self, reply: str | list[str], message: str, history: any, profile_context: str | None = None, prompts: tuple[str, str] | None = None) -> any:
         try:
-            messages = [{"role": "system", "content": self._system_prompt}]
-            messages.append({"role": "user", "content": self._get_user_prompt(self._name, reply, message, history)})
+            # The system prompt is byte-identical across calls so providers can cache the prefix;
+            # everything that varies per turn, including retrieved profile sections, follows it
+            full_prompt, retrieval_prompt = prompts or self._prompts
+            system_prompt = full_prompt if profile_context is None else retrieval_prompt
+            messages = [{"role": "system", "content": system_prompt}]
+            messages.append({"role": "user", "content": self._get_user_prompt(reply, message, history, profile_context)})
             logger.debug("Evaluation messages created", extra = {'message_count': len(messages)})
             return messages
         except Exception as e:
             logger.error("Error creating evaluation messages", extra = {'error': str(e)})
             raise EvaluatorAgentError(f"Error creating messages: {str(e)}")
-    
-    def _get_user_prompt(self: Self, name: str, reply: str, message: str, history: str) -> str:
-        return f"""
-            ## Conversation History:
-            {history}
 
-            ## User's Latest Message:
-            {message}
+    def _format_history(self: Self, history: any) -> str:
+        # Only role and content matter for grading, and only the latest exchanges
+        lines = []
+        for item in history[-self._history_messages:] if self._history_messages > 0 else []:
+            role = item.get("role")
+            content = item.get("content")
+            if role not in ("user", "assistant") or not content:
+                continue
+            text = " ".join((content if isinstance(content, str) else str(content)).split())
+            if len(text) > self._max_message_chars:
+                text = text[:self._max_message_chars] + "..."
+            lines.append(f"{'Visitor' if role == 'user' else 'Agent'}: {text}")
+        return "\n".join(lines) or "(none)"
 
-            ## Agent's Response to Evaluate:
-            {reply}
+    def _get_user_prompt(self: Self, reply: str | list[str], message: str, history: any, profile_context: str | None) -> str:
+        sections = []
+        if profile_context is not None:
+            sections.append(f"## Profile Information:\n{profile_context}")
+        sections.append(f"## Conversation History:\n{self._format_history(history)}")
+        sections.append(f"## User's Latest Message:\n{message}")
+        if isinstance(reply, str):
+            sections.append(f"## Agent's Response to Evaluate:\n{reply}")
+        else:
+            # Grading instructions go here rather than in the system prompt, which stays shared with single evaluations
+            candidates = "\n\n".join(f"### Candidate {index}:\n{candidate}" for index, candidate in enumerate(reply, start = 1))
+            sections.append(f"## Agent's Candidate Responses to Evaluate:\n{candidates}")
+            sections.append(
+                "## Grading Instructions:\n"
+                f"Evaluate each of the {len(reply)} candidates on its own against the criteria and return one evaluation per candidate, in order. "
+                "Set best_candidate to the number of the best acceptable candidate, or 0 if none is acceptable."
+            )
+        return "\n\n".join(sections)
 
-            Evaluate whether this response meets the professional standards for {name}'s website. Consider: Does it accurately represent the profile? Is the tone appropriate for potential employers/clients? Is it helpful and professional?
-        """
-    
-    def _get_system_prompt(self: Self, name: str, profile: str) -> str:
-        return f"""
+    @staticmethod
+    def render_system_prompt(name: str, profile: str) -> str:
+        return dedent("""
             You are an evaluator assessing whether an AI agent's response is acceptable for a professional website.
 
-            The agent represents {name} and responds to visitors asking about their professional background. 
+            The agent represents {name} and responds to visitors asking about their professional background.
 
             ## Evaluation Criteria:
             A response is ACCEPTABLE only if it meets ALL of these requirements:
@@ -90,14 +218,16 @@ class EvaluatorAgent:
             3. **In-scope**: Answers professional questions or politely redirects off-topic ones
             4. **Helpful**: Provides useful information or clear explanation when information isn't available
 
-            ## Profile Information:
-            {profile}
-
             ## Auto-REJECT if response:
             - Contains information not in the profile
             - Uses unprofessional or inappropriate tone
             - Ignores off-topic questions instead of redirecting
             - Simply says "no" without being helpful
 
+            Evaluate whether the response meets the professional standards for {name}'s website. Consider: Does it accurately represent the profile? Is the tone appropriate for potential employers/clients? Is it helpful and professional?
+
             Provide clear, specific feedback explaining your decision.
-        """
\ No newline at end of file
+
+            ## Profile Information:
+            {profile}
+        """).strip().format(name = name, profile = profile)
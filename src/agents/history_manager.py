@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from typing import Self
+from openai import AsyncOpenAI
+from storage.session_store import Session
+from utils.conversation import normalize_history, prefix_hashes
+from utils.tokens import estimate_message_tokens
+from utils.tracing import span
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class HistoryManager:
+    """Keeps the most recent turns verbatim and folds older ones into a rolling summary"""
+
+    def __init__(
+        self: Self,
+        max_turns: int = 6,
+        max_tokens: int = 2000,
+        summarize: bool = True,
+        model: str = "gpt-4o-mini",
+        summary_cache_size: int = 1024
+    ):
+        self._max_turns = max_turns
+        self._max_tokens = max_tokens
+        self._summarize = summarize
+        self._model = model
+        self._summary_cache_size = summary_cache_size
+        # Maps a hash of a conversation prefix to the summary of that prefix, so each
+        # session only ever summarizes the turns that fell out of the window since last time
+        self._summaries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        logger.info("HistoryManager initialized", extra = {'max_turns': max_turns, 'max_tokens': max_tokens, 'summarize': summarize})
+
+    async def prepare(self: Self, history: any, client: AsyncOpenAI, session: Session | None = None) -> list[dict]:
+        # A session already carries normalized messages, token counts and prefix hashes, so
+        # the work here stays proportional to the window instead of the whole conversation
+        if session is None:
+            messages = self.normalize(history)
+            token_counts = [estimate_message_tokens([message]) for message in messages]
+            hashes = None
+        else:
+            messages = session.messages
+            token_counts = session.token_counts
+            hashes = session.prefix_hashes
+        split = self._find_split(messages, token_counts)
+        if split == 0:
+            return list(messages)
+
+        recent = messages[split:]
+        prepared = recent
+        if self._summarize:
+            summary = await self._get_summary(messages[:split], client, hashes[:split] if hashes is not None else None)
+            if summary:
+                prepared = [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}] + recent
+
+        logger.info("History trimmed", extra = {
+            'messages_before': len(messages),
+            'messages_after': len(prepared),
+            'tokens_before': session.total_tokens if session is not None else sum(token_counts),
+            'tokens_after': estimate_message_tokens(prepared)
+        })
+        return prepared
+
+    @staticmethod
+    def normalize(history: any) -> list[dict]:
+        return normalize_history(history)
+
+    def _find_split(self: Self, messages: list[dict], token_counts: list[int]) -> int:
+        split = len(messages)
+        tokens = 0
+        turns = 0
+        while split > 0 and turns < self._max_turns:
+            start = split - 1
+            # Step back over a whole turn so a kept window never begins with an orphaned reply
+            while start > 0 and messages[start]["role"] != "user":
+                start -= 1
+            turn_tokens = sum(token_counts[start:split])
+            if turns > 0 and tokens + turn_tokens > self._max_tokens:
+                break
+            tokens += turn_tokens
+            turns += 1
+            split = start
+        return split
+
+    async def _get_summary(self: Self, older: list[dict], client: AsyncOpenAI, hashes: list[str] | None = None) -> str | None:
+        hashes = hashes if hashes is not None else prefix_hashes(older)
+        with self._lock:
+            cached_at = next((index for index in range(len(older), 0, -1) if hashes[index - 1] in self._summaries), 0)
+            previous_summary = self._summaries.get(hashes[cached_at - 1]) if cached_at else None
+            if previous_summary is not None:
+                self._summaries.move_to_end(hashes[cached_at - 1])
+
+        if cached_at == len(older):
+            return previous_summary
+
+        try:
+            summary = await self._summarize_turns(previous_summary, older[cached_at:], client)
+        except Exception as e:
+            # A missing summary only costs context, so the turn continues with the recent window
+            logger.warning("Failed to summarize history", extra = {'error': str(e)})
+            return previous_summary
+
+        with self._lock:
+            self._summaries[hashes[-1]] = summary
+            while len(self._summaries) > self._summary_cache_size:
+                self._summaries.popitem(last = False)
+        logger.debug("History summary updated", extra = {'summarized_messages': len(older) - cached_at})
+        return summary
+
+    async def _summarize_turns(self: Self, previous_summary: str | None, turns: list[dict], client: AsyncOpenAI) -> str:
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        with span("history.summarize", model = self._model, turns = len(turns)) as summarize:
+            response = await client.chat.completions.create(
+                model = self._model,
+                messages = [
+                    {"role": "system", "content": self._get_summary_prompt()},
+                    {"role": "user", "content": f"## Existing Summary:\n{previous_summary or 'None'}\n\n## New Turns:\n{transcript}"}
+                ]
+            )
+            summarize.record_usage(response.usage, response.model)
+        return response.choices[0].message.content
+
+    def _get_summary_prompt(self: Self) -> str:
+        return """
+            You maintain a running summary of a conversation between a website visitor and a professional's AI representative.
+            Update the existing summary with the new turns. Keep the visitor's name, contact details, role, company, interests
+            and any open questions or commitments. Be concise: at most 120 words, plain prose, no preamble.
+        """
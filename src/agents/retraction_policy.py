@@ -0,0 +1,37 @@
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Self
+from models.evaluation import Evaluation
+
+class RetractionMode(StrEnum):
+    # Keep the streamed draft even when the evaluator rejects it
+    NEVER = "never"
+    # Keep the draft visible while the correction is generated, then replace it
+    REPLACE = "replace"
+    # Hide the draft behind a placeholder until the correction is ready
+    HOLD = "hold"
+
+@dataclass(frozen = True)
+class RetractionPolicy:
+    """Decides which evaluator verdicts retract an already streamed draft"""
+    mode: RetractionMode = RetractionMode.REPLACE
+    # Only retract when the feedback mentions one of these terms; empty means every rejection
+    triggers: tuple[str, ...] = ()
+    placeholder: str = "Let me rephrase that..."
+
+    def should_retract(self: Self, evaluation: Evaluation) -> bool:
+        if evaluation.is_acceptable or self.mode == RetractionMode.NEVER:
+            return False
+        if not self.triggers:
+            return True
+        feedback = evaluation.feedback.lower()
+        return any(trigger in feedback for trigger in self.triggers)
+
+    @classmethod
+    def from_config(cls, mode: str, triggers: str = "") -> Self:
+        try:
+            retraction_mode = RetractionMode(mode.lower())
+        except ValueError:
+            raise ValueError(f"Unknown retraction mode: {mode}")
+        parsed_triggers = tuple(trigger.strip().lower() for trigger in triggers.split(",") if trigger.strip())
+        return cls(mode = retraction_mode, triggers = parsed_triggers)
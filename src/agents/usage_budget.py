@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Self
+from utils.usage import Usage
+
+class BudgetLevel(IntEnum):
+    # Each level keeps the reductions of the levels below it
+    NORMAL = 0
+    # Rejected replies are regenerated fewer times
+    FEWER_REEVALUATIONS = 1
+    # Only the most recent turns are sent, without a summary of the older ones
+    SHORTER_HISTORY = 2
+    # Replies are returned without evaluation
+    SKIP_EVALUATION = 3
+    # The session gets a polite cutoff instead of a reply
+    CUTOFF = 4
+
+@dataclass(frozen = True)
+class UsageBudget:
+    """Per-session token and cost limits that degrade a conversation step by step as it nears them"""
+    # Zero leaves the limit out
+    max_tokens: int = 0
+    max_cost: float = 0.0
+    # Fractions of the budget at which each reduction starts; the cutoff comes at the full budget
+    thresholds: tuple[float, float, float] = (0.5, 0.7, 0.85)
+    max_reevaluations: int = 1
+    history_turns: int = 2
+    cutoff_message: str = (
+        "Thanks for all your questions! I've shared as much as I can here. "
+        "If you'd like to keep talking, please leave your email and I'll get back to you directly."
+    )
+
+    def level(self: Self, usage: Usage) -> BudgetLevel:
+        spent = max(
+            usage.total_tokens / self.max_tokens if self.max_tokens > 0 else 0.0,
+            usage.cost / self.max_cost if self.max_cost > 0 else 0.0
+        )
+        if spent >= 1.0:
+            return BudgetLevel.CUTOFF
+        for level, threshold in zip((BudgetLevel.SKIP_EVALUATION, BudgetLevel.SHORTER_HISTORY, BudgetLevel.FEWER_REEVALUATIONS), reversed(self.thresholds)):
+            if spent >= threshold:
+                return level
+        return BudgetLevel.NORMAL
+
+    @classmethod
+    def from_config(cls, max_tokens: int, max_cost: float, thresholds: str, max_reevaluations: int, history_turns: int) -> Self:
+        try:
+            parsed_thresholds = tuple(float(threshold) for threshold in thresholds.split(","))
+        except ValueError:
+            raise ValueError(f"Invalid budget thresholds: {thresholds}")
+        if len(parsed_thresholds) != 3 or list(parsed_thresholds) != sorted(parsed_thresholds) or not 0 < parsed_thresholds[0] <= parsed_thresholds[-1] <= 1:
+            raise ValueError(f"Budget thresholds must be three increasing fractions of the budget: {thresholds}")
+        return cls(
+            max_tokens = max_tokens,
+            max_cost = max_cost,
+            thresholds = parsed_thresholds,
+            max_reevaluations = max_reevaluations,
+            history_turns = history_turns
+        )
@@ -0,0 +1,33 @@
+from dotenv import load_dotenv
+from utils.env import get_env_int, get_env_str
+from utils.logger import setup_logging
+
+import os
+import sys
+import logging
+
+# Entry point of the headless API. It only imports what the uvicorn supervisor needs; each
+# worker imports the app from api_app, so several workers do not pay for an extra agent stack.
+
+logger = logging.getLogger(__name__)
+
+def main():
+    import uvicorn
+
+    load_dotenv()
+    setup_logging()
+    required_env_vars = ['OPENAI_API_KEY', 'GEMINI_API_KEY']
+    missing_vars = [var for var in required_env_vars if not os.getenv(var)]
+    if missing_vars:
+        logger.error("Environment error", extra = {'error': f"Missing required environment variables: {', '.join(missing_vars)}"})
+        sys.exit(1)
+
+    host = get_env_str('API_HOST', '127.0.0.1')
+    port = get_env_int('API_PORT', 8000)
+    workers = get_env_int('API_WORKERS', 1)
+    logger.info("Serving chat API", extra = {'host': host, 'port': port, 'workers': workers})
+    # Workers import the app factory by name, since each one runs in its own process
+    uvicorn.run("api_app:create_app", factory = True, host = host, port = port, workers = workers, log_level = "warning")
+
+if __name__ == "__main__":
+    main()
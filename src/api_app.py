@@ -0,0 +1,120 @@
+from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from agent_factory import create_agent_resources, create_lead_store, create_scheduler, create_served_agents, create_session_store, warm_up_clients
+from agents.chat_agent import ChatAgent, ChatAgentError
+from models.chat import ChatRequest, ChatResponse
+from profiles.profile_catalog import ProfileCatalogError, UnknownProfileError
+from utils.env import get_env_bool, get_env_str
+from utils.logger import setup_logging
+from utils.metrics import REGISTRY
+
+import json
+import logging
+import uuid
+
+# The headless app: the chat agent behind JSON and Server-Sent Events endpoints, for site
+# widgets and other clients. Gradio is never imported, so workers start faster and stay smaller.
+
+logger = logging.getLogger(__name__)
+
+def create_app() -> FastAPI:
+    # Called once per uvicorn worker, so every worker builds its own agents and connection pools
+    load_dotenv()
+    setup_logging()
+    resources = create_agent_resources(create_lead_store(), create_scheduler(), create_session_store())
+    agent, pool = create_served_agents(resources)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if get_env_bool('WARMUP_ENABLED', True):
+            await warm_up_clients(resources)
+        yield
+        await resources.clients.aclose()
+
+    app = FastAPI(title = "Talk to My CV API", lifespan = lifespan, docs_url = None, redoc_url = None)
+    origins = get_env_str('API_CORS_ORIGINS', 'none')
+    if origins != 'none':
+        # Lets a widget on another origin call the API from the browser
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins = [origin.strip() for origin in origins.split(",")],
+            allow_methods = ["GET", "POST"],
+            allow_headers = ["Content-Type", get_env_str('PROFILE_HEADER', 'x-profile')]
+        )
+
+    async def get_agent(request: Request, body: ChatRequest) -> tuple[ChatAgent, str, str | None]:
+        # Without a session id the client gets a new one, so budgets and server-side history apply to it too
+        session_id = body.session_id or uuid.uuid4().hex
+        if pool is None:
+            return agent, session_id, f"api:{session_id}"
+        key = request.headers.get(get_env_str('PROFILE_HEADER', 'x-profile')) or body.profile or request.query_params.get("profile")
+        if not key:
+            default = get_env_str('DEFAULT_PROFILE', 'none')
+            key = None if default == 'none' else default
+        if key is None:
+            raise HTTPException(status_code = 404, detail = "No profile selected")
+        try:
+            # Sessions are keyed per profile so one client can talk to several people
+            return await pool.get(key), session_id, f"api:{key}:{session_id}"
+        except UnknownProfileError as e:
+            raise HTTPException(status_code = 404, detail = str(e))
+        except ProfileCatalogError as e:
+            logger.error("Failed to load profile", extra = {'profile_key': key, 'error': str(e)})
+            raise HTTPException(status_code = 503, detail = "Profile unavailable")
+
+    def get_history(body: ChatRequest) -> list[dict] | None:
+        # An empty history with a kept session id continues the conversation stored on the server
+        if not body.history and body.session_id and resources.session_store is not None:
+            return None
+        return [message.model_dump() for message in body.history]
+
+    @app.get("/health")
+    def health() -> dict:
+        return {'status': "ok"}
+
+    @app.get("/metrics", response_class = PlainTextResponse)
+    def metrics() -> str:
+        return REGISTRY.render()
+
+    @app.post("/api/chat", response_model = ChatResponse)
+    async def chat(request: Request, body: ChatRequest) -> ChatResponse:
+        chat_agent, session_id, agent_session_id = await get_agent(request, body)
+        try:
+            reply = await chat_agent.achat(body.message, get_history(body), agent_session_id)
+        except ChatAgentError as e:
+            raise HTTPException(status_code = 502, detail = str(e))
+        return ChatResponse(reply = reply, session_id = session_id)
+
+    @app.post("/api/chat/stream")
+    async def chat_stream(request: Request, body: ChatRequest) -> StreamingResponse:
+        chat_agent, session_id, agent_session_id = await get_agent(request, body)
+        events = stream_events(chat_agent.astream_chat(body.message, get_history(body), agent_session_id), session_id)
+        # Proxies such as nginx would otherwise buffer the stream until it ends
+        return StreamingResponse(events, media_type = "text/event-stream", headers = {'Cache-Control': "no-cache", 'X-Accel-Buffering': "no"})
+
+    logger.info("API app created", extra = {'profiles': pool is not None, 'cors_origins': origins})
+    return app
+
+async def stream_events(replies: AsyncIterator[str], session_id: str) -> AsyncIterator[str]:
+    # The agent yields the whole reply so far; clients get only what was added, or the whole reply
+    # again when a rejected draft is replaced
+    sent = ""
+    try:
+        yield format_event("session", {'session_id': session_id})
+        async for reply in replies:
+            if reply.startswith(sent):
+                if len(reply) > len(sent):
+                    yield format_event("delta", {'text': reply[len(sent):]})
+            else:
+                yield format_event("replace", {'text': reply})
+            sent = reply
+        yield format_event("done", {'reply': sent, 'session_id': session_id})
+    except ChatAgentError as e:
+        yield format_event("error", {'detail': str(e)})
+
+def format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii = False)}\n\n"
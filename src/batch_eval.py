@@ -0,0 +1,305 @@
+"""Replays a corpus of visitor conversations through the chat agent and compares how runs fared.
+
+Usage (from src/):
+    python batch_eval.py run --output ../data/eval/baseline.jsonl
+    python batch_eval.py run --output ../data/eval/mock.jsonl --mock-url http://127.0.0.1:8900
+    python batch_eval.py report ../data/eval/baseline.jsonl ../data/eval/new-prompt.jsonl
+
+The corpus holds one {"id": ..., "turns": [...]} conversation per line. Every finished
+conversation is appended to the output file, so an interrupted run resumes where it stopped
+when started again with the same output; conversations that failed are run again.
+The agent is configured through the same environment variables as the app.
+"""
+from dotenv import load_dotenv
+from dataclasses import dataclass
+from pathlib import Path
+from agent_factory import create_agent, create_agent_resources, create_profile_ingestor, create_scheduler
+from profiles.profile_ingestion import ProfileIngestionError
+from utils.logger import setup_logging
+from utils.tracing import Span, collect_spans
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+class BatchEvalError(Exception):
+    """Base exception class for batch evaluation errors"""
+    pass
+
+@dataclass(frozen = True)
+class Conversation:
+    id: str
+    turns: list[str]
+
+def load_corpus(path: str) -> list[Conversation]:
+    conversations = []
+    try:
+        with open(path, "r", encoding = "utf-8") as file:
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                turns = entry.get("turns") or [entry["question"]]
+                conversations.append(Conversation(str(entry.get("id", f"line-{number}")), [str(turn) for turn in turns]))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise BatchEvalError(f"Failed to read corpus {path}: {str(e)}")
+    if len({conversation.id for conversation in conversations}) != len(conversations):
+        raise BatchEvalError(f"Conversation ids in {path} must be unique")
+    return conversations
+
+def load_results(path: str) -> dict[str, dict]:
+    # Later records win, so a conversation that failed and was run again counts once
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, "r", encoding = "utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may be cut short if the previous run was killed mid-write
+                continue
+            results[record["id"]] = record
+    return results
+
+def summarize_turn(spans: list[Span], question: str, reply: str | None, latency: float, error: str | None) -> dict:
+    turn = next((item for item in reversed(spans) if item.name == "chat.turn"), None)
+    attributes = turn.attributes if turn is not None else {}
+    tokens = {}
+    for item in spans:
+        if 'prompt_tokens' in item.attributes:
+            usage = tokens.setdefault(item.name, {'prompt': 0, 'completion': 0})
+            usage['prompt'] += item.attributes['prompt_tokens'] or 0
+            usage['completion'] += item.attributes.get('completion_tokens') or 0
+    first_token_ms = attributes.get('first_token_ms')
+    return {
+        'question': question,
+        'reply': reply,
+        'latency_s': round(latency, 4),
+        'ttft_s': first_token_ms / 1000 if first_token_ms is not None else None,
+        'outcome': "error" if error is not None else attributes.get('outcome', "completed"),
+        'verdict': attributes.get('verdict'),
+        'retries': attributes.get('retries', 0),
+        'tokens': tokens,
+        'cost': attributes.get('turn_cost', 0.0),
+        'error': error
+    }
+
+def append_record(file: any, record: dict):
+    file.write(json.dumps(record, ensure_ascii = False) + "\n")
+    file.flush()
+    os.fsync(file.fileno())
+
+async def run_batch(agent: any, conversations: list[Conversation], output: str, concurrency: int, stream: bool) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    total = len(conversations)
+    finished = 0
+
+    async def run_turn(message: str, history: list[dict]) -> str:
+        if not stream:
+            return await agent.achat(message, history)
+        reply = ""
+        async for reply in agent.astream_chat(message, history):
+            pass
+        return reply
+
+    async def run_conversation(conversation: Conversation, file: any):
+        nonlocal finished
+        async with semaphore:
+            history = []
+            turns = []
+            for message in conversation.turns:
+                start = time.perf_counter()
+                reply, error = None, None
+                # Each turn collects its own spans, which carry the verdict, retries and token usage
+                with collect_spans() as spans:
+                    try:
+                        reply = await run_turn(message, history)
+                    except Exception as e:
+                        error = str(e)
+                turns.append(summarize_turn(spans, message, reply, time.perf_counter() - start, error))
+                if error is not None:
+                    break
+                history.extend([{"role": "user", "content": message}, {"role": "assistant", "content": reply}])
+
+        record = {'id': conversation.id, 'turns': turns, 'error': next((turn['error'] for turn in turns if turn['error']), None)}
+        # Written as soon as the conversation ends, so a crash loses at most the conversations in flight;
+        # the fsync runs in a thread so other conversations keep going, and the lock keeps lines whole
+        async with write_lock:
+            await asyncio.to_thread(append_record, file, record)
+        finished += 1
+        print(f"\r{finished}/{total} conversations", end = "", file = sys.stderr, flush = True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok = True)
+    with open(output, "a", encoding = "utf-8") as file:
+        await asyncio.gather(*(run_conversation(conversation, file) for conversation in conversations))
+    print(file = sys.stderr)
+    return finished
+
+def percentile(values: list[float], percent: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def summarize_run(results: dict[str, dict]) -> dict:
+    turns = [turn for record in results.values() for turn in record['turns']]
+    completed = [turn for turn in turns if turn['error'] is None]
+    # Cached and skipped turns never reached the evaluator, so they do not count towards acceptance
+    evaluated = [turn for turn in completed if turn['verdict'] in ("accepted", "rejected")]
+    latencies = [turn['latency_s'] for turn in completed]
+    first_tokens = [turn['ttft_s'] for turn in completed if turn['ttft_s'] is not None]
+    prompt_tokens = sum(usage['prompt'] for turn in completed for usage in turn['tokens'].values())
+    completion_tokens = sum(usage['completion'] for turn in completed for usage in turn['tokens'].values())
+    cost = sum(turn.get('cost', 0.0) for turn in completed)
+    evaluator_tokens = sum(usage['prompt'] + usage['completion'] for turn in completed for name, usage in turn['tokens'].items() if name.startswith("evaluator."))
+    return {
+        'conversations': len(results),
+        'failed_conversations': sum(1 for record in results.values() if record['error'] is not None),
+        'turns': len(turns),
+        'evaluated_turns': len(evaluated),
+        'first_pass_acceptance': sum(1 for turn in evaluated if turn['verdict'] == "accepted" and turn['retries'] == 0) / len(evaluated) if evaluated else None,
+        'final_acceptance': sum(1 for turn in evaluated if turn['verdict'] == "accepted") / len(evaluated) if evaluated else None,
+        'reruns_per_turn': sum(turn['retries'] for turn in completed) / len(completed) if completed else None,
+        'turns_with_reruns': sum(1 for turn in completed if turn['retries'] > 0),
+        'latency_mean_s': sum(latencies) / len(latencies) if latencies else None,
+        'latency_p50_s': percentile(latencies, 50),
+        'latency_p95_s': percentile(latencies, 95),
+        'ttft_p50_s': percentile(first_tokens, 50),
+        'prompt_tokens_per_turn': prompt_tokens / len(completed) if completed else None,
+        'completion_tokens_per_turn': completion_tokens / len(completed) if completed else None,
+        'cost_per_turn_usd': cost / len(completed) if completed else None,
+        'total_cost_usd': cost,
+        'evaluator_token_share': evaluator_tokens / (prompt_tokens + completion_tokens) if prompt_tokens + completion_tokens else None
+    }
+
+_REPORT_FORMATS = {
+    'first_pass_acceptance': "{:.1%}",
+    'final_acceptance': "{:.1%}",
+    'evaluator_token_share': "{:.1%}",
+    'reruns_per_turn': "{:.3f}",
+    'latency_mean_s': "{:.3f}",
+    'latency_p50_s': "{:.3f}",
+    'latency_p95_s': "{:.3f}",
+    'ttft_p50_s': "{:.3f}",
+    'prompt_tokens_per_turn': "{:.0f}",
+    'completion_tokens_per_turn': "{:.0f}",
+    'cost_per_turn_usd': "{:.6f}",
+    'total_cost_usd': "{:.4f}"
+}
+
+def render_report(summaries: dict[str, dict]) -> str:
+    # The first run is the baseline; every other run shows its difference to it
+    labels = list(summaries)
+    baseline = summaries[labels[0]]
+    lines = [
+        "| metric | " + " | ".join(labels) + " |",
+        "|---|" + "---|" * len(labels)
+    ]
+    for metric in baseline:
+        value_format = _REPORT_FORMATS.get(metric, "{}")
+        cells = []
+        for label in labels:
+            value = summaries[label][metric]
+            cell = "n/a" if value is None else value_format.format(value)
+            base = baseline[metric]
+            if label != labels[0] and value is not None and base is not None and value != base:
+                delta = value - base
+                cell += f" ({'+' if delta > 0 else '-'}{value_format.format(abs(delta))})"
+            cells.append(cell)
+        lines.append(f"| {metric} | " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+def configure_mock(mock_url: str):
+    os.environ["OPENAI_BASE_URL"] = f"{mock_url}/openai/v1"
+    os.environ["GEMINI_BASE_URL"] = f"{mock_url}/gemini/"
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    os.environ.setdefault("GEMINI_API_KEY", "mock")
+    # The mock has no quota, so the scheduler's rate budgets would only slow the run down
+    for provider in ("OPENAI", "GEMINI"):
+        os.environ.setdefault(f"{provider}_REQUESTS_PER_MINUTE", "0")
+        os.environ.setdefault(f"{provider}_TOKENS_PER_MINUTE", "0")
+
+async def run(args: argparse.Namespace) -> dict:
+    conversations = load_corpus(args.corpus)
+    done = {key for key, record in load_results(args.output).items() if record['error'] is None}
+    pending = [conversation for conversation in conversations if conversation.id not in done]
+    logger.info("Batch evaluation started", extra = {'corpus': args.corpus, 'output': args.output, 'conversations': len(conversations), 'resumed': len(done)})
+    print(f"{len(pending)} of {len(conversations)} conversations to run ({len(done)} already in {args.output})", file = sys.stderr)
+
+    if pending:
+        # No lead store and no session store: evaluation runs must not record leads or touch live sessions
+        resources = create_agent_resources(None, create_scheduler())
+        artifact = create_profile_ingestor(resources.prompt_cache).ingest(args.name, args.profile)
+        agent = create_agent(artifact.name, artifact.text, resources = resources)
+        try:
+            await run_batch(agent, pending, args.output, args.concurrency, args.stream)
+        finally:
+            await resources.clients.aclose()
+
+    # Only conversations from this corpus are reported, even if the output holds older ones
+    ids = {conversation.id for conversation in conversations}
+    return {key: record for key, record in load_results(args.output).items() if key in ids}
+
+def main():
+    # Loaded before the parser, whose defaults read the environment
+    load_dotenv()
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    run_parser = commands.add_parser("run", help = "run a corpus through the agent, resuming an earlier run with the same output")
+    run_parser.add_argument("--corpus", default = str(DATA_DIR / "eval_corpus.jsonl"), help = "JSONL file with one {\"id\", \"turns\"} conversation per line")
+    run_parser.add_argument("--output", required = True, help = "JSONL file the results are appended to")
+    run_parser.add_argument("--name", default = str(DATA_DIR / "name.txt"))
+    run_parser.add_argument("--profile", default = os.getenv('PROFILE_SOURCE', str(DATA_DIR / "profile.md")), help = "markdown profile or PDF resume")
+    run_parser.add_argument("--concurrency", type = int, default = 8)
+    run_parser.add_argument("--stream", action = "store_true", help = "use the streaming entry point and report time to first token")
+    run_parser.add_argument("--cache", action = "store_true", help = "keep the response cache enabled; off by default so repeated questions are answered again")
+    run_parser.add_argument("--mock-url", help = "send model calls to the mock server at this URL instead of the providers")
+
+    report_parser = commands.add_parser("report", help = "compare the results of one or more runs, the first being the baseline")
+    report_parser.add_argument("results", nargs = "+", help = "JSONL result files written by run")
+
+    for command_parser in (run_parser, report_parser):
+        command_parser.add_argument("--report", help = "also write the markdown report to this file")
+        command_parser.add_argument("--json", action = "store_true", help = "print the summaries as JSON")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        if args.mock_url:
+            configure_mock(args.mock_url)
+        os.environ["RESPONSE_CACHE_ENABLED"] = "true" if args.cache else "false"
+    os.environ.setdefault("LOG_CONSOLE", "false")
+    setup_logging()
+
+    try:
+        if args.command == "run":
+            summaries = {Path(args.output).stem: summarize_run(asyncio.run(run(args)))}
+        else:
+            summaries = {Path(path).stem: summarize_run(load_results(path)) for path in args.results}
+    except KeyboardInterrupt:
+        print("\nInterrupted; finished conversations are saved, run the same command again to resume", file = sys.stderr)
+        sys.exit(130)
+    except (BatchEvalError, ProfileIngestionError) as e:
+        logger.error("Batch evaluation failed", extra = {'error': str(e)})
+        print(str(e), file = sys.stderr)
+        sys.exit(1)
+
+    report = json.dumps(summaries, indent = 2) if args.json else render_report(summaries)
+    print(report)
+    if args.report:
+        with open(args.report, "w", encoding = "utf-8") as file:
+            file.write(report + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+from dataclasses import dataclass
+from typing import Callable, Self
+from openai import APIConnectionError, AsyncOpenAI, DefaultAsyncHttpxClient
+from llm.scheduler import RequestScheduler, ScheduledClient
+from utils.metrics import HTTP_CONNECTIONS, HTTP_CONNECT_DURATION
+
+import asyncio
+import httpx
+import importlib.util
+import logging
+import os
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+_GEMINI_BASE_URL = 'https://generativelanguage.googleapis.com/v1beta/openai/'
+
+@dataclass(frozen = True)
+class TransportOptions:
+    """Connection pool and timeout settings of the HTTP transport shared by a provider's clients"""
+    max_connections: int = 64
+    max_keepalive_connections: int = 32
+    keepalive_expiry: float = 60
+    http2: bool = True
+    connect_timeout: float = 5
+    read_timeout: float = 60
+    write_timeout: float = 10
+    pool_timeout: float = 10
+
+class TrackedTransport(httpx.AsyncHTTPTransport):
+    """Pooled transport that records whether each request opened a connection or reused a pooled one"""
+
+    def __init__(self: Self, provider: str, options: TransportOptions):
+        http2 = options.http2 and importlib.util.find_spec("h2") is not None
+        if options.http2 and not http2:
+            logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1", extra = {'provider': provider})
+        super().__init__(
+            http2 = http2,
+            limits = httpx.Limits(
+                max_connections = options.max_connections,
+                max_keepalive_connections = options.max_keepalive_connections,
+                keepalive_expiry = options.keepalive_expiry
+            )
+        )
+        self._provider = provider
+        self._stats = {'requests': 0, 'opened': 0, 'reused': 0, 'connect_seconds': 0.0}
+        self._lock = threading.Lock()
+
+    async def handle_async_request(self: Self, request: httpx.Request) -> httpx.Response:
+        # httpcore reports connection setup through the trace extension, which only fires for new connections
+        connect = {'start': None, 'end': None}
+        parent = request.extensions.get("trace")
+
+        async def trace(event: str, info: dict):
+            if event == "connection.connect_tcp.started":
+                connect['start'] = time.perf_counter()
+            elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                connect['end'] = time.perf_counter()
+            if parent is not None:
+                await parent(event, info)
+
+        request.extensions["trace"] = trace
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            self._record(connect['start'], connect['end'])
+
+    def stats(self: Self) -> dict:
+        return self.combine([self])
+
+    @staticmethod
+    def combine(transports: list["TrackedTransport"]) -> dict:
+        stats = {'requests': 0, 'opened': 0, 'reused': 0, 'connect_seconds': 0.0}
+        for transport in transports:
+            with transport._lock:
+                for key, value in transport._stats.items():
+                    stats[key] += value
+        connections = stats['opened'] + stats['reused']
+        stats['reuse_rate'] = stats['reused'] / connections if connections else 0.0
+        stats['average_connect_seconds'] = stats['connect_seconds'] / stats['opened'] if stats['opened'] else 0.0
+        return stats
+
+    def _record(self: Self, start: float | None, end: float | None):
+        opened = start is not None and end is not None
+        with self._lock:
+            self._stats['requests'] += 1
+            if opened:
+                self._stats['opened'] += 1
+                self._stats['connect_seconds'] += end - start
+            elif start is None:
+                self._stats['reused'] += 1
+        HTTP_CONNECTIONS.inc(provider = self._provider, event = "opened" if opened else "reused" if start is None else "failed")
+        if opened:
+            HTTP_CONNECT_DURATION.observe(end - start, provider = self._provider)
+
+class LoopLocalClient:
+    """Hands each event loop its own AsyncOpenAI client, since pooled httpx connections are bound to the loop that opened them"""
+
+    def __init__(self: Self, create: Callable[[], AsyncOpenAI]):
+        self._create = create
+        self._clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI] = weakref.WeakKeyDictionary()
+        self._default: AsyncOpenAI | None = None
+        self._lock = threading.Lock()
+
+    def current(self: Self) -> AsyncOpenAI:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            if loop is None:
+                if self._default is None:
+                    self._default = self._create()
+                return self._default
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._clients[loop] = self._create()
+            return client
+
+    async def close(self: Self):
+        # Only the running loop's client can close its connections
+        with self._lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    def with_options(self: Self, **options: any) -> "LoopLocalClient":
+        # Derived per loop from that loop's client, so the copies share its connection pool
+        return LoopLocalClient(lambda: self.current().with_options(**options))
+
+    def __getattr__(self: Self, name: str) -> any:
+        # Resolved on every access, so calls made inside a coroutine use the client of its loop
+        return getattr(self.current(), name)
+
+class ClientFactory:
+    """Builds one pooled, tuned HTTP client per provider and hands out model clients that share it"""
+
+    def __init__(self: Self, options: TransportOptions | None = None, scheduler: RequestScheduler | None = None):
+        self._options = options or TransportOptions()
+        self._scheduler = scheduler
+        self._transports: dict[str, list[TrackedTransport]] = {}
+        self._clients: dict[str, LoopLocalClient] = {}
+        self._lock = threading.Lock()
+        logger.info("ClientFactory initialized", extra = {'options': self._options.__dict__, 'scheduled': scheduler is not None})
+
+    def client(self: Self, provider: str, read_timeout: float | None = None) -> LoopLocalClient | ScheduledClient:
+        client = self._get_client(provider)
+        if read_timeout is not None and read_timeout != self._options.read_timeout:
+            client = client.with_options(timeout = self._timeout(read_timeout))
+        return client if self._scheduler is None else self._scheduler.wrap(provider, client)
+
+    async def warm_up(self: Self, connections: int = 2, prime_models: dict[str, str] | None = None, timeout: float = 10) -> dict:
+        # Opens pooled connections, so the first visitors do not pay for TCP and TLS handshakes;
+        # a one-token completion per provider also warms the provider side when requested
+        with self._lock:
+            providers = list(self._clients)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self._warm_up_provider(provider, connections, (prime_models or {}).get(provider), timeout) for provider in providers))
+        report = dict(zip(providers, results))
+        logger.info("Clients warmed up", extra = {'duration_ms': round((time.perf_counter() - start) * 1000, 1), 'providers': report})
+        return report
+
+    def stats(self: Self) -> dict:
+        with self._lock:
+            transports = {provider: list(items) for provider, items in self._transports.items()}
+        return {provider: TrackedTransport.combine(items) for provider, items in transports.items()}
+
+    async def aclose(self: Self):
+        # Closes the clients of the running loop; those of other loops go with their loop
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            await client.close()
+
+    def _get_client(self: Self, provider: str) -> LoopLocalClient:
+        with self._lock:
+            client = self._clients.get(provider)
+            if client is None:
+                self._transports[provider] = []
+                client = self._clients[provider] = LoopLocalClient(lambda: self._create_client(provider))
+            return client
+
+    def _create_client(self: Self, provider: str) -> AsyncOpenAI:
+        # One pool per provider and event loop; their statistics are reported together
+        transport = TrackedTransport(provider, self._options)
+        http_client = DefaultAsyncHttpxClient(transport = transport, timeout = self._timeout(self._options.read_timeout))
+        with self._lock:
+            self._transports[provider].append(transport)
+        return _create_openai_client(provider, self._scheduler is not None, http_client)
+
+    def _timeout(self: Self, read_timeout: float) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect = self._options.connect_timeout,
+            read = read_timeout,
+            write = self._options.write_timeout,
+            pool = self._options.pool_timeout
+        )
+
+    async def _warm_up_provider(self: Self, provider: str, connections: int, model: str | None, timeout: float) -> dict:
+        client = self._clients[provider]
+        result = {'connections': 0, 'primed': False}
+        try:
+            async with asyncio.timeout(timeout):
+                # Concurrent requests make the pool open several connections; any status will do
+                responses = await asyncio.gather(
+                    *(client.get("models", cast_to = httpx.Response, options = {'max_retries': 0}) for _ in range(connections)),
+                    return_exceptions = True
+                )
+                result['connections'] = sum(1 for response in responses if not isinstance(response, APIConnectionError))
+                if model is not None:
+                    await client.chat.completions.create(model = model, messages = [{"role": "user", "content": "Hi"}], max_tokens = 1)
+                    result['primed'] = True
+        except Exception as e:
+            # A failed warm-up only means the first visitors pay for the handshakes
+            logger.warning("Client warm-up failed", extra = {'provider': provider, 'error': str(e)})
+            result['error'] = str(e)
+        return result
+
+def create_client(provider: str, scheduler: RequestScheduler | None = None, http_client: httpx.AsyncClient | None = None) -> AsyncOpenAI | LoopLocalClient | ScheduledClient:
+    # A given HTTP client stays with the loop of its caller; otherwise each loop gets its own
+    if http_client is not None:
+        client = _create_openai_client(provider, scheduler is not None, http_client)
+    else:
+        client = LoopLocalClient(lambda: _create_openai_client(provider, scheduler is not None, None))
+    return client if scheduler is None else scheduler.wrap(provider, client)
+
+def _create_openai_client(provider: str, scheduled: bool, http_client: httpx.AsyncClient | None) -> AsyncOpenAI:
+    # The scheduler owns retries, so the client's own retries are turned off under it
+    options = {'max_retries': 0} if scheduled else {}
+    if http_client is not None:
+        options['http_client'] = http_client
+    if provider == "openai":
+        return AsyncOpenAI(**options)
+    if provider == "gemini":
+        return AsyncOpenAI(
+            api_key = os.getenv('GEMINI_API_KEY'),
+            base_url = os.getenv('GEMINI_BASE_URL', _GEMINI_BASE_URL),
+            **options
+        )
+    raise ValueError(f"Unknown provider: {provider}")
@@ -0,0 +1,255 @@
+from collections import deque
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import AsyncIterator, Awaitable, Callable, Self, TypeVar
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI
+from llm.scheduler import SchedulerOverloadedError
+from utils.metrics import ROUTER_FAILOVERS, ROUTER_HEDGES
+from utils.tracing import record_usage
+
+import asyncio
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_FAILOVER_ERRORS = (APIConnectionError, APITimeoutError, SchedulerOverloadedError)
+
+class ModelRouterError(Exception):
+    """Base exception class for ModelRouter errors"""
+    pass
+
+@dataclass(frozen = True)
+class Route:
+    """A model on a provider; the client may be a plain AsyncOpenAI or a scheduled one, already bound to the route's read timeout"""
+    provider: str
+    client: AsyncOpenAI
+    model: str
+    read_timeout: float | None = None
+
+class LatencyTracker:
+    """Rolling window of recent latencies used to pick the hedging delay"""
+
+    def __init__(self: Self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen = window)
+        self._lock = threading.Lock()
+
+    def record(self: Self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self: Self, percent: float, min_samples: int) -> float | None:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+class ModelRouter:
+    """Sends completions to an ordered list of routes, hedging slow requests and failing over on provider errors"""
+
+    def __init__(
+        self: Self,
+        name: str,
+        routes: list[Route],
+        hedge: bool = False,
+        hedge_percentile: float = 95,
+        hedge_budget: float = 0.05,
+        hedge_to_fallback: bool = False,
+        hedge_min_delay: float = 1.0,
+        min_samples: int = 20,
+        failover: bool = True
+    ):
+        if not routes:
+            raise ModelRouterError("A router needs at least one route")
+        self._name = name
+        self._routes = routes
+        self._hedge = hedge
+        self._hedge_percentile = hedge_percentile
+        self._hedge_budget = hedge_budget
+        self._hedge_to_fallback = hedge_to_fallback and len(routes) > 1
+        self._hedge_min_delay = hedge_min_delay
+        self._min_samples = min_samples
+        self._failover = failover
+        # Streams are hedged on time to first chunk, which is not comparable to full completions
+        self._latencies = {"completion": LatencyTracker(), "stream": LatencyTracker()}
+        # Losing completions are billed too; discarded streams and cancelled requests report no usage
+        self._stats = {'requests': 0, 'hedges': 0, 'hedge_wins': 0, 'failovers': 0, 'discarded': 0, 'discarded_streams': 0, 'cancelled': 0, 'discarded_tokens': 0}
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions = SimpleNamespace(create = self._create))
+        self.beta = SimpleNamespace(chat = SimpleNamespace(completions = SimpleNamespace(parse = self._parse)))
+        logger.info("ModelRouter initialized", extra = {
+            'router': name,
+            'routes': [f"{route.provider}:{route.model}" for route in routes],
+            'read_timeouts': [route.read_timeout for route in routes],
+            'hedge': hedge,
+            'hedge_percentile': hedge_percentile,
+            'hedge_budget': hedge_budget,
+            'failover': failover
+        })
+
+    @property
+    def model(self: Self) -> str:
+        return self._routes[0].model
+
+    @property
+    def routes(self: Self) -> list[Route]:
+        return list(self._routes)
+
+    def stats(self: Self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['hedge_rate'] = stats['hedges'] / stats['requests'] if stats['requests'] else 0.0
+        stats['hedge_win_rate'] = stats['hedge_wins'] / stats['hedges'] if stats['hedges'] else 0.0
+        stats['hedge_delay'] = {kind: self._get_hedge_delay(kind) for kind in self._latencies}
+        return stats
+
+    async def _create(self: Self, **kwargs: any) -> any:
+        if kwargs.get("stream"):
+            return await self._route("stream", lambda route: self._open_stream(route, kwargs))
+        return await self._route("completion", lambda route: route.client.chat.completions.create(**self._for_route(route, kwargs)))
+
+    async def _parse(self: Self, **kwargs: any) -> any:
+        return await self._route("completion", lambda route: route.client.beta.chat.completions.parse(**self._for_route(route, kwargs)))
+
+    async def _route(self: Self, kind: str, request: Callable[[Route], Awaitable[T]]) -> T:
+        with self._lock:
+            self._stats['requests'] += 1
+        routes = self._routes if self._failover else self._routes[:1]
+        for index, route in enumerate(routes):
+            try:
+                return await self._hedged(kind, route, request)
+            except Exception as e:
+                if index == len(routes) - 1 or not self._should_fail_over(e):
+                    raise
+                next_route = routes[index + 1]
+                with self._lock:
+                    self._stats['failovers'] += 1
+                ROUTER_FAILOVERS.inc(router = self._name, source = route.provider, target = next_route.provider)
+                logger.warning("Failing over to next route", extra = {
+                    'router': self._name,
+                    'from_route': f"{route.provider}:{route.model}",
+                    'to_route': f"{next_route.provider}:{next_route.model}",
+                    'error': str(e)
+                })
+
+    async def _hedged(self: Self, kind: str, route: Route, request: Callable[[Route], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(request(route))
+        tasks = {primary}
+        try:
+            delay = self._get_hedge_delay(kind) if self._hedge else None
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout = delay)
+                if not done and self._reserve_hedge():
+                    hedge_route = self._routes[1] if self._hedge_to_fallback and route is self._routes[0] else route
+                    logger.info("Hedging slow request", extra = {'router': self._name, 'kind': kind, 'delay': round(delay, 3), 'hedge_route': hedge_route.provider})
+                    tasks.add(asyncio.ensure_future(request(hedge_route)))
+
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if len(tasks) > 1:
+                        ROUTER_HEDGES.inc(router = self._name, winner = "primary" if task is primary else "hedge")
+                        if task is not primary:
+                            with self._lock:
+                                self._stats['hedge_wins'] += 1
+                    # Recorded from the primary's start even when the hedge wins, so the threshold follows the real tail
+                    self._latencies[kind].record(time.perf_counter() - start)
+                    for other in done - {task}:
+                        if other.exception() is None:
+                            await self._discard(kind, other.result())
+                    return self._unwrap(kind, task.result())
+            if len(tasks) > 1:
+                ROUTER_HEDGES.inc(router = self._name, winner = "none")
+            raise error
+        finally:
+            # The loser is cancelled; one that finished in the meantime still has its stream closed
+            losers = [task for task in tasks if not task.done()]
+            for task in losers:
+                task.cancel()
+            for task in losers:
+                try:
+                    result = await task
+                except asyncio.CancelledError:
+                    with self._lock:
+                        self._stats['cancelled'] += 1
+                    continue
+                except BaseException:
+                    continue
+                await self._discard(kind, result)
+
+    async def _open_stream(self: Self, route: Route, kwargs: dict) -> tuple[AsyncIterator, any]:
+        # A stream only counts as answered once its first chunk arrives
+        stream = await route.client.chat.completions.create(**self._for_route(route, kwargs))
+        try:
+            first_chunk = await stream.__anext__()
+        except BaseException:
+            await self._close_stream(stream)
+            raise
+        return stream, first_chunk
+
+    def _for_route(self: Self, route: Route, kwargs: dict) -> dict:
+        # Callers name a model for the primary route (the history summarizer uses its own); fallbacks use theirs
+        if route is self._routes[0]:
+            return {**kwargs, 'model': kwargs.get('model', route.model)}
+        return {**kwargs, 'model': route.model}
+
+    def _unwrap(self: Self, kind: str, result: any) -> any:
+        if kind != "stream":
+            return result
+        stream, first_chunk = result
+        return self._replay(stream, first_chunk)
+
+    async def _replay(self: Self, stream: AsyncIterator, first_chunk: any) -> AsyncIterator:
+        try:
+            yield first_chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await self._close_stream(stream)
+
+    async def _discard(self: Self, kind: str, result: any):
+        if kind == "stream":
+            with self._lock:
+                self._stats['discarded_streams'] += 1
+            await self._close_stream(result[0])
+            return
+        # A finished loser was paid for, so its usage counts towards the turn and session totals
+        usage = getattr(result, "usage", None)
+        with self._lock:
+            self._stats['discarded'] += 1
+            if usage is not None:
+                self._stats['discarded_tokens'] += (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+        record_usage(f"router.{self._name}.discarded", usage, getattr(result, "model", None))
+
+    async def _close_stream(self: Self, stream: any):
+        close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+        if close is not None:
+            await close()
+
+    def _get_hedge_delay(self: Self, kind: str) -> float | None:
+        threshold = self._latencies[kind].percentile(self._hedge_percentile, self._min_samples)
+        return None if threshold is None else max(self._hedge_min_delay, threshold)
+
+    def _reserve_hedge(self: Self) -> bool:
+        with self._lock:
+            if self._stats['hedges'] + 1 > self._hedge_budget * self._stats['requests']:
+                return False
+            self._stats['hedges'] += 1
+            return True
+
+    def _should_fail_over(self: Self, error: Exception) -> bool:
+        if isinstance(error, _FAILOVER_ERRORS):
+            return True
+        # Rate limits and server errors are provider trouble; other client errors would fail anywhere
+        return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
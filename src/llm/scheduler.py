@@ -0,0 +1,309 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from types import SimpleNamespace
+from typing import AsyncIterator, Awaitable, Callable, Self, TypeVar
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI, InternalServerError, RateLimitError
+from utils.metrics import SCHEDULER_QUEUE_WAIT, SCHEDULER_RETRIES, SCHEDULER_SHED
+from utils.tokens import estimate_message_tokens
+
+import asyncio
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+_DEFAULT_COMPLETION_TOKENS = 400
+
+class SchedulerError(Exception):
+    """Base exception class for RequestScheduler errors"""
+    pass
+
+class SchedulerOverloadedError(SchedulerError):
+    """Exception raised when a request is shed because the wait queue is full or its deadline passed"""
+    pass
+
+@dataclass(frozen = True)
+class ProviderLimits:
+    """Upstream limits of one provider; zero disables a limit"""
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+    max_concurrency: int = 0
+
+class TokenBucket:
+    """Token bucket that hands out reservations, so waiters are served in arrival order"""
+
+    def __init__(self: Self, per_minute: int):
+        self._capacity = float(per_minute)
+        self._rate = per_minute / 60.0
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self: Self, amount: float) -> float:
+        # Returns how long the caller has to wait before the reserved amount is available
+        if self._rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._tokens -= min(amount, self._capacity)
+            return max(0.0, -self._tokens / self._rate)
+
+    def refund(self: Self, amount: float):
+        if self._rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._capacity, self._tokens + min(amount, self._capacity))
+
+    def _refill(self: Self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+class ConcurrencyLimit:
+    """FIFO concurrency limit that works across event loops, unlike asyncio.Semaphore"""
+
+    def __init__(self: Self, limit: int):
+        self._limit = limit
+        self._active = 0
+        self._waiters: deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self: Self, timeout: float):
+        with self._lock:
+            if self._limit <= 0 or (self._active < self._limit and not self._waiters):
+                self._active += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException:
+            with self._lock:
+                queued = (loop, waiter) in self._waiters
+                if queued:
+                    self._waiters.remove((loop, waiter))
+            # A slot handed over just before the timeout has to be passed on
+            if not queued and waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self: Self):
+        with self._lock:
+            if self._limit <= 0:
+                self._active -= 1
+                return
+            if not self._waiters:
+                self._active -= 1
+                return
+            # The slot moves straight to the next waiter, so the active count is unchanged
+            loop, waiter = self._waiters.popleft()
+        loop.call_soon_threadsafe(self._grant, waiter)
+
+    def _grant(self: Self, waiter: asyncio.Future):
+        if waiter.done():
+            self.release()
+        else:
+            waiter.set_result(None)
+
+class _ProviderState:
+
+    def __init__(self: Self, limits: ProviderLimits):
+        self.limits = limits
+        self.requests = TokenBucket(limits.requests_per_minute)
+        self.tokens = TokenBucket(limits.tokens_per_minute)
+        self.concurrency = ConcurrencyLimit(limits.max_concurrency)
+        self.waiting = 0
+
+class RequestScheduler:
+    """Admission control, rate limiting and retries shared by every upstream model client"""
+
+    def __init__(
+        self: Self,
+        limits: dict[str, ProviderLimits],
+        max_queue: int = 128,
+        queue_timeout: float = 20.0,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0
+    ):
+        self._providers = {provider: _ProviderState(provider_limits) for provider, provider_limits in limits.items()}
+        self._max_queue = max_queue
+        self._queue_timeout = queue_timeout
+        self._max_retries = max_retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._lock = threading.Lock()
+        logger.info("RequestScheduler initialized", extra = {
+            'providers': {provider: vars(state.limits) for provider, state in self._providers.items()},
+            'max_queue': max_queue,
+            'queue_timeout': queue_timeout,
+            'max_retries': max_retries
+        })
+
+    def wrap(self: Self, provider: str, client: AsyncOpenAI) -> "ScheduledClient":
+        return ScheduledClient(client, self, provider)
+
+    @asynccontextmanager
+    async def slot(self: Self, provider: str, estimated_tokens: int) -> AsyncIterator[None]:
+        state = self._get_provider(provider)
+        with self._lock:
+            if state.waiting >= self._max_queue:
+                self._shed(provider, "queue_full")
+            state.waiting += 1
+
+        start = time.monotonic()
+        deadline = start + self._queue_timeout
+        try:
+            try:
+                await state.concurrency.acquire(max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                self._shed(provider, "deadline")
+            try:
+                await self._wait_for_budget(provider, state, estimated_tokens, deadline)
+            except BaseException:
+                state.concurrency.release()
+                raise
+        finally:
+            with self._lock:
+                state.waiting -= 1
+        SCHEDULER_QUEUE_WAIT.observe(time.monotonic() - start, provider = provider)
+
+        try:
+            yield
+        finally:
+            state.concurrency.release()
+
+    async def call(self: Self, provider: str, request: Callable[[], Awaitable[T]], estimated_tokens: int) -> T:
+        async with self.slot(provider, estimated_tokens):
+            return await self.retry(provider, request, estimated_tokens)
+
+    async def retry(self: Self, provider: str, request: Callable[[], Awaitable[T]], estimated_tokens: int) -> T:
+        state = self._get_provider(provider)
+        attempt = 0
+        while True:
+            try:
+                return await request()
+            except _RETRYABLE_ERRORS as e:
+                delay = self._get_retry_delay(e, attempt)
+                if attempt >= self._max_retries or delay is None:
+                    raise
+                attempt += 1
+                SCHEDULER_RETRIES.inc(provider = provider, reason = type(e).__name__)
+                logger.warning("Retrying upstream request", extra = {
+                    'provider': provider,
+                    'attempt': attempt,
+                    'delay': round(delay, 3),
+                    'error': str(e)
+                })
+                await asyncio.sleep(delay)
+                # Retries count against the budgets too, but they are never shed
+                await asyncio.sleep(max(state.requests.reserve(1), state.tokens.reserve(estimated_tokens)))
+
+    async def _wait_for_budget(self: Self, provider: str, state: _ProviderState, estimated_tokens: int, deadline: float):
+        request_delay = state.requests.reserve(1)
+        token_delay = state.tokens.reserve(estimated_tokens)
+        delay = max(request_delay, token_delay)
+        if time.monotonic() + delay > deadline:
+            state.requests.refund(1)
+            state.tokens.refund(estimated_tokens)
+            self._shed(provider, "rate_limit")
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _get_retry_delay(self: Self, error: Exception, attempt: int) -> float | None:
+        retry_after = self._get_retry_after(error)
+        if retry_after is not None:
+            # Waiting longer than the cap would keep the visitor waiting for too long
+            return retry_after if retry_after <= self._max_delay else None
+        # Full jitter keeps clients that failed together from retrying together
+        return random.uniform(0, min(self._max_delay, self._base_delay * 2 ** attempt))
+
+    def _get_retry_after(self: Self, error: Exception) -> float | None:
+        if not isinstance(error, APIStatusError):
+            return None
+        headers = error.response.headers
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after"):
+                value = headers["retry-after"]
+                try:
+                    return max(0.0, float(value))
+                except ValueError:
+                    return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            logger.debug("Ignoring invalid Retry-After header", extra = {'retry_after': headers.get("retry-after")})
+        return None
+
+    def _get_provider(self: Self, provider: str) -> _ProviderState:
+        with self._lock:
+            if provider not in self._providers:
+                self._providers[provider] = _ProviderState(ProviderLimits())
+            return self._providers[provider]
+
+    def _shed(self: Self, provider: str, reason: str):
+        SCHEDULER_SHED.inc(provider = provider, reason = reason)
+        logger.warning("Request shed", extra = {'provider': provider, 'reason': reason})
+        raise SchedulerOverloadedError(f"Request to {provider} shed: {reason}")
+
+class ScheduledClient:
+    """Exposes the completion calls of an AsyncOpenAI client, routed through a RequestScheduler"""
+
+    def __init__(self: Self, client: AsyncOpenAI, scheduler: RequestScheduler, provider: str):
+        self._client = client
+        self._scheduler = scheduler
+        self._provider = provider
+        self.chat = SimpleNamespace(completions = SimpleNamespace(create = self._create))
+        self.beta = SimpleNamespace(chat = SimpleNamespace(completions = SimpleNamespace(parse = self._parse)))
+
+    def with_options(self: Self, **options: any) -> "ScheduledClient":
+        return ScheduledClient(self._client.with_options(**options), self._scheduler, self._provider)
+
+    async def _create(self: Self, **kwargs: any) -> any:
+        estimated_tokens = self._estimate_tokens(kwargs)
+        if not kwargs.get("stream"):
+            return await self._scheduler.call(self._provider, lambda: self._client.chat.completions.create(**kwargs), estimated_tokens)
+
+        # A streamed completion keeps its concurrency slot until the stream is consumed or closed
+        slot = self._scheduler.slot(self._provider, estimated_tokens)
+        await slot.__aenter__()
+        try:
+            stream = await self._scheduler.retry(self._provider, lambda: self._client.chat.completions.create(**kwargs), estimated_tokens)
+        except BaseException as e:
+            await slot.__aexit__(type(e), e, e.__traceback__)
+            raise
+        return self._hold_slot(stream, slot)
+
+    async def _parse(self: Self, **kwargs: any) -> any:
+        return await self._scheduler.call(
+            self._provider,
+            lambda: self._client.beta.chat.completions.parse(**kwargs),
+            self._estimate_tokens(kwargs)
+        )
+
+    async def _hold_slot(self: Self, stream: AsyncIterator, slot: any) -> AsyncIterator:
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            # A consumer that stops early would otherwise keep the pooled connection until garbage collection
+            try:
+                close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+                if close is not None:
+                    await close()
+            finally:
+                await slot.__aexit__(None, None, None)
+
+    def _estimate_tokens(self: Self, kwargs: dict) -> int:
+        completion_tokens = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or _DEFAULT_COMPLETION_TOKENS
+        return estimate_message_tokens(kwargs.get("messages", [])) + completion_tokens * (kwargs.get("n") or 1)
@@ -1,17 +1,67 @@
 from dotenv import load_dotenv
-from agents.chat_agent import ChatAgent
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+from agent_factory import create_agent_resources, create_lead_store, create_scheduler, create_served_agents, create_session_store, warm_up_clients
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, RedirectResponse
+from profiles.profile_catalog import ProfileCatalogError, UnknownProfileError
+from profiles.profile_ingestion import ProfileIngestionError
+from urllib.parse import parse_qs, quote, urlparse
+from utils.env import get_env_bool, get_env_int, get_env_str
 from utils.logger import setup_logging
-from utils.reader import read_file_text
+from utils.metrics import REGISTRY
 
 import gradio
 import os
 import sys
 import logging
 
-# Initialize logging
+# Initialize logging (after loading .env, which may configure it)
+load_dotenv()
 setup_logging()
 logger = logging.getLogger(__name__)
 
+def get_profile_key(request: gradio.Request) -> str | None:
+    # A reverse proxy can set the header per host name; links use /p/<key>, which redirects to ?profile=<key>
+    key = request.headers.get(get_env_str('PROFILE_HEADER', 'x-profile')) or request.query_params.get("profile")
+    if not key and request.headers.get("referer"):
+        # Queue requests come from the page, so the page's own query string is in the referer
+        key = parse_qs(urlparse(request.headers["referer"]).query).get("profile", [None])[0]
+    if not key:
+        default = get_env_str('DEFAULT_PROFILE', 'none')
+        key = None if default == 'none' else default
+    return key
+
+def serve(chat_interface: gradio.ChatInterface, metrics: bool = True, profile_paths: bool = False, on_startup: Callable[[], Awaitable[any]] | None = None):
+    # Gradio is mounted on a FastAPI app so startup work runs on the serving loop, and Prometheus can scrape /metrics from the same server
+    import uvicorn
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Uvicorn only starts accepting connections once startup has finished, and the
+        # connections opened here belong to the loop that serves the visitors
+        if on_startup is not None:
+            await on_startup()
+        yield
+
+    app = FastAPI(lifespan=lifespan)
+
+    if metrics:
+        @app.get("/metrics", response_class=PlainTextResponse)
+        def render_metrics() -> str:
+            return REGISTRY.render()
+
+    if profile_paths:
+        @app.get("/p/{key}")
+        def profile_page(key: str) -> RedirectResponse:
+            return RedirectResponse(f"/?profile={quote(key)}")
+
+    app = gradio.mount_gradio_app(app, chat_interface, path="/")
+    host = os.getenv('GRADIO_SERVER_NAME', '127.0.0.1')
+    port = get_env_int('GRADIO_SERVER_PORT', 7860)
+    logger.info("Serving chat interface", extra = {'host': host, 'port': port, 'metrics': metrics})
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
 def main():
     try:
         # Load environment variables
@@ -25,28 +75,63 @@ def main():
             raise EnvironmentError(f"Missing required environment variables: {', '.join(missing_vars)}")
         logger.info("Environment variables validated")
 
-        # Read profile data
+        # Initialize chat agent, or the pool that builds one per profile under PROFILES_DIR
         try:
-            name = read_file_text("../data/name.txt")
-            summary = read_file_text("../data/profile.md")
-            logger.info("Profile data loaded successfully", extra = {'profile_name': name})
-        except Exception as e:
+            resources = create_agent_resources(create_lead_store(), create_scheduler(), create_session_store())
+            agent, pool = create_served_agents(resources)
+            if pool is None:
+                logger.info("Chat agent initialized successfully")
+            else:
+                logger.info("Agent pool initialized successfully", extra = {'profiles_dir': get_env_str('PROFILES_DIR', 'none')})
+        except ProfileIngestionError as e:
             logger.error("Failed to read profile data", extra = {'error': str(e)})
             raise FileNotFoundError(f"Failed to read profile data: {str(e)}")
-
-        # Initialize chat agent
-        try:
-            agent = ChatAgent(name, summary)
-            logger.info("Chat agent initialized successfully")
         except Exception as e:
             logger.error("Failed to initialize chat agent", extra = {'error': str(e)})
             raise RuntimeError(f"Failed to initialize chat agent: {str(e)}")
 
+        async def get_agent(request: gradio.Request) -> tuple[any, str]:
+            if pool is None:
+                return agent, request.session_hash
+            key = get_profile_key(request)
+            if key is None:
+                raise UnknownProfileError("No profile selected")
+            # Sessions are keyed per profile so one browser can talk to several people
+            return await pool.get(key), f"{key}:{request.session_hash}"
+
         # Create and launch chat interface
         try:
-            chat_interface = gradio.ChatInterface(agent.chat, type="messages")
-            logger.info("Chat interface created successfully")
-            chat_interface.launch()
+            streaming = get_env_bool('CHAT_STREAMING', True)
+            # Handlers are async, so one worker can serve many visitors at once; Gradio's default limit is 1
+            concurrency_limit = get_env_int('GRADIO_CONCURRENCY_LIMIT', 64)
+            # Gradio's session hash keys the server-side session, so each turn only adds its delta
+            unknown_profile_message = "Sorry, I couldn't find the profile you're looking for. Please check the link."
+
+            async def respond(message: str, history: list, request: gradio.Request) -> str:
+                try:
+                    chat_agent, session_id = await get_agent(request)
+                except ProfileCatalogError:
+                    return unknown_profile_message
+                return await chat_agent.achat(message, history, session_id)
+
+            async def stream_respond(message: str, history: list, request: gradio.Request):
+                try:
+                    chat_agent, session_id = await get_agent(request)
+                except ProfileCatalogError:
+                    yield unknown_profile_message
+                    return
+                async for reply in chat_agent.astream_chat(message, history, session_id):
+                    yield reply
+
+            chat_interface = gradio.ChatInterface(
+                stream_respond if streaming else respond,
+                type="messages",
+                concurrency_limit=concurrency_limit
+            )
+            logger.info("Chat interface created successfully", extra = {'streaming': streaming, 'concurrency_limit': concurrency_limit})
+            chat_interface.queue(default_concurrency_limit=concurrency_limit)
+            warm_up = (lambda: warm_up_clients(resources)) if get_env_bool('WARMUP_ENABLED', True) else None
+            serve(chat_interface, metrics = get_env_bool('METRICS_ENABLED', True), profile_paths = pool is not None, on_startup = warm_up)
             logger.info("Chat interface launched successfully")
         except Exception as e:
             logger.error("Failed to launch chat interface", extra = {'error': str(e)})
@@ -0,0 +1,16 @@
+from pydantic import BaseModel, Field
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
+
+class ChatRequest(BaseModel):
+    message: str = Field(min_length = 1, max_length = 4000)
+    # Clients that keep a session id only send the new message; without one the history carries the context
+    history: list[ChatMessage] = Field(default_factory = list, max_length = 200)
+    session_id: str | None = Field(default = None, max_length = 128)
+    profile: str | None = None
+
+class ChatResponse(BaseModel):
+    reply: str
+    session_id: str | None = None
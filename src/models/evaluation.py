@@ -1,5 +1,19 @@
-from pydantic import BaseModel
+from functools import lru_cache
+from pydantic import BaseModel, Field, create_model
 
 class Evaluation(BaseModel):
     is_acceptable: bool
-    feedback: str
\ No newline at end of file
+    feedback: str
+
+class CandidateEvaluations(BaseModel):
+    evaluations: list[Evaluation]
+    best_candidate: int
+
+@lru_cache(maxsize = 16)
+def candidate_evaluations_model(count: int) -> type[CandidateEvaluations]:
+    # The schema asks for exactly one evaluation per candidate, so the grader cannot skip any
+    return create_model(
+        f"CandidateEvaluations{count}",
+        __base__ = CandidateEvaluations,
+        evaluations = (list[Evaluation], Field(min_length = count, max_length = count))
+    )
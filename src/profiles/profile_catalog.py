@@ -0,0 +1,74 @@
+from dataclasses import dataclass
+from typing import Self
+from profiles.profile_ingestion import ProfileIngestionError, ProfileIngestor
+
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Markdown wins when a directory holds both
+_SOURCE_FILES = ("profile.md", "profile.pdf")
+
+# Keys become directory names, so anything that could step outside the catalog is refused
+_KEY_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+class ProfileCatalogError(Exception):
+    """Base exception class for ProfileCatalog errors"""
+    pass
+
+class UnknownProfileError(ProfileCatalogError):
+    """Exception raised when no profile exists for a routing key"""
+    pass
+
+@dataclass(frozen = True)
+class ProfileSource:
+    key: str
+    name: str
+    profile: str
+    content_hash: str
+    paths: list[str]
+    sections: list[dict]
+
+class ProfileCatalog:
+    """Profiles stored as <directory>/<key>/name.txt and profile.md or profile.pdf, one directory per person"""
+
+    def __init__(self: Self, directory: str, ingestor: ProfileIngestor | None = None):
+        if not os.path.isdir(directory):
+            raise ProfileCatalogError(f"Profile directory not found: {directory}")
+        self._directory = directory
+        self._ingestor = ingestor or ProfileIngestor()
+        logger.info("ProfileCatalog initialized", extra = {'directory': directory, 'profiles': len(self.keys())})
+
+    def keys(self: Self) -> list[str]:
+        return sorted(
+            entry.name for entry in os.scandir(self._directory)
+            if entry.is_dir() and _KEY_PATTERN.match(entry.name) and self._find_source(entry.path) is not None
+        )
+
+    def load(self: Self, key: str) -> ProfileSource:
+        name_path, source_path = self.paths(key)
+        try:
+            artifact = self._ingestor.ingest(name_path, source_path)
+        except ProfileIngestionError as e:
+            logger.error("Failed to read profile", extra = {'profile_key': key, 'error': str(e)})
+            raise ProfileCatalogError(f"Failed to read profile {key}: {str(e)}")
+        return ProfileSource(key, artifact.name, artifact.text, artifact.content_hash, [name_path, source_path], artifact.sections)
+
+    def paths(self: Self, key: str) -> list[str]:
+        if not _KEY_PATTERN.match(key):
+            raise UnknownProfileError(f"Invalid profile key: {key}")
+        directory = os.path.join(self._directory, key)
+        source_path = self._find_source(directory)
+        if source_path is None:
+            raise UnknownProfileError(f"Unknown profile: {key}")
+        return [os.path.join(directory, "name.txt"), source_path]
+
+    @staticmethod
+    def _find_source(directory: str) -> str | None:
+        for file_name in _SOURCE_FILES:
+            path = os.path.join(directory, file_name)
+            if os.path.isfile(path):
+                return path
+        return None
@@ -0,0 +1,113 @@
+from dataclasses import dataclass
+from typing import Self
+
+import logging
+import numpy
+import re
+import sys
+
+logger = logging.getLogger(__name__)
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*\S)\s*$")
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9+#]*(?:[.\-][a-z0-9+#]+)*")
+_STOPWORDS = frozenset("""
+    a an and are as at be but by can did do does for from had has have how i if in is it its me my of on or
+    our so that the their them there they this to was we were what when where which who why will with you your
+""".split())
+
+class ProfileIndexError(Exception):
+    """Base exception class for ProfileIndex errors"""
+    pass
+
+@dataclass(frozen = True)
+class ProfileChunk:
+    heading: str
+    text: str
+
+class ProfileIndex:
+    """In-memory BM25 index over the heading sections of a markdown profile"""
+
+    def __init__(self: Self, profile: str, top_k: int = 4, k1: float = 1.5, b: float = 0.75, chunks: list[ProfileChunk] | None = None):
+        self._top_k = top_k
+        self._k1 = k1
+        self._b = b
+        try:
+            # Ingested profiles come with their sections already split, so only raw text is chunked here
+            self._chunks = chunks or self.chunk(profile)
+            self._vocabulary, self._weights = self._build(self._chunks)
+            logger.info("ProfileIndex built", extra = {'chunks': len(self._chunks), 'terms': len(self._vocabulary)})
+        except Exception as e:
+            logger.error("Error building profile index", extra = {'error': str(e)})
+            raise ProfileIndexError(f"Error building profile index: {str(e)}")
+
+    @property
+    def chunks(self: Self) -> list[ProfileChunk]:
+        return self._chunks
+
+    def search(self: Self, query: str, top_k: int | None = None) -> list[ProfileChunk]:
+        top_k = min(top_k or self._top_k, len(self._chunks))
+        term_ids = [self._vocabulary[token] for token in self.tokenize(query) if token in self._vocabulary]
+        if not term_ids:
+            return self._chunks[:top_k]
+
+        scores = self._weights[:, term_ids].sum(axis = 1)
+        best = numpy.argpartition(-scores, top_k - 1)[:top_k]
+        # Chunks are returned in document order so the rendered profile still reads naturally
+        selected = sorted(int(index) for index in best if scores[index] > 0) or list(range(top_k))
+        logger.debug("Profile chunks retrieved", extra = {'selected': selected})
+        return [self._chunks[index] for index in selected]
+
+    def render(self: Self, query: str, top_k: int | None = None) -> str:
+        return "\n\n".join(chunk.text for chunk in self.search(query, top_k))
+
+    def memory_estimate(self: Self) -> int:
+        text = sum(sys.getsizeof(chunk.heading) + sys.getsizeof(chunk.text) for chunk in self._chunks)
+        vocabulary = sys.getsizeof(self._vocabulary) + sum(sys.getsizeof(term) for term in self._vocabulary)
+        return text + vocabulary + self._weights.nbytes
+
+    def _build(self: Self, chunks: list[ProfileChunk]) -> tuple[dict[str, int], numpy.ndarray]:
+        vocabulary: dict[str, int] = {}
+        documents = []
+        for chunk in chunks:
+            tokens = self.tokenize(chunk.text)
+            documents.append(tokens)
+            for token in tokens:
+                vocabulary.setdefault(token, len(vocabulary))
+
+        term_frequencies = numpy.zeros((len(chunks), max(len(vocabulary), 1)), dtype = numpy.float32)
+        for row, tokens in enumerate(documents):
+            for token in tokens:
+                term_frequencies[row, vocabulary[token]] += 1
+
+        # BM25 weights are query independent, so they are precomputed once per profile
+        lengths = term_frequencies.sum(axis = 1, keepdims = True)
+        average_length = max(float(lengths.mean()), 1.0)
+        document_frequencies = (term_frequencies > 0).sum(axis = 0)
+        idf = numpy.log(1 + (len(chunks) - document_frequencies + 0.5) / (document_frequencies + 0.5))
+        saturation = term_frequencies + self._k1 * (1 - self._b + self._b * lengths / average_length)
+        weights = idf * term_frequencies * (self._k1 + 1) / numpy.maximum(saturation, 1e-9)
+        return vocabulary, weights.astype(numpy.float32)
+
+    @staticmethod
+    def chunk(profile: str) -> list[ProfileChunk]:
+        chunks = []
+        heading = ""
+        lines = []
+        for line in profile.splitlines():
+            match = _HEADING.match(line)
+            # Consecutive headings stay together so a section keeps its parent titles
+            if match and any(existing.strip() and not _HEADING.match(existing) for existing in lines):
+                chunks.append(ProfileChunk(heading, "\n".join(lines).strip()))
+                lines = []
+            if match:
+                heading = match.group(2)
+            lines.append(line)
+        if any(line.strip() for line in lines):
+            chunks.append(ProfileChunk(heading, "\n".join(lines).strip()))
+        if not chunks:
+            raise ProfileIndexError("Profile is empty")
+        return chunks
+
+    @staticmethod
+    def tokenize(text: str) -> list[str]:
+        return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
@@ -0,0 +1,173 @@
+from dataclasses import asdict, dataclass
+from typing import Self
+from agents.chat_agent import ChatAgent
+from agents.evaluator_agent import EvaluatorAgent
+from profiles.profile_index import ProfileIndex
+from profiles.prompt_cache import PromptCache, content_hash
+
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever cleaning or prompt rendering changes, so stale artifacts are rebuilt
+_ARTIFACT_VERSION = 1
+
+_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\u200b-\u200f\u2060\ufeff]")
+_SPACES = re.compile(r"[ \t\u00a0\u2000-\u200a\u202f\u3000]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_BULLET = re.compile(r"^[•●▪◦‣∙·*]\s*")
+_HYPHENATED_BREAK = re.compile(r"(\w)-\n(\w)")
+_SENTENCE_END = re.compile(r"[.!?:;)\]]$")
+# Resume section titles that PDFs render as plain lines; they become headings so sections can be retrieved
+_SECTION_TITLES = frozenset({
+    "about", "summary", "profile", "objective", "experience", "work experience", "professional experience",
+    "employment", "employment history", "education", "skills", "technical skills", "core skills", "projects",
+    "certifications", "certificates", "languages", "publications", "awards", "achievements", "interests",
+    "volunteering", "volunteer experience", "contact", "references", "courses", "training"
+})
+
+class ProfileIngestionError(Exception):
+    """Base exception class for ProfileIngestor errors"""
+    pass
+
+@dataclass(frozen = True)
+class ProfileArtifact:
+    """Cleaned profile text with its sections and the system prompts rendered for both agents"""
+    name: str
+    text: str
+    content_hash: str
+    source_hash: str
+    sections: list[dict]
+    prompts: dict[str, str]
+
+def normalize_text(text: str, from_pdf: bool = False) -> str:
+    # PDFs carry ligatures, hyphenated line wraps and hard line breaks inside sentences
+    text = unicodedata.normalize("NFKC" if from_pdf else "NFC", text)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _CONTROL.sub("", text)
+    if from_pdf:
+        lines = [_SPACES.sub(" ", line).strip() for line in text.split("\n")]
+        lines = _structure_pdf_lines(_HYPHENATED_BREAK.sub(r"\1\2", "\n".join(lines)).split("\n"))
+    else:
+        # Leading indentation is kept, since it nests markdown lists
+        lines = [line[:len(line) - len(line.lstrip())] + _SPACES.sub(" ", line.strip()) for line in text.split("\n")]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip() + "\n"
+
+def _structure_pdf_lines(lines: list[str]) -> list[str]:
+    structured = []
+    for line in lines:
+        if line.lower().rstrip(":") in _SECTION_TITLES:
+            structured.extend(["", f"## {line.rstrip(':').title()}", ""])
+        elif _BULLET.match(line):
+            structured.append(_BULLET.sub("- ", line))
+        elif structured and structured[-1] and not structured[-1].startswith("#") and line[:1].islower() and not _SENTENCE_END.search(structured[-1]):
+            # A wrapped line continues the previous sentence
+            structured[-1] = f"{structured[-1]} {line}"
+        else:
+            structured.append(line)
+    return structured
+
+def extract_pdf_text(path: str) -> str:
+    try:
+        from PyPDF2 import PdfReader
+    except ImportError:
+        raise ProfileIngestionError("PDF profiles need the PyPDF2 package")
+    try:
+        reader = PdfReader(path)
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    except Exception as e:
+        logger.error("Failed to extract PDF text", extra = {'path': path, 'error': str(e)})
+        raise ProfileIngestionError(f"Failed to extract text from {path}: {str(e)}")
+
+class ProfileIngestor:
+    """Turns a markdown or PDF profile into an artifact cached on disk by the hash of its sources"""
+
+    def __init__(self: Self, artifact_dir: str | None = None, prompt_cache: PromptCache | None = None):
+        self._artifact_dir = artifact_dir
+        self._prompt_cache = prompt_cache
+        if artifact_dir is not None:
+            os.makedirs(artifact_dir, exist_ok = True)
+        logger.info("ProfileIngestor initialized", extra = {'artifact_dir': artifact_dir})
+
+    def ingest(self: Self, name_path: str, source_path: str) -> ProfileArtifact:
+        try:
+            with open(name_path, "rb") as file:
+                name_bytes = file.read()
+            with open(source_path, "rb") as file:
+                source_bytes = file.read()
+        except OSError as e:
+            raise ProfileIngestionError(f"Failed to read profile sources: {str(e)}")
+
+        digest = hashlib.sha256(f"{_ARTIFACT_VERSION}\x00{os.path.splitext(source_path)[1].lower()}\x00".encode("utf-8"))
+        digest.update(name_bytes + b"\x00" + source_bytes)
+        source_hash = digest.hexdigest()
+
+        artifact = self._load(source_hash)
+        if artifact is None:
+            artifact = self._build(name_bytes, source_bytes, source_path, source_hash)
+            self._save(artifact)
+        if self._prompt_cache is not None:
+            for kind, prompt in artifact.prompts.items():
+                self._prompt_cache.put(kind, artifact.content_hash, prompt)
+        return artifact
+
+    def _build(self: Self, name_bytes: bytes, source_bytes: bytes, source_path: str, source_hash: str) -> ProfileArtifact:
+        try:
+            name = normalize_text(name_bytes.decode("utf-8")).strip()
+            if source_path.lower().endswith(".pdf"):
+                text = normalize_text(extract_pdf_text(source_path), from_pdf = True)
+            else:
+                text = normalize_text(source_bytes.decode("utf-8"))
+        except UnicodeDecodeError as e:
+            raise ProfileIngestionError(f"Profile sources must be UTF-8 encoded: {str(e)}")
+        if not text.strip():
+            raise ProfileIngestionError(f"No text found in {source_path}")
+
+        artifact = ProfileArtifact(
+            name = name,
+            text = text,
+            content_hash = content_hash(name, text),
+            source_hash = source_hash,
+            sections = [{'heading': chunk.heading, 'text': chunk.text} for chunk in ProfileIndex.chunk(text)],
+            prompts = {
+                'chat': ChatAgent.render_system_prompt(name, text),
+                'evaluator': EvaluatorAgent.render_system_prompt(name, text)
+            }
+        )
+        logger.info("Profile ingested", extra = {'source': source_path, 'sections': len(artifact.sections), 'text_length': len(text)})
+        return artifact
+
+    def _load(self: Self, source_hash: str) -> ProfileArtifact | None:
+        if self._artifact_dir is None:
+            return None
+        path = os.path.join(self._artifact_dir, f"{source_hash}.json")
+        try:
+            with open(path, "r", encoding = "utf-8") as file:
+                artifact = ProfileArtifact(**json.load(file))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A corrupt artifact is rebuilt from the sources
+            logger.warning("Ignoring unreadable profile artifact", extra = {'path': path, 'error': str(e)})
+            return None
+        logger.info("Profile artifact loaded", extra = {'path': path})
+        return artifact
+
+    def _save(self: Self, artifact: ProfileArtifact):
+        if self._artifact_dir is None:
+            return
+        path = os.path.join(self._artifact_dir, f"{artifact.source_hash}.json")
+        try:
+            # Written to a temporary file first so another worker never reads half an artifact
+            descriptor, temporary = tempfile.mkstemp(dir = self._artifact_dir, suffix = ".tmp")
+            with os.fdopen(descriptor, "w", encoding = "utf-8") as file:
+                json.dump(asdict(artifact), file, ensure_ascii = False)
+            os.replace(temporary, path)
+        except Exception as e:
+            logger.warning("Failed to write profile artifact", extra = {'path': path, 'error': str(e)})
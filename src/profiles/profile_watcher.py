@@ -0,0 +1,80 @@
+from dataclasses import dataclass, field
+from typing import Callable, Self
+
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+def _signature(paths: list[str]) -> tuple:
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+@dataclass
+class _Watch:
+    paths: list[str]
+    on_change: Callable[[], None]
+    signature: tuple
+    pending: tuple | None = field(default = None)
+
+class ProfileWatcher:
+    """Polls profile source files on a background thread and calls back once a change has settled"""
+
+    def __init__(self: Self, interval: float = 2.0):
+        self._interval = interval
+        self._watches: dict[str, _Watch] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        logger.info("ProfileWatcher initialized", extra = {'interval': interval})
+
+    def watch(self: Self, key: str, paths: list[str], on_change: Callable[[], None]):
+        with self._lock:
+            self._watches[key] = _Watch(paths, on_change, _signature(paths))
+            if self._thread is None:
+                self._thread = threading.Thread(target = self._run, name = "profile-watcher", daemon = True)
+                self._thread.start()
+
+    def unwatch(self: Self, key: str):
+        with self._lock:
+            self._watches.pop(key, None)
+
+    def close(self: Self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self._interval * 2)
+
+    def _run(self: Self):
+        while not self._stop.wait(self._interval):
+            with self._lock:
+                watches = list(self._watches.items())
+            for key, watch in watches:
+                self._check(key, watch)
+
+    def _check(self: Self, key: str, watch: _Watch):
+        signature = _signature(watch.paths)
+        if signature == watch.signature:
+            watch.pending = None
+            return
+        # Editors and copies write in steps, so a change is applied once it has been stable for one interval
+        if signature != watch.pending:
+            watch.pending = signature
+            return
+        watch.signature = signature
+        watch.pending = None
+        if None in signature:
+            logger.warning("Profile source missing, keeping the current profile", extra = {'profile_key': key, 'paths': watch.paths})
+            return
+        logger.info("Profile source changed", extra = {'profile_key': key})
+        try:
+            # Runs on the watcher thread, so requests keep being served with the current profile meanwhile
+            watch.on_change()
+        except Exception as e:
+            logger.error("Failed to reload profile, keeping the current one", extra = {'profile_key': key, 'error': str(e)})
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from typing import Callable, Self
+
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+def content_hash(name: str, profile: str) -> str:
+    return hashlib.sha256(f"{name}\x00{profile}".encode("utf-8")).hexdigest()
+
+class PromptCache:
+    """Rendered system prompts keyed by profile content hash, shared by every agent in the process"""
+
+    def __init__(self: Self, max_entries: int = 256):
+        self._max_entries = max_entries
+        self._prompts: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        logger.info("PromptCache initialized", extra = {'max_entries': max_entries})
+
+    def get(self: Self, kind: str, profile_hash: str, render: Callable[[], str]) -> str:
+        key = (kind, profile_hash)
+        with self._lock:
+            prompt = self._prompts.get(key)
+            if prompt is not None:
+                self._prompts.move_to_end(key)
+                self._hits += 1
+                return prompt
+            self._misses += 1
+
+        # Rendering happens outside the lock; two agents racing on a new profile render the same text
+        prompt = render()
+        with self._lock:
+            prompt = self._prompts.setdefault(key, prompt)
+            self._prompts.move_to_end(key)
+            while len(self._prompts) > self._max_entries:
+                self._prompts.popitem(last = False)
+        return prompt
+
+    def put(self: Self, kind: str, profile_hash: str, prompt: str):
+        # Prompts rendered ahead of time, such as those loaded from an ingestion artifact
+        with self._lock:
+            self._prompts[(kind, profile_hash)] = prompt
+            self._prompts.move_to_end((kind, profile_hash))
+            while len(self._prompts) > self._max_entries:
+                self._prompts.popitem(last = False)
+
+    def stats(self: Self) -> dict:
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'size': len(self._prompts)}
@@ -0,0 +1,196 @@
+from contextlib import closing
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Self
+
+import csv
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class LeadStoreError(Exception):
+    """Base exception class for LeadStore errors"""
+    pass
+
+@dataclass
+class Lead:
+    email: str
+    name: str | None = None
+    notes: str | None = None
+    message: str | None = None
+    # Routing key of the profile the visitor contacted; empty when a single profile is served
+    profile: str = ""
+    created_at: str = field(default_factory = lambda: datetime.now(timezone.utc).isoformat())
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS leads (
+        email TEXT NOT NULL,
+        name TEXT,
+        notes TEXT,
+        message TEXT,
+        profile TEXT NOT NULL DEFAULT '',
+        submissions INTEGER NOT NULL DEFAULT 1,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+"""
+
+# Stores created before multi-profile serving were unique on email alone
+_MIGRATION = """
+    ALTER TABLE leads ADD COLUMN profile TEXT NOT NULL DEFAULT '';
+    DROP INDEX IF EXISTS leads_email;
+"""
+
+_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS leads_profile_email ON leads (profile, email)"
+
+_COLUMNS = ["email", "name", "notes", "message", "profile", "submissions", "created_at", "updated_at"]
+
+# Repeat submissions keep the first contact time and any details given earlier
+_UPSERT = """
+    INSERT INTO leads (email, name, notes, message, profile, created_at, updated_at)
+    VALUES (:email, :name, :notes, :message, :profile, :created_at, :created_at)
+    ON CONFLICT (profile, email) DO UPDATE SET
+        name = COALESCE(excluded.name, leads.name),
+        notes = COALESCE(excluded.notes, leads.notes),
+        message = COALESCE(excluded.message, leads.message),
+        submissions = leads.submissions + 1,
+        updated_at = excluded.updated_at
+"""
+
+_STOP = object()
+
+class LeadStore:
+    """SQLite lead store whose writes are batched on a background thread"""
+
+    def __init__(self: Self, path: str, batch_size: int = 50, flush_interval: float = 0.5):
+        self._path = path
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue()
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok = True)
+            with closing(self._connect()) as connection:
+                connection.execute("PRAGMA journal_mode = WAL")
+                connection.executescript(_SCHEMA)
+                columns = [row[1] for row in connection.execute("PRAGMA table_info(leads)")]
+                if "profile" not in columns:
+                    connection.executescript(_MIGRATION)
+                connection.execute(_INDEX)
+        except Exception as e:
+            logger.error("Failed to initialize lead store", extra = {'path': path, 'error': str(e)})
+            raise LeadStoreError(f"Failed to initialize lead store: {str(e)}")
+
+        self._writer = threading.Thread(target = self._run, name = "lead-writer", daemon = True)
+        self._writer.start()
+        logger.info("LeadStore initialized", extra = {'path': path, 'batch_size': batch_size})
+
+    def submit(self: Self, lead: Lead):
+        # Never touches the disk on the caller's thread
+        self._queue.put(lead)
+
+    def flush(self: Self, timeout: float | None = None) -> bool:
+        flushed = threading.Event()
+        self._queue.put(flushed)
+        return flushed.wait(timeout)
+
+    def close(self: Self, timeout: float | None = 5.0):
+        if not self._writer.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._writer.join(timeout)
+        logger.info("LeadStore closed", extra = {'path': self._path})
+
+    def query(self: Self, email: str | None = None, since: str | None = None, limit: int | None = None, profile: str | None = None) -> list[dict]:
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM leads"
+        conditions = []
+        parameters = []
+        if email is not None:
+            conditions.append("email = ?")
+            parameters.append(email.lower())
+        if profile is not None:
+            conditions.append("profile = ?")
+            parameters.append(profile)
+        if since is not None:
+            conditions.append("updated_at >= ?")
+            parameters.append(since)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY updated_at DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        try:
+            with closing(self._connect()) as connection:
+                connection.row_factory = sqlite3.Row
+                return [dict(row) for row in connection.execute(sql, parameters)]
+        except Exception as e:
+            logger.error("Failed to query leads", extra = {'error': str(e)})
+            raise LeadStoreError(f"Failed to query leads: {str(e)}")
+
+    def export(self: Self, path: str, since: str | None = None) -> int:
+        leads = self.query(since = since)
+        try:
+            with open(path, "w", encoding = "utf-8", newline = "") as file:
+                if path.endswith(".csv"):
+                    writer = csv.DictWriter(file, fieldnames = _COLUMNS)
+                    writer.writeheader()
+                    writer.writerows(leads)
+                else:
+                    file.writelines(json.dumps(lead) + "\n" for lead in leads)
+        except Exception as e:
+            logger.error("Failed to export leads", extra = {'path': path, 'error': str(e)})
+            raise LeadStoreError(f"Failed to export leads: {str(e)}")
+        logger.info("Leads exported", extra = {'path': path, 'count': len(leads)})
+        return len(leads)
+
+    def _connect(self: Self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self._path, timeout = 30)
+        # WAL only needs to fsync at checkpoints, which keeps batched commits cheap
+        connection.execute("PRAGMA synchronous = NORMAL")
+        return connection
+
+    def _run(self: Self):
+        connection = self._connect()
+        running = True
+        while running:
+            batch = []
+            markers = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self._flush_interval
+            while True:
+                if item is _STOP:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                if not running or markers or len(batch) >= self._batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout = max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(connection, batch)
+            for marker in markers:
+                marker.set()
+        connection.close()
+
+    def _write(self: Self, connection: sqlite3.Connection, batch: list[Lead]):
+        rows = [{**asdict(lead), 'email': lead.email.lower()} for lead in batch]
+        try:
+            with connection:
+                connection.executemany(_UPSERT, rows)
+            logger.info("Leads written", extra = {'count': len(rows)})
+        except Exception as e:
+            # Keep the leads in the log so they can be recovered by hand
+            logger.error("Failed to write leads", extra = {'error': str(e), 'leads': rows})
@@ -0,0 +1,233 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Self
+from utils.conversation import chain_hash, normalize_history, normalize_message
+from utils.tokens import estimate_message_tokens
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class SessionStoreError(Exception):
+    """Base exception class for SessionStore errors"""
+    pass
+
+@dataclass
+class Session:
+    """Normalized conversation of one visitor with the derived state that later turns reuse"""
+    session_id: str
+    messages: list[dict] = field(default_factory = list)
+    token_counts: list[int] = field(default_factory = list)
+    prefix_hashes: list[str] = field(default_factory = list)
+    tool_results: list[dict] = field(default_factory = list)
+    total_tokens: int = 0
+    # Length of the client-side history this session corresponds to
+    history_length: int = 0
+    version: int = 0
+    updated_at: float = field(default_factory = time.time)
+
+    def append(self: Self, message: dict):
+        tokens = estimate_message_tokens([message])
+        self.messages.append(message)
+        self.token_counts.append(tokens)
+        self.prefix_hashes.append(chain_hash(self.prefix_hashes[-1] if self.prefix_hashes else "", message))
+        self.total_tokens += tokens
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        history_length INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS session_messages (
+        session_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        PRIMARY KEY (session_id, position)
+    );
+    CREATE TABLE IF NOT EXISTS session_tool_results (
+        session_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        tool_call_id TEXT,
+        content TEXT NOT NULL,
+        PRIMARY KEY (session_id, position)
+    );
+    CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+"""
+
+class SessionStore:
+    """LRU of conversations with idle eviction, optionally backed by SQLite so workers can share them"""
+
+    def __init__(self: Self, max_sessions: int = 1024, idle_ttl_seconds: float = 3600, path: str | None = None):
+        self._max_sessions = max_sessions
+        self._idle_ttl_seconds = idle_ttl_seconds
+        self._path = path
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self._next_prune = 0.0
+        self._stats = {'hits': 0, 'deltas': 0, 'rebuilds': 0, 'loads': 0, 'evictions': 0}
+        if path is not None:
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok = True)
+                self._connection = sqlite3.connect(path, check_same_thread = False, isolation_level = None)
+                self._connection.execute("PRAGMA journal_mode = WAL")
+                self._connection.execute("PRAGMA synchronous = NORMAL")
+                self._connection.executescript(_SCHEMA)
+            except Exception as e:
+                logger.error("Failed to initialize session store", extra = {'path': path, 'error': str(e)})
+                raise SessionStoreError(f"Failed to initialize session store: {str(e)}")
+        logger.info("SessionStore initialized", extra = {'max_sessions': max_sessions, 'idle_ttl_seconds': idle_ttl_seconds, 'path': path})
+
+    def sync(self: Self, session_id: str, history: any) -> Session:
+        # Reconciles the stored session with the history the client sent, normalizing only what is new;
+        # no history continues the stored session as it is
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            session = self._refresh(session_id, session)
+
+            if history is None:
+                # API clients that keep the session id send only the new message
+                self._stats['hits'] += 1
+            elif session.history_length == len(history) and self._matches_tail(session, history, len(history)):
+                self._stats['hits'] += 1
+            elif session.history_length < len(history) and self._matches_tail(session, history, session.history_length):
+                self._stats['deltas'] += 1
+                stored = len(session.messages)
+                for item in history[session.history_length:]:
+                    message = normalize_message(item)
+                    if message is not None:
+                        session.append(message)
+                session.history_length = len(history)
+                self._write(session, len(session.messages) - stored)
+            else:
+                # The visitor cleared or edited the conversation
+                self._stats['rebuilds'] += 1
+                session = Session(session_id, history_length = len(history), version = session.version)
+                for message in normalize_history(history):
+                    session.append(message)
+                self._write(session, len(session.messages), replace = True)
+
+            # Every access counts as activity, so the LRU order stays the updated_at order _evict_idle relies on
+            session.updated_at = time.time()
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last = False)
+                self._stats['evictions'] += 1
+            return session
+
+    def record_turn(self: Self, session: Session, message: str, reply: str, tool_results: list[dict] | None = None):
+        with self._lock:
+            tool_start = len(session.tool_results)
+            session.append({"role": "user", "content": message})
+            session.append({"role": "assistant", "content": reply})
+            session.tool_results.extend(tool_results or [])
+            session.history_length += 2
+            self._write(session, 2, tool_start = tool_start)
+            if self._sessions.get(session.session_id) is session:
+                self._sessions.move_to_end(session.session_id)
+
+    def stats(self: Self) -> dict:
+        with self._lock:
+            return {**self._stats, 'size': len(self._sessions)}
+
+    def close(self: Self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _matches_tail(self: Self, session: Session, history: any, end: int) -> bool:
+        # Comparing the last message is enough to tell a continued conversation from a new one
+        last = next((message for message in map(normalize_message, (history[index] for index in range(end - 1, -1, -1))) if message is not None), None)
+        if last is None:
+            return not session.messages
+        return bool(session.messages) and session.messages[-1] == last
+
+    def _refresh(self: Self, session_id: str, session: Session | None) -> Session:
+        if self._connection is None:
+            return session or Session(session_id)
+        row = self._connection.execute("SELECT version, history_length FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return session or Session(session_id)
+        if session is not None and session.version >= row[0]:
+            return session
+
+        # Another worker advanced the session, or it was evicted from memory
+        self._stats['loads'] += 1
+        session = Session(session_id)
+        for role, content in self._connection.execute(
+            "SELECT role, content FROM session_messages WHERE session_id = ? ORDER BY position", (session_id,)
+        ):
+            session.append({"role": role, "content": content})
+        for tool_call_id, content in self._connection.execute(
+            "SELECT tool_call_id, content FROM session_tool_results WHERE session_id = ? ORDER BY position", (session_id,)
+        ):
+            session.tool_results.append({"tool_call_id": tool_call_id, "content": content})
+        session.version = row[0]
+        session.history_length = row[1]
+        return session
+
+    def _write(self: Self, session: Session, new_messages: int, replace: bool = False, tool_start: int | None = None):
+        session.version += 1
+        session.updated_at = time.time()
+        if self._connection is None:
+            return
+        # Only the delta is written; a rebuilt session replaces the stored one
+        start = len(session.messages) - new_messages
+        try:
+            with self._connection:
+                self._connection.execute("BEGIN")
+                if replace:
+                    self._connection.execute("DELETE FROM session_messages WHERE session_id = ?", (session.session_id,))
+                    self._connection.execute("DELETE FROM session_tool_results WHERE session_id = ?", (session.session_id,))
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO session_messages (session_id, position, role, content) VALUES (?, ?, ?, ?)",
+                    [(session.session_id, position, message["role"], message["content"]) for position, message in enumerate(session.messages[start:], start)]
+                )
+                if tool_start is not None:
+                    self._connection.executemany(
+                        "INSERT OR REPLACE INTO session_tool_results (session_id, position, tool_call_id, content) VALUES (?, ?, ?, ?)",
+                        [(session.session_id, position, result.get("tool_call_id"), result["content"]) for position, result in enumerate(session.tool_results[tool_start:], tool_start)]
+                    )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, version, history_length, updated_at) VALUES (?, ?, ?, ?)",
+                    (session.session_id, session.version, session.history_length, session.updated_at)
+                )
+        except Exception as e:
+            # The in-memory session stays authoritative for this worker
+            logger.error("Failed to persist session", extra = {'error': str(e)})
+
+    def _evict_idle(self: Self):
+        now = time.time()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.updated_at <= self._idle_ttl_seconds:
+                break
+            self._sessions.popitem(last = False)
+            self._stats['evictions'] += 1
+
+        if self._connection is None or now < self._next_prune:
+            return
+        self._next_prune = now + 60
+        cutoff = now - self._idle_ttl_seconds
+        try:
+            with self._connection:
+                self._connection.execute("BEGIN")
+                self._connection.execute("DELETE FROM session_messages WHERE session_id IN (SELECT session_id FROM sessions WHERE updated_at < ?)", (cutoff,))
+                self._connection.execute("DELETE FROM session_tool_results WHERE session_id IN (SELECT session_id FROM sessions WHERE updated_at < ?)", (cutoff,))
+                self._connection.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+        except Exception as e:
+            logger.warning("Failed to prune idle sessions", extra = {'error': str(e)})
@@ -1,12 +1,37 @@
 from abc import ABC, abstractmethod
+from contextvars import ContextVar
 from typing import Self
+from tools.schema_validator import compile_schema
+
+import asyncio
+
+# Per-call details that are not tool arguments, such as the profile a shared tool is acting for
+tool_context: ContextVar[dict | None] = ContextVar("tool_context", default = None)
 
 
 class BaseTool(ABC):
-    
-    def __init__(self: Self, definition: dict):
+
+    def __init__(self: Self, definition: dict, timeout: float = 10.0):
         self.definition = definition
+        self.timeout = timeout
+        self._validator = compile_schema(definition.get("parameters", {}))
+
+    @property
+    def name(self: Self) -> str:
+        return self.definition["name"]
+
+    @property
+    def is_async(self: Self) -> bool:
+        # Tools that override afunction do their own non-blocking I/O
+        return type(self).afunction is not BaseTool.afunction
+
+    def validate(self: Self, arguments: any) -> list[str]:
+        return self._validator(arguments)
 
     @abstractmethod
     def function(self: Self, *args, **kwargs) -> dict:
-        return { "arguments": [args, kwargs] }
\ No newline at end of file
+        return { "arguments": [args, kwargs] }
+
+    async def afunction(self: Self, *args, **kwargs) -> dict:
+        # Synchronous tools run on a worker thread so they never block the event loop
+        return await asyncio.to_thread(self.function, *args, **kwargs)
\ No newline at end of file
@@ -1,16 +1,20 @@
 from typing import Self
-from tools.base_tool import BaseTool
+from storage.lead_store import Lead, LeadStore
+from tools.base_tool import BaseTool, tool_context
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
+_EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
 class RecordUserDetailsError(Exception):
     """Base exception class for RecordUserDetailsTool errors"""
     pass
 
 class RecordUserDetailsTool(BaseTool):
     
-    def __init__(self: Self):
+    def __init__(self: Self, lead_store: LeadStore | None = None):
         super().__init__({
             "name": "record_user_details",
             "description": "Use this tool to record that a user is interested in being in touch and provided an email address",
@@ -34,11 +38,12 @@ class RecordUserDetailsTool(BaseTool):
                 "additionalProperties": False
             }
         })
-        logger.info("RecordUserDetailsTool initialized")
+        self._lead_store = lead_store
+        logger.info("RecordUserDetailsTool initialized", extra = {'persistent': lead_store is not None})
 
     def function(self: Self, message: str, history: any, email: str, **kwargs) -> dict:
         try:
-            logger.info("Recording user details", extra = {'email': email, 'has_name': 'user_name' in kwargs})
+            logger.info("Recording user details", extra = {'email': email, 'has_name': 'name' in kwargs})
             
             # Validate email format
             if not self._is_valid_email(email):
@@ -48,6 +53,11 @@ class RecordUserDetailsTool(BaseTool):
             # Call parent class function
             super().function(message, history)
 
+            # Queue the lead for the background writer so the chat turn never waits on disk
+            if self._lead_store is not None:
+                profile = (tool_context.get() or {}).get('profile') or ""
+                self._lead_store.submit(Lead(email = email, name = kwargs.get("name"), notes = kwargs.get("notes"), message = message, profile = profile))
+
             response = {
                 "status": "success",
                 "args": [email, kwargs]
@@ -64,8 +74,6 @@ class RecordUserDetailsTool(BaseTool):
 
     def _is_valid_email(self, email: str) -> bool:
         """Basic email validation"""
-        import re
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        is_valid = bool(re.match(pattern, email))
+        is_valid = bool(_EMAIL_PATTERN.match(email))
         logger.debug("Email validation result", extra = {'email': email, 'is_valid': is_valid})
         return is_valid
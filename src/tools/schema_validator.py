@@ -0,0 +1,65 @@
+from typing import Callable
+
+# Compiles the subset of JSON schema used by tool definitions into a plain
+# function, so arguments are checked without re-walking the schema on every call
+Validator = Callable[[any, str], list[str]]
+
+_TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None
+}
+
+def compile_schema(schema: dict) -> Callable[[any], list[str]]:
+    validator = _compile(schema)
+    return lambda value: validator(value, "arguments")
+
+def _compile(schema: dict) -> Validator:
+    checks: list[Validator] = []
+
+    schema_type = schema.get("type")
+    if schema_type is not None:
+        types = schema_type if isinstance(schema_type, list) else [schema_type]
+        type_checks = [_TYPE_CHECKS[name] for name in types if name in _TYPE_CHECKS]
+        checks.append(lambda value, path: [] if any(check(value) for check in type_checks) else [f"{path} must be of type {' or '.join(types)}"])
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+        checks.append(lambda value, path: [] if value in allowed else [f"{path} must be one of {allowed}"])
+
+    properties = {name: _compile(definition) for name, definition in schema.get("properties", {}).items()}
+    required = tuple(schema.get("required", ()))
+    allow_additional = schema.get("additionalProperties", True) is not False
+    if properties or required or not allow_additional:
+        def check_object(value: any, path: str) -> list[str]:
+            if not isinstance(value, dict):
+                return []
+            errors = [f"{path}.{name} is required" for name in required if name not in value]
+            for name, item in value.items():
+                if name in properties:
+                    errors.extend(properties[name](item, f"{path}.{name}"))
+                elif not allow_additional:
+                    errors.append(f"{path}.{name} is not allowed")
+            return errors
+        checks.append(check_object)
+
+    if "items" in schema:
+        item_validator = _compile(schema["items"])
+        checks.append(lambda value, path: [
+            error for index, item in enumerate(value) for error in item_validator(item, f"{path}[{index}]")
+        ] if isinstance(value, list) else [])
+
+    def validate(value: any, path: str) -> list[str]:
+        errors = []
+        for check in checks:
+            errors.extend(check(value, path))
+            # Nested checks are meaningless once the type itself is wrong
+            if errors:
+                break
+        return errors
+
+    return validate
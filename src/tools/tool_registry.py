@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Self
+from tools.base_tool import BaseTool, tool_context
+from utils.metrics import TOOL_CALLS
+from utils.tracing import span
+
+import asyncio
+import contextvars
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ToolRegistryError(Exception):
+    """Base exception class for ToolRegistry errors"""
+    pass
+
+class ToolRegistry:
+    """Holds the available tools and runs the tool calls of a completion concurrently"""
+
+    def __init__(self: Self, tools: list[BaseTool] | None = None, max_concurrency: int = 4):
+        self._tools: dict[str, BaseTool] = {}
+        self._definitions: list[dict] = []
+        # Synchronous tools get their own bounded pool so slow tools cannot starve the default executor
+        self._executor = ThreadPoolExecutor(max_workers = max_concurrency, thread_name_prefix = "tool")
+        self._max_concurrency = max_concurrency
+        for tool in tools or []:
+            self.register(tool)
+        logger.info("ToolRegistry initialized", extra = {'tool_count': len(self._tools), 'max_concurrency': max_concurrency})
+
+    @property
+    def definitions(self: Self) -> list[dict]:
+        return self._definitions
+
+    def get(self: Self, name: str) -> BaseTool | None:
+        return self._tools.get(name)
+
+    def register(self: Self, tool: BaseTool):
+        if tool.name in self._tools:
+            raise ToolRegistryError(f"Tool {tool.name} is already registered")
+        self._tools[tool.name] = tool
+        self._definitions = [{"type": "function", "function": registered.definition} for registered in self._tools.values()]
+        logger.debug("Tool registered", extra = {'tool_name': tool.name, 'timeout': tool.timeout, 'is_async': tool.is_async})
+
+    async def execute(self: Self, tool_calls: any, message: str, history: any, context: dict | None = None) -> list[dict]:
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async def run(tool_call: any) -> dict:
+            # Each call runs in its own task, so the context cannot leak between turns
+            tool_context.set(context or {})
+            async with semaphore:
+                with span("tool.execute", tool = tool_call.function.name):
+                    return await self._execute_one(tool_call, message, history)
+
+        return list(await asyncio.gather(*(run(tool_call) for tool_call in tool_calls)))
+
+    async def _execute_one(self: Self, tool_call: any, message: str, history: any) -> dict:
+        # Failures are reported back to the model as tool messages instead of aborting the turn
+        tool_name = tool_call.function.name
+        tool = self._tools.get(tool_name)
+        if tool is None:
+            logger.error("Tool not found", extra = {'tool_name': tool_name})
+            return self._error_message(tool_call, f"Tool {tool_name} not found")
+
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError:
+            logger.error("Invalid JSON arguments for tool", extra = {'tool_name': tool_name})
+            return self._error_message(tool_call, f"Invalid JSON arguments for tool {tool_name}")
+
+        errors = tool.validate(arguments)
+        if errors:
+            logger.error("Invalid arguments for tool", extra = {'tool_name': tool_name, 'errors': errors})
+            return self._error_message(tool_call, f"Invalid arguments: {'; '.join(errors)}")
+
+        logger.info("Executing tool", extra = {'tool_name': tool_name})
+        try:
+            if tool.is_async:
+                pending = tool.afunction(message, history, **arguments)
+            else:
+                # Executor threads do not inherit context variables on their own
+                call = partial(contextvars.copy_context().run, tool.function, message, history, **arguments)
+                pending = asyncio.get_running_loop().run_in_executor(self._executor, call)
+            result = await asyncio.wait_for(pending, timeout = tool.timeout)
+            # A result the model cannot be sent is reported like any other tool failure
+            content = json.dumps(result)
+        except asyncio.TimeoutError:
+            logger.error("Tool execution timed out", extra = {'tool_name': tool_name, 'timeout': tool.timeout})
+            return self._error_message(tool_call, f"Tool {tool_name} timed out")
+        except Exception as e:
+            logger.error("Error executing tool", extra = {'tool_name': tool_name, 'error': str(e)})
+            return self._error_message(tool_call, f"Error executing tool {tool_name}: {str(e)}")
+
+        logger.info("Tool execution successful", extra = {'tool_name': tool_name})
+        TOOL_CALLS.inc(tool = tool_name, status = "ok")
+        return {"role": "tool", "content": content, "tool_call_id": tool_call.id}
+
+    def _error_message(self: Self, tool_call: any, error: str) -> dict:
+        TOOL_CALLS.inc(tool = tool_call.function.name, status = "error")
+        return {"role": "tool", "content": json.dumps({"status": "error", "error": error}), "tool_call_id": tool_call.id}
+
+    def shutdown(self: Self):
+        self._executor.shutdown(wait = False)
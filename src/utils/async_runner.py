@@ -0,0 +1,35 @@
+from typing import AsyncIterator, Coroutine, Iterator, TypeVar
+
+import asyncio
+import threading
+
+T = TypeVar("T")
+
+_loop: asyncio.AbstractEventLoop | None = None
+_lock = threading.Lock()
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    # A single background loop shared by every synchronous caller; model clients keep
+    # a separate connection pool for it, apart from the loop of async callers
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target = _loop.run_forever, name = "async-runner", daemon = True).start()
+        return _loop
+
+def run_sync(coro: Coroutine[any, any, T]) -> T:
+    """Run a coroutine on the background loop and block until it completes"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+def iterate_sync(agen: AsyncIterator[T]) -> Iterator[T]:
+    """Drive an async generator on the background loop from synchronous code"""
+    loop = _get_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
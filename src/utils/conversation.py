@@ -0,0 +1,27 @@
+import hashlib
+
+# Conversation helpers shared by the history manager and the session store, so both
+# see the same normalized messages and the same prefix hashes
+
+def normalize_message(item: any) -> dict | None:
+    # Gradio history items carry metadata and options that the model does not need
+    role = item.get("role")
+    content = item.get("content")
+    if role not in ("user", "assistant") or not content:
+        return None
+    return {"role": role, "content": content if isinstance(content, str) else str(content)}
+
+def normalize_history(history: any) -> list[dict]:
+    return [message for message in map(normalize_message, history) if message is not None]
+
+def chain_hash(previous: str, message: dict) -> str:
+    # Each hash covers the whole prefix up to and including the message, so extending
+    # a conversation only hashes the new messages
+    return hashlib.sha256(f"{previous}\x00{message['role']}\x00{message['content']}".encode("utf-8")).hexdigest()
+
+def prefix_hashes(messages: list[dict], previous: str = "") -> list[str]:
+    hashes = []
+    for message in messages:
+        previous = chain_hash(previous, message)
+        hashes.append(previous)
+    return hashes
@@ -1,57 +1,91 @@
 from datetime import datetime, timezone
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from utils.env import get_env_bool, get_env_int, get_env_str
 
-import json
+import atexit
 import logging
+import orjson
 import os
+import queue
 import sys
 
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "taskName"}
+
+_listener: QueueListener | None = None
+
+def _get_extra(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        log_entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **_get_extra(record)
+        }
+        if record.exc_info:
+            log_entry['exception'] = self.formatException(record.exc_info)
+        return orjson.dumps(log_entry, default = str).decode("utf-8")
+
+class ConsoleFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        extra = _get_extra(record)
+        if extra:
+            message = f"{message} {orjson.dumps(extra, default = str).decode('utf-8')}"
+        return message
+
+class _DeferredQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock handler formats the record here, on the caller's thread; the
+        # listener's handlers format it instead. Records are not copied, so
+        # callers must not mutate objects they pass as log arguments.
+        return record
+
 # Configure logging
 def setup_logging():
-    # Create logs directory if it doesn't exist
-    os.makedirs('logs', exist_ok = True)
-    
-    # Create formatters
-    json_formatter = logging.Formatter('%(message)s')
-    console_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    
+    global _listener
+    if _listener is not None:
+        return
+
+    level = get_env_str('LOG_LEVEL', 'INFO').upper()
+    log_file = get_env_str('LOG_FILE', 'logs/app.log')
+
     # Create handlers
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(console_formatter)
-    
-    # File handler with rotation (10MB per file, max 5 files)
-    file_handler = RotatingFileHandler(
-        'logs/app.log',
-        maxBytes = 10*1024*1024,  # 10MB
-        backupCount = 5
-    )
-    file_handler.setFormatter(json_formatter)
-    
+    handlers = []
+    if get_env_bool('LOG_CONSOLE', True):
+        console_handler = logging.StreamHandler(sys.stdout)
+        if get_env_str('LOG_CONSOLE_FORMAT', 'text') == 'json':
+            console_handler.setFormatter(JsonFormatter())
+        else:
+            console_handler.setFormatter(ConsoleFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        handlers.append(console_handler)
+
+    if log_file.lower() != 'none':
+        # Create logs directory if it doesn't exist
+        directory = os.path.dirname(log_file)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        # File handler with rotation (10MB per file, max 5 files by default)
+        file_handler = RotatingFileHandler(
+            log_file,
+            maxBytes = get_env_int('LOG_FILE_MAX_BYTES', 10*1024*1024),
+            backupCount = get_env_int('LOG_FILE_BACKUP_COUNT', 5)
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    # Request threads only enqueue records; formatting and I/O happen on the listener thread
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level = True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
     # Configure root logger
     root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
-    
-    # Create a custom JSON logger
-    class JsonLogger(logging.Logger):
-        def _log(self, level, msg, _, exc_info = None, extra = None, stack_info = False, stacklevel = 1):
-            if extra is None:
-                extra = {}
-            
-            # Create JSON log entry
-            log_entry = {
-                'timestamp': datetime.now(timezone.utc).isoformat(),
-                'level': level,
-                'logger': self.name,
-                'message': msg,
-                **extra
-            }
-            
-            if exc_info:
-                log_entry['exception'] = self.formatException(exc_info)
-            
-            super()._log(level, json.dumps(log_entry), (), exc_info, extra, stack_info, stacklevel)
-    
-    # Register the custom logger
-    logging.setLoggerClass(JsonLogger)
\ No newline at end of file
+    root_logger.setLevel(level)
+    root_logger.addHandler(_DeferredQueueHandler(log_queue))
@@ -0,0 +1,118 @@
+from collections import defaultdict
+from typing import Self
+
+import bisect
+import threading
+
+# Minimal Prometheus metric types rendered in the text exposition format
+
+_DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Counter:
+
+    def __init__(self: Self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self._description = description
+        self._labels = labels
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self: Self, amount: float = 1, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self._labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self: Self) -> list[str]:
+        lines = [f"# HELP {self.name} {self._description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self._labels, key)} {value}")
+        return lines
+
+class Histogram:
+
+    def __init__(self: Self, name: str, description: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = _DEFAULT_BUCKETS):
+        self.name = name
+        self._description = description
+        self._labels = labels
+        self._buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts, then sum, then count
+        self._values: dict[tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self: Self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self._labels)
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._values.setdefault(key, [[0] * len(self._buckets), 0.0, 0])
+            if index < len(self._buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self: Self) -> list[str]:
+        lines = [f"# HELP {self.name} {self._description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self._buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self._labels, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self._labels, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self._labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self._labels, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+
+    def __init__(self: Self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def counter(self: Self, name: str, description: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+
+    def histogram(self: Self, name: str, description: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = _DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def render(self: Self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def _register(self: Self, metric: Counter | Histogram) -> Counter | Histogram:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+REGISTRY = MetricsRegistry()
+
+SPAN_DURATION = REGISTRY.histogram("span_duration_seconds", "Duration of traced operations", ("span", "status"))
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens reported by the model providers", ("span", "type"))
+TIME_TO_FIRST_TOKEN = REGISTRY.histogram("chat_time_to_first_token_seconds", "Time until the first streamed token of a turn")
+CHAT_TURNS = REGISTRY.counter("chat_turns_total", "Chat turns by outcome", ("outcome",))
+EVALUATIONS = REGISTRY.counter("evaluations_total", "Evaluator verdicts", ("verdict",))
+REEVALUATIONS = REGISTRY.counter("reevaluations_total", "Replies regenerated after a rejection")
+TOOL_CALLS = REGISTRY.counter("tool_calls_total", "Tool executions by tool and status", ("tool", "status"))
+CACHE_LOOKUPS = REGISTRY.counter("response_cache_lookups_total", "Response cache lookups", ("result",))
+SCHEDULER_QUEUE_WAIT = REGISTRY.histogram("scheduler_queue_wait_seconds", "Time requests waited for admission, concurrency and rate budget", ("provider",))
+SCHEDULER_RETRIES = REGISTRY.counter("scheduler_retries_total", "Upstream requests retried by the scheduler", ("provider", "reason"))
+SCHEDULER_SHED = REGISTRY.counter("scheduler_shed_total", "Requests shed by the scheduler", ("provider", "reason"))
+ROUTER_HEDGES = REGISTRY.counter("router_hedges_total", "Hedged requests by the request that answered first", ("router", "winner"))
+ROUTER_FAILOVERS = REGISTRY.counter("router_failovers_total", "Requests moved to the next route after a provider error", ("router", "source", "target"))
+PROFILE_AGENTS = REGISTRY.counter("profile_agents_total", "Agents built, reloaded and evicted by the multi-profile pool", ("event",))
+HTTP_CONNECTIONS = REGISTRY.counter("http_connections_total", "Provider requests by whether they opened a connection or reused a pooled one", ("provider", "event"))
+HTTP_CONNECT_DURATION = REGISTRY.histogram("http_connect_duration_seconds", "Time to open a provider connection, including the TLS handshake", ("provider",), (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+LLM_COST = REGISTRY.counter("llm_cost_usd_total", "Estimated cost of the tokens reported by the model providers", ("model",))
+TURN_TOKENS = REGISTRY.histogram("chat_turn_tokens", "Tokens used by a chat turn across generation, reruns, evaluation and summaries", (), (500, 1000, 2000, 4000, 8000, 16000, 32000, 64000))
+BUDGET_DEGRADATIONS = REGISTRY.counter("budget_degradations_total", "Turns served with reduced work because their session neared its budget", ("level",))
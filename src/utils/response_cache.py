@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Self
+
+import hashlib
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.,;:]+$")
+
+@dataclass
+class _CacheEntry:
+    reply: str
+    expires_at: float
+
+class ResponseCache:
+    """LRU cache of evaluated replies with a TTL and an entry bound"""
+
+    def __init__(self: Self, max_entries: int = 512, ttl_seconds: float = 3600, history_turns: int = 2):
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._history_turns = history_turns
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        logger.info("ResponseCache initialized", extra = {'max_entries': max_entries, 'ttl_seconds': ttl_seconds})
+
+    def make_key(self: Self, prompt_hash: str, message: str, history: any) -> str:
+        # Only the most recent turns take part in the key, so a common question
+        # asked early in different conversations maps to the same entry
+        recent = history[-self._history_turns * 2:] if self._history_turns > 0 else []
+        parts = [prompt_hash]
+        for item in recent:
+            parts.append(f"{item.get('role')}:{self.normalize(item.get('content'))}")
+        parts.append(f"user:{self.normalize(message)}")
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self: Self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry.reply
+
+    def put(self: Self, key: str, reply: str):
+        with self._lock:
+            self._entries[key] = _CacheEntry(reply, time.monotonic() + self._ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last = False)
+                self._evictions += 1
+
+    def stats(self: Self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'evictions': self._evictions,
+                'expirations': self._expirations
+            }
+
+    @staticmethod
+    def normalize(content: any) -> str:
+        text = content if isinstance(content, str) else str(content)
+        text = _WHITESPACE.sub(" ", text.strip().lower())
+        return _TRAILING_PUNCTUATION.sub("", text)
+
+    @staticmethod
+    def hash_prompt(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
@@ -0,0 +1,17 @@
+# Rough token estimates (about four characters per token for English text) used
+# for budgeting and logging; no tokenizer dependency is needed for that accuracy
+_CHARS_PER_TOKEN = 4
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+def estimate_tokens(text: any) -> int:
+    if not text:
+        return 0
+    content = text if isinstance(text, str) else str(text)
+    return (len(content) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+def estimate_message_tokens(messages: list[dict]) -> int:
+    # Tool call turns are appended as ChatCompletionMessage objects rather than dicts
+    return sum(
+        _MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content") if isinstance(message, dict) else getattr(message, "content", None))
+        for message in messages
+    )
@@ -0,0 +1,122 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Iterator, Self, TypeVar
+from utils.metrics import LLM_TOKENS, SPAN_DURATION
+
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_turn_id: ContextVar[str | None] = ContextVar("turn_id", default = None)
+_collector: ContextVar[list | None] = ContextVar("span_collector", default = None)
+_usage_listeners: list[Callable[[str | None, str | None, any], None]] = []
+
+class Span:
+
+    def __init__(self: Self, name: str, turn_id: str | None, attributes: dict):
+        self.name = name
+        self.turn_id = turn_id
+        self.attributes = attributes
+        self.started_at = time.perf_counter()
+        self.status = "ok"
+        self.duration: float | None = None
+
+    def set(self: Self, **attributes: any):
+        self.attributes.update(attributes)
+
+    def record_usage(self: Self, usage: any, model: str | None = None):
+        # The model a response reports wins over the requested one, since routers may fail over
+        if usage is None:
+            return
+        self.set(prompt_tokens = usage.prompt_tokens, completion_tokens = usage.completion_tokens)
+        _report_usage(self.name, self.turn_id, model or self.attributes.get('model'), usage)
+
+    def elapsed(self: Self) -> float:
+        return time.perf_counter() - self.started_at
+
+def record_usage(name: str, usage: any, model: str | None = None):
+    """Report usage that belongs to no span, such as a discarded hedge, to the current turn"""
+    if usage is not None:
+        _report_usage(name, current_turn_id(), model, usage)
+
+def _report_usage(name: str, turn_id: str | None, model: str | None, usage: any):
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, span = name, type = "prompt")
+    LLM_TOKENS.inc(usage.completion_tokens or 0, span = name, type = "completion")
+    for listener in _usage_listeners:
+        listener(turn_id, model, usage)
+
+def add_usage_listener(listener: Callable[[str | None, str | None, any], None]):
+    """Call the listener with the turn id, model and usage of every completion a span records"""
+    if listener not in _usage_listeners:
+        _usage_listeners.append(listener)
+
+def new_turn_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def current_turn_id() -> str | None:
+    return _turn_id.get()
+
+@contextmanager
+def bind_turn(turn_id: str) -> Iterator[str]:
+    token = _turn_id.set(turn_id)
+    try:
+        yield turn_id
+    finally:
+        _turn_id.reset(token)
+
+@contextmanager
+def collect_spans() -> Iterator[list[Span]]:
+    # Gathers the spans completed inside the block, including those of tasks it starts,
+    # so offline runs can attribute outcomes and tokens to each turn
+    spans = []
+    token = _collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _collector.reset(token)
+
+@contextmanager
+def span(name: str, turn_id: str | None = None, **attributes: any) -> Iterator[Span]:
+    # Spans only read the turn id when they start, so they may stay open across the
+    # yields of an async generator without touching the context
+    current = Span(name, turn_id or _turn_id.get(), attributes)
+    status = "ok"
+    try:
+        yield current
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = current.elapsed()
+        current.status = status
+        current.duration = duration
+        SPAN_DURATION.observe(duration, span = name, status = status)
+        collector = _collector.get()
+        if collector is not None:
+            collector.append(current)
+        logger.info("Span completed", extra = {
+            'turn_id': current.turn_id,
+            'span': name,
+            'status': status,
+            'duration_ms': round(duration * 1000, 1),
+            **current.attributes
+        })
+
+async def bind_turn_stream(turn_id: str, stream: AsyncIterator[T]) -> AsyncIterator[T]:
+    # Frameworks may resume a generator from different tasks, so the turn id is bound
+    # around every step instead of once for the whole stream
+    try:
+        while True:
+            with bind_turn(turn_id):
+                try:
+                    item = await stream.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        with bind_turn(turn_id):
+            await stream.aclose()
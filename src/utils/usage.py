@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Self
+from utils.metrics import LLM_COST
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# USD per million prompt and completion tokens, matched by model name prefix
+_DEFAULT_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gemini-2.0-flash": (0.10, 0.40)
+}
+
+@dataclass
+class Usage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    calls: int = 0
+
+    @property
+    def total_tokens(self: Self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self: Self, prompt_tokens: int, completion_tokens: int, cost: float):
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost += cost
+        self.calls += 1
+
+    def to_dict(self: Self) -> dict:
+        return {**asdict(self), 'total_tokens': self.total_tokens, 'cost': round(self.cost, 6)}
+
+class ModelPrices:
+    """Prices of the models in USD per million tokens, used to turn reported usage into cost"""
+
+    def __init__(self: Self, prices: dict[str, tuple[float, float]] | None = None):
+        # Longest prefixes first, so "gpt-4o-mini" is not priced as "gpt-4o"
+        self._prices = sorted((prices or _DEFAULT_PRICES).items(), key = lambda item: len(item[0]), reverse = True)
+
+    def cost(self: Self, model: str | None, prompt_tokens: int, completion_tokens: int) -> float:
+        for prefix, (prompt_price, completion_price) in self._prices:
+            if model and model.startswith(prefix):
+                return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+        return 0.0
+
+    @classmethod
+    def from_config(cls, spec: str) -> Self:
+        # "model=prompt/completion,..." overrides or extends the default prices
+        prices = dict(_DEFAULT_PRICES)
+        for entry in filter(None, (part.strip() for part in spec.split(","))):
+            try:
+                model, price = entry.split("=")
+                prompt_price, completion_price = price.split("/")
+                prices[model.strip()] = (float(prompt_price), float(completion_price))
+            except ValueError:
+                raise ValueError(f"Invalid model price: {entry}")
+        return cls(prices)
+
+class UsageTracker:
+    """Token usage and cost reported by the providers, totalled per turn, per session and for the process"""
+
+    def __init__(self: Self, prices: ModelPrices | None = None, max_sessions: int = 4096):
+        self._prices = prices or ModelPrices()
+        self._max_sessions = max_sessions
+        self._total = Usage()
+        self._turns: dict[str, tuple[Usage, str | None]] = {}
+        self._sessions: OrderedDict[str, Usage] = OrderedDict()
+        self._turn_count = 0
+        self._lock = threading.Lock()
+        logger.info("UsageTracker initialized", extra = {'max_sessions': max_sessions})
+
+    def start_turn(self: Self, turn_id: str, session_id: str | None) -> Usage:
+        usage = Usage()
+        with self._lock:
+            self._turns[turn_id] = (usage, session_id)
+            self._turn_count += 1
+        return usage
+
+    def finish_turn(self: Self, turn_id: str) -> Usage | None:
+        with self._lock:
+            entry = self._turns.pop(turn_id, None)
+        return entry[0] if entry is not None else None
+
+    def record(self: Self, turn_id: str | None, model: str | None, usage: any):
+        # Called for every completion through the span usage listener; completions outside a
+        # turn, such as background audits that outlive it, only count towards the process total
+        prompt_tokens = usage.prompt_tokens or 0
+        completion_tokens = usage.completion_tokens or 0
+        cost = self._prices.cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            self._total.add(prompt_tokens, completion_tokens, cost)
+            entry = self._turns.get(turn_id) if turn_id is not None else None
+            if entry is not None:
+                turn_usage, session_id = entry
+                turn_usage.add(prompt_tokens, completion_tokens, cost)
+                if session_id is not None:
+                    self._session(session_id).add(prompt_tokens, completion_tokens, cost)
+        LLM_COST.inc(cost, model = model or "unknown")
+
+    def session_usage(self: Self, session_id: str | None) -> Usage:
+        if session_id is None:
+            return Usage()
+        with self._lock:
+            usage = self._sessions.get(session_id)
+            return Usage(**asdict(usage)) if usage is not None else Usage()
+
+    def stats(self: Self, top: int = 10) -> dict:
+        # The most expensive sessions show which conversation patterns drive the bill
+        with self._lock:
+            sessions = sorted(self._sessions.items(), key = lambda item: item[1].cost, reverse = True)[:top]
+            return {
+                'total': self._total.to_dict(),
+                'turns': self._turn_count,
+                'sessions': len(self._sessions),
+                'top_sessions': [{'session_id': session_id, **usage.to_dict()} for session_id, usage in sessions]
+            }
+
+    def _session(self: Self, session_id: str) -> Usage:
+        usage = self._sessions.get(session_id)
+        if usage is None:
+            usage = self._sessions[session_id] = Usage()
+            while len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last = False)
+        self._sessions.move_to_end(session_id)
+        return usage
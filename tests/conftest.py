@@ -0,0 +1,6 @@
+from pathlib import Path
+
+import sys
+
+# The application modules are imported from src/, the way the entry points run them
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+from agents.agent_pool import AgentPool
+from profiles.profile_catalog import ProfileCatalogError, ProfileSource, UnknownProfileError
+
+import asyncio
+import pytest
+
+class FakeCatalog:
+
+    def __init__(self, keys: list[str], unreadable: set[str] | None = None):
+        self._keys = keys
+        self._unreadable = unreadable or set()
+
+    def paths(self, key: str) -> list[str]:
+        if key not in self._keys:
+            raise UnknownProfileError(f"Unknown profile: {key}")
+        return [f"{key}/name.txt", f"{key}/profile.md"]
+
+    def load(self, key: str) -> ProfileSource:
+        paths = self.paths(key)
+        if key in self._unreadable:
+            raise ProfileCatalogError(f"Failed to read profile {key}")
+        return ProfileSource(key, key.title(), f"# {key}", key, paths, [])
+
+def build_agent(source: ProfileSource) -> SimpleNamespace:
+    return SimpleNamespace(name = source.name, memory_estimate = lambda: 100)
+
+def test_built_agent_is_reused_and_its_lock_released():
+    pool = AgentPool(FakeCatalog(["jane"]), build_agent)
+
+    agent = asyncio.run(pool.get("jane"))
+    assert asyncio.run(pool.get("jane")) is agent
+    assert pool.stats() == {'hits': 1, 'builds': 1, 'evictions': 0, 'reloads': 0, 'size': 1, 'memory_bytes': 100}
+    assert pool._build_locks == {}
+
+def test_unknown_key_never_takes_a_build_lock():
+    pool = AgentPool(FakeCatalog(["jane"]), build_agent)
+
+    for key in ("john", "../etc", "x" * 64):
+        with pytest.raises(UnknownProfileError):
+            asyncio.run(pool.get(key))
+    assert pool._build_locks == {}
+
+def test_failed_builds_release_their_lock():
+    def failing_build(source: ProfileSource):
+        raise RuntimeError("index failed")
+
+    pool = AgentPool(FakeCatalog(["jane", "john"], unreadable = {"john"}), failing_build)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(pool.get("jane"))
+    with pytest.raises(ProfileCatalogError):
+        asyncio.run(pool.get("john"))
+    assert pool._build_locks == {}
+    assert pool.stats()['size'] == 0
@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+from agents.chat_agent import ChatAgent
+from models.evaluation import Evaluation
+from tools.tool_registry import ToolRegistry
+from utils.tracing import collect_spans
+
+import asyncio
+
+def chat_router(contents: list[str | None]) -> SimpleNamespace:
+    # Answers every request with one choice per content, the way n candidates come back
+    async def create(**kwargs):
+        choices = [SimpleNamespace(index = index, finish_reason = "stop", message = SimpleNamespace(content = content)) for index, content in enumerate(contents)]
+        return SimpleNamespace(choices = choices, usage = None, model = "chat")
+
+    return SimpleNamespace(model = "chat", chat = SimpleNamespace(completions = SimpleNamespace(create = create)), stats = lambda: {})
+
+def stream_router(contents: list[str | None]) -> SimpleNamespace:
+    async def create(**kwargs):
+        async def stream():
+            for index, content in enumerate(contents):
+                delta = SimpleNamespace(content = content, tool_calls = None)
+                yield SimpleNamespace(choices = [SimpleNamespace(index = index, delta = delta)], usage = None, model = "chat")
+        return stream()
+
+    return SimpleNamespace(model = "chat", chat = SimpleNamespace(completions = SimpleNamespace(create = create)), stats = lambda: {})
+
+def evaluator_router(calls: list[str], fail_grading: bool = False) -> SimpleNamespace:
+    # Single evaluations accept the reply; grading either fails or prefers the second candidate
+    async def parse(**kwargs):
+        response_format = kwargs['response_format']
+        if response_format is Evaluation:
+            calls.append("run")
+            parsed = Evaluation(is_acceptable = True, feedback = "Accurate and professional")
+        else:
+            calls.append("grade")
+            if fail_grading:
+                raise RuntimeError("Malformed grades")
+            count = kwargs['messages'][-1]['content'].count("### Candidate ")
+            parsed = response_format(evaluations = [Evaluation(is_acceptable = True, feedback = "Fine")] * count, best_candidate = 2)
+        return SimpleNamespace(choices = [SimpleNamespace(message = SimpleNamespace(parsed = parsed))], usage = None, model = "evaluator")
+
+    return SimpleNamespace(model = "evaluator", beta = SimpleNamespace(chat = SimpleNamespace(completions = SimpleNamespace(parse = parse))), stats = lambda: {})
+
+def create_agent(router: SimpleNamespace, calls: list[str], fail_grading: bool = False) -> ChatAgent:
+    return ChatAgent(
+        "Jane Doe",
+        "# Experience\nBackend engineer",
+        router = router,
+        evaluator_router = evaluator_router(calls, fail_grading),
+        tool_registry = ToolRegistry([]),
+        candidates = 3
+    )
+
+def chat(agent: ChatAgent, message: str) -> tuple[str, dict]:
+    with collect_spans() as spans:
+        reply = asyncio.run(agent.achat(message, []))
+    return reply, next(span for span in spans if span.name == "chat.turn").attributes
+
+def stream_chat(agent: ChatAgent, message: str) -> list[str]:
+    async def consume():
+        return [reply async for reply in agent.astream_chat(message, [])]
+
+    return asyncio.run(consume())
+
+def test_graded_candidate_is_returned():
+    calls = []
+    agent = create_agent(chat_router(["First", "Second", "Third"]), calls)
+
+    reply, attributes = chat(agent, "What do you do?")
+    assert reply == "Second"
+    assert calls == ["grade"]
+    assert attributes['chosen_candidate'] == 1
+
+def test_failed_grading_falls_back_to_evaluating_the_first_candidate():
+    calls = []
+    agent = create_agent(chat_router(["First", "Second", "Third"]), calls, fail_grading = True)
+
+    reply, attributes = chat(agent, "What do you do?")
+    assert reply == "First"
+    assert calls == ["grade", "run"]
+    assert attributes['grading_failed'] is True
+    assert attributes['verdict'] == "accepted"
+
+def test_empty_candidates_are_not_graded():
+    calls = []
+    agent = create_agent(chat_router(["", "Second", None]), calls)
+
+    # A single candidate with text is evaluated on its own
+    reply, _ = chat(agent, "What do you do?")
+    assert reply == "Second"
+    assert calls == ["run"]
+
+def test_empty_streamed_draft_sends_the_chosen_candidate():
+    calls = []
+    agent = create_agent(stream_router(["", "Second", "Third"]), calls)
+
+    assert stream_chat(agent, "What do you do?") == ["Third"]
+    assert calls == ["grade"]
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+from llm.router import ModelRouter, Route
+from utils import tracing
+
+import asyncio
+
+def completion_client(latencies: list[float], calls: list[float]) -> SimpleNamespace:
+    # Each call answers after the next latency in the list, with usage the caller can tell apart
+    async def create(**kwargs):
+        latency = latencies[len(calls)]
+        calls.append(latency)
+        await asyncio.sleep(latency)
+        usage = SimpleNamespace(prompt_tokens = 100, completion_tokens = 10 * len(calls))
+        return SimpleNamespace(model = kwargs['model'], usage = usage, latency = latency)
+
+    return SimpleNamespace(chat = SimpleNamespace(completions = SimpleNamespace(create = create)))
+
+def hedging_router(client: SimpleNamespace) -> ModelRouter:
+    router = ModelRouter("test", [Route("openai", client, "gpt-4o-mini")], hedge = True, hedge_budget = 1.0, hedge_min_delay = 0.01, min_samples = 1)
+    # A recorded sample sets the hedging threshold to the minimum delay
+    router._latencies["completion"].record(0.0)
+    return router
+
+def test_finished_hedge_loser_is_accounted(monkeypatch):
+    reported = []
+    monkeypatch.setattr(tracing, "_usage_listeners", [lambda turn_id, model, usage: reported.append((turn_id, model, usage))])
+    calls = []
+    router = hedging_router(completion_client([0.0, 0.0], calls))
+
+    async def run():
+        gate = asyncio.Event()
+
+        # Both attempts are held until the hedge has started, so they finish together
+        async def request(route):
+            response = await route.client.chat.completions.create(model = route.model)
+            await gate.wait()
+            return response
+
+        async def open_gate():
+            await asyncio.sleep(0.05)
+            gate.set()
+
+        opener = asyncio.create_task(open_gate())
+        with tracing.bind_turn("turn-1"):
+            result = await router._route("completion", request)
+        await opener
+        return result
+
+    result = asyncio.run(run())
+    stats = router.stats()
+    assert len(calls) == 2
+    assert stats['hedges'] == 1
+    assert stats['discarded'] == 1
+    assert len(reported) == 1
+    turn_id, model, usage = reported[0]
+    assert (turn_id, model) == ("turn-1", "gpt-4o-mini")
+    assert usage is not result.usage
+    assert stats['discarded_tokens'] == usage.prompt_tokens + usage.completion_tokens
+
+def test_cancelled_hedge_loser_is_counted():
+    calls = []
+    router = hedging_router(completion_client([0.5, 0.0], calls))
+
+    result = asyncio.run(router.chat.completions.create(model = "gpt-4o-mini", messages = []))
+    stats = router.stats()
+    assert result.latency == 0.0
+    assert stats['hedge_wins'] == 1
+    assert stats['cancelled'] == 1
+    assert stats['discarded'] == 0
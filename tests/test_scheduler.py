@@ -0,0 +1,194 @@
+from types import SimpleNamespace
+from openai import RateLimitError
+from llm import scheduler as scheduler_module
+from llm.scheduler import ProviderLimits, RequestScheduler, SchedulerOverloadedError, TokenBucket
+
+import asyncio
+import httpx
+import pytest
+
+class FakeClock:
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+def rate_limit_error(headers: dict) -> RateLimitError:
+    request = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+    response = httpx.Response(429, headers = headers, request = request)
+    return RateLimitError("Rate limit reached", response = response, body = None)
+
+def create_scheduler(**limits) -> RequestScheduler:
+    options = {key: limits.pop(key) for key in ("max_queue", "queue_timeout", "max_retries", "base_delay", "max_delay") if key in limits}
+    return RequestScheduler({"openai": ProviderLimits(**limits)}, **options)
+
+def test_token_bucket_reserves_until_empty_then_reports_wait(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler_module.time, "monotonic", clock)
+    bucket = TokenBucket(60)
+
+    assert bucket.reserve(60) == 0.0
+    # One token per second refills, so the next token is a second away
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    assert bucket.reserve(1) == pytest.approx(2.0)
+
+    clock.now += 2
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+def test_token_bucket_refund_and_caps(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler_module.time, "monotonic", clock)
+    bucket = TokenBucket(60)
+
+    bucket.reserve(60)
+    bucket.refund(30)
+    assert bucket.reserve(30) == 0.0
+
+    # A request larger than the bucket only waits for a full bucket
+    clock.now += 3600
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+
+def test_token_bucket_without_limit_never_waits():
+    bucket = TokenBucket(0)
+    assert bucket.reserve(10 ** 9) == 0.0
+
+def test_slot_is_shed_when_queue_deadline_passes():
+    scheduler = create_scheduler(max_concurrency = 1, queue_timeout = 0.05)
+
+    async def run():
+        async with scheduler.slot("openai", 10):
+            with pytest.raises(SchedulerOverloadedError, match = "deadline"):
+                async with scheduler.slot("openai", 10):
+                    pass
+        # The slot is free again once the holder leaves
+        async with scheduler.slot("openai", 10):
+            pass
+
+    asyncio.run(run())
+
+def test_slot_is_shed_when_queue_is_full():
+    scheduler = create_scheduler(max_concurrency = 1, max_queue = 1, queue_timeout = 5)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot("openai", 10):
+                await release.wait()
+
+        async def wait():
+            async with scheduler.slot("openai", 10):
+                return True
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(wait())
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(SchedulerOverloadedError, match = "queue_full"):
+            async with scheduler.slot("openai", 10):
+                pass
+
+        release.set()
+        await holder
+        assert await waiter
+
+    asyncio.run(run())
+
+def test_slot_is_shed_when_rate_budget_outlasts_deadline():
+    scheduler = create_scheduler(requests_per_minute = 1, queue_timeout = 1)
+
+    async def run():
+        async with scheduler.slot("openai", 10):
+            pass
+        with pytest.raises(SchedulerOverloadedError, match = "rate_limit"):
+            async with scheduler.slot("openai", 10):
+                pass
+
+    asyncio.run(run())
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after": "2"}, 2.0),
+    ({"retry-after-ms": "250"}, 0.25),
+    ({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0.0),
+    ({"retry-after": "60"}, None)
+])
+def test_retry_delay_honors_retry_after(headers: dict, expected: float | None):
+    scheduler = create_scheduler(max_delay = 20)
+    delay = scheduler._get_retry_delay(rate_limit_error(headers), 0)
+    assert delay == (pytest.approx(expected) if expected is not None else None)
+
+def test_retry_delay_without_header_is_jittered_backoff():
+    scheduler = create_scheduler(base_delay = 0.5, max_delay = 20)
+    for attempt in range(4):
+        assert 0 <= scheduler._get_retry_delay(rate_limit_error({}), attempt) <= 0.5 * 2 ** attempt
+
+def test_retry_waits_for_retry_after_then_succeeds(monkeypatch):
+    scheduler = create_scheduler(max_retries = 2)
+    delays = []
+    calls = []
+
+    async def sleep(delay: float):
+        delays.append(delay)
+
+    async def request():
+        calls.append(1)
+        if len(calls) == 1:
+            raise rate_limit_error({"retry-after": "3"})
+        return "ok"
+
+    monkeypatch.setattr(scheduler_module.asyncio, "sleep", sleep)
+    assert asyncio.run(scheduler.retry("openai", request, 10)) == "ok"
+    assert len(calls) == 2
+    assert delays[0] == 3.0
+
+def test_retry_gives_up_when_retry_after_exceeds_cap():
+    scheduler = create_scheduler(max_retries = 3, max_delay = 1)
+    calls = []
+
+    async def request():
+        calls.append(1)
+        raise rate_limit_error({"retry-after": "30"})
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(scheduler.retry("openai", request, 10))
+    assert len(calls) == 1
+
+def test_scheduled_stream_is_closed_and_releases_slot_when_consumer_stops_early():
+    scheduler = create_scheduler(max_concurrency = 1, queue_timeout = 0.05)
+
+    class FakeStream:
+
+        def __init__(self):
+            self.closed = False
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            return "chunk"
+
+        async def close(self):
+            self.closed = True
+
+    stream = FakeStream()
+
+    async def create(**kwargs):
+        return stream
+
+    client = scheduler.wrap("openai", SimpleNamespace(chat = SimpleNamespace(completions = SimpleNamespace(create = create))))
+
+    async def run():
+        chunks = await client.chat.completions.create(model = "gpt-4o-mini", messages = [], stream = True)
+        async for _ in chunks:
+            break
+        await chunks.aclose()
+        assert stream.closed
+        # The concurrency slot is free for the next request
+        async with scheduler.slot("openai", 10):
+            pass
+
+    asyncio.run(run())
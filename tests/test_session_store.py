@@ -0,0 +1,59 @@
+from storage import session_store as session_store_module
+from storage.session_store import SessionStore
+
+class FakeClock:
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+def exchange(question: str, answer: str) -> list[dict]:
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+def test_idle_sessions_are_evicted(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(session_store_module.time, "time", clock)
+    store = SessionStore(idle_ttl_seconds = 60)
+
+    store.sync("idle", exchange("Hi", "Hello"))
+    clock.now += 61
+    store.sync("new", [])
+
+    assert store.stats()['size'] == 1
+    assert store.stats()['evictions'] == 1
+    # The evicted session starts over from the history the client sends
+    assert store.sync("idle", None).messages == []
+
+def test_recently_synced_session_outlives_newer_idle_ones(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(session_store_module.time, "time", clock)
+    store = SessionStore(idle_ttl_seconds = 60)
+
+    active = store.sync("active", [])
+    store.sync("idle", [])
+    clock.now += 40
+    store.record_turn(active, "Hi", "Hello")
+    store.sync("active", exchange("Hi", "Hello"))
+    clock.now += 40
+    store.sync("other", [])
+
+    # The oldest session was used most recently, so only the idle one behind it goes
+    assert store.stats()['evictions'] == 1
+    assert store.stats()['size'] == 2
+    assert store.sync("active", None).messages == exchange("Hi", "Hello")
+
+def test_least_recently_used_session_is_evicted_at_capacity():
+    store = SessionStore(max_sessions = 2)
+
+    store.record_turn(store.sync("first", []), "Hi", "Hello")
+    store.sync("second", [])
+    store.sync("first", exchange("Hi", "Hello"))
+    store.sync("third", [])
+
+    # Using the first session again made the second one the least recently used
+    assert store.stats()['evictions'] == 1
+    assert store.stats()['size'] == 2
+    assert store.sync("first", None).messages == exchange("Hi", "Hello")
+    assert store.stats()['evictions'] == 1
@@ -0,0 +1,38 @@
+from agents.usage_budget import BudgetLevel, UsageBudget
+from utils.usage import Usage
+
+import pytest
+
+@pytest.mark.parametrize("tokens, level", [
+    (0, BudgetLevel.NORMAL),
+    (499, BudgetLevel.NORMAL),
+    (500, BudgetLevel.FEWER_REEVALUATIONS),
+    (700, BudgetLevel.SHORTER_HISTORY),
+    (850, BudgetLevel.SKIP_EVALUATION),
+    (999, BudgetLevel.SKIP_EVALUATION),
+    (1000, BudgetLevel.CUTOFF)
+])
+def test_token_budget_levels(tokens: int, level: BudgetLevel):
+    budget = UsageBudget(max_tokens = 1000)
+    assert budget.level(Usage(prompt_tokens = tokens)) == level
+
+def test_the_limit_spent_furthest_decides():
+    budget = UsageBudget(max_tokens = 1000, max_cost = 0.01)
+
+    assert budget.level(Usage(prompt_tokens = 100, cost = 0.0075)) == BudgetLevel.SHORTER_HISTORY
+    assert budget.level(Usage(prompt_tokens = 900, cost = 0.001)) == BudgetLevel.SKIP_EVALUATION
+
+def test_budget_without_limits_stays_normal():
+    assert UsageBudget().level(Usage(prompt_tokens = 10 ** 9, cost = 10 ** 6)) == BudgetLevel.NORMAL
+
+def test_configured_thresholds():
+    budget = UsageBudget.from_config(1000, 0.0, "0.2,0.4,0.6", 1, 2)
+
+    assert budget.level(Usage(completion_tokens = 200)) == BudgetLevel.FEWER_REEVALUATIONS
+    assert budget.level(Usage(completion_tokens = 400)) == BudgetLevel.SHORTER_HISTORY
+    assert budget.level(Usage(completion_tokens = 600)) == BudgetLevel.SKIP_EVALUATION
+
+@pytest.mark.parametrize("thresholds", ["0.5,0.7", "0.7,0.5,0.85", "0,0.5,0.7", "0.5,0.7,1.5", "half,0.7,0.85"])
+def test_invalid_thresholds_are_rejected(thresholds: str):
+    with pytest.raises(ValueError):
+        UsageBudget.from_config(1000, 0.0, thresholds, 1, 2)